@@ -0,0 +1 @@
+"""Offline benchmarks: synthetic source fixtures replayed without the network."""
@@ -0,0 +1,254 @@
+"""Synthetic captures of every source's pages and API payloads.
+
+Each builder lays out a listing of tracked coins mixed with untracked filler
+rows, the way the real sites list them, and returns a :class:`Site`: the
+table rows and JSON responses every page URL serves, plus the raw JSON
+documents of API-only sources. Fixtures are generated from a fixed seed, so
+the same ``FIXTURE_VERSION`` always yields the same bytes and runs of
+different commits see identical input. Bump the version whenever a builder
+changes.
+"""
+from __future__ import annotations
+
+import json
+import math
+import random
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from scrapers import binance, coindesk, coingecko, coinmarketcap, kraken, yahoo
+from scrapers.coins import COINS, CoinConfig
+from scrapers.table import TableSnapshot
+
+FIXTURE_VERSION = 1
+COIN_COUNTS = (7, 100, 1000)
+# Every listing shows at least this many rows, tracked or not.
+LISTING_ROWS = 100
+SEED = 20240102
+EUR_PER_USD = 0.92
+
+Listing = List[Tuple[CoinConfig, float]]
+
+
+@dataclass(frozen=True)
+class PageState:
+    """What a page shows in one state: its table and the JSON it fetches."""
+
+    rows: TableSnapshot
+    responses: Dict[str, object] = field(default_factory=dict)
+
+
+@dataclass
+class Site:
+    """Everything one source serves for one set of tracked coins.
+
+    ``pages`` maps a URL to its states; ``""`` is the state right after
+    loading, any other state is entered by picking the option of that name
+    (Kraken's currency selector). ``documents`` are JSON bodies fetched
+    directly rather than by a page.
+    """
+
+    source: str
+    coins: List[CoinConfig]
+    pages: Dict[str, Dict[str, PageState]] = field(default_factory=dict)
+    documents: Dict[str, object] = field(default_factory=dict)
+
+    @property
+    def rows(self) -> int:
+        """Rows read across every page and state; per-row timings divide by this."""
+        rows = sum(
+            len(state.rows)
+            for states in self.pages.values()
+            for name, state in states.items()
+            # A page with options is only read after one is picked.
+            if name or len(states) == 1
+        )
+        documents = self.documents.values()
+        return rows or max((len(document["data"]) for document in documents), default=0)
+
+
+def synthetic_coins(count: int) -> List[CoinConfig]:
+    """The real tracked coins, topped up with made-up ones to ``count``."""
+    coins = list(COINS[:count])
+    for number in range(len(coins), count):
+        coins.append(CoinConfig(f"coin-{number:04d}", f"Coin {number:04d}", f"C{number:04d}"))
+    return coins
+
+
+def filler_coin(number: int) -> CoinConfig:
+    return CoinConfig(f"filler-{number:04d}", f"Filler {number:04d}", f"F{number:04d}")
+
+
+def build_listing(coins: Sequence[CoinConfig], rng: random.Random) -> Listing:
+    """Tracked coins scattered among filler rows, each with a USD price."""
+    total = max(len(coins), LISTING_ROWS)
+    listed = list(coins) + [filler_coin(number) for number in range(total - len(coins))]
+    rng.shuffle(listed)
+    return [(coin, round(10 ** rng.uniform(-2, 5), 2)) for coin in listed]
+
+
+def money(price: float, symbol: str = "$") -> str:
+    return f"{symbol}{price:,.2f}"
+
+
+def chunks(listing: Listing, size: int) -> List[Listing]:
+    return [listing[start : start + size] for start in range(0, len(listing), size)]
+
+
+def coingecko_site(coins: List[CoinConfig], listing: Listing) -> Site:
+    rows = [
+        ["", str(rank), f"{coin.name}\n{coin.symbol}", "Buy", money(price), "1.2%"]
+        for rank, (coin, price) in enumerate(listing, 1)
+    ]
+    payload = [
+        {"name": coin.name, "symbol": coin.symbol.lower(), "current_price": price}
+        for coin, price in listing
+    ]
+    api_url = "https://www.coingecko.com/api/bench/markets.json"
+    return Site(
+        "coingecko", coins, pages={coingecko.HOME_URL: {"": PageState(rows, {api_url: payload})}}
+    )
+
+
+def coinmarketcap_site(coins: List[CoinConfig], listing: Listing) -> Site:
+    rows = [
+        ["", str(rank), f"{coin.name}\n{coin.symbol}", money(price), "0.5%"]
+        for rank, (coin, price) in enumerate(listing, 1)
+    ]
+    payload = {
+        "data": {
+            "cryptoCurrencyList": [
+                {
+                    "name": coin.name,
+                    "symbol": coin.symbol,
+                    "quotes": [{"name": "USD", "price": price}],
+                }
+                for coin, price in listing
+            ]
+        }
+    }
+    api_url = "https://coinmarketcap.com/api/bench/listing.json"
+    return Site(
+        "coinmarketcap",
+        coins,
+        pages={coinmarketcap.HOME_URL: {"": PageState(rows, {api_url: payload})}},
+    )
+
+
+def coindesk_site(coins: List[CoinConfig], listing: Listing) -> Site:
+    # The scraper stops after MAX_PAGES, so big listings get longer pages.
+    size = max(LISTING_ROWS, math.ceil(len(listing) / coindesk.MAX_PAGES))
+    site = Site("coindesk", coins)
+    for number, chunk in enumerate(chunks(listing, size), 1):
+        url = coindesk.HOME_URL if number == 1 else f"{coindesk.HOME_URL}?page={number}"
+        rows = [
+            [str(rank), f"{coin.name}\n{coin.symbol}", coin.symbol, money(price)]
+            for rank, (coin, price) in enumerate(chunk, (number - 1) * size + 1)
+        ]
+        payload = {
+            "data": [
+                {"name": coin.name, "symbol": coin.symbol, "price": price} for coin, price in chunk
+            ]
+        }
+        api_url = f"https://www.coindesk.com/api/bench/prices-{number}.json"
+        site.pages[url] = {"": PageState(rows, {api_url: payload})}
+    return site
+
+
+def kraken_site(coins: List[CoinConfig], listing: Listing) -> Site:
+    states: Dict[str, PageState] = {}
+    for currency in kraken.CURRENCIES:
+        rate = EUR_PER_USD if currency == "EUR" else 1.0
+        symbol = kraken.CURRENCY_SYMBOLS[currency]
+        priced = [(coin, round(price * rate, 2)) for coin, price in listing]
+        rows = [
+            [str(rank), f"{coin.name}\n{coin.symbol}", money(price, symbol), "+0.4%"]
+            for rank, (coin, price) in enumerate(priced, 1)
+        ]
+        payload = {
+            "result": [
+                {
+                    "name": coin.name,
+                    "symbol": coin.symbol,
+                    "price": f"{price:.2f}",
+                    "currency": currency,
+                }
+                for coin, price in priced
+            ]
+        }
+        states[currency] = PageState(
+            rows, {f"https://www.kraken.com/api/bench/prices-{currency}.json": payload}
+        )
+    # The page loads in USD, without fetching prices until a currency is picked.
+    states[""] = PageState(states["USD"].rows)
+    return Site("kraken", coins, pages={kraken.HOME_URL: states})
+
+
+def yahoo_site(coins: List[CoinConfig], listing: Listing) -> Site:
+    site = Site("yahoo", coins)
+    for number, chunk in enumerate(chunks(listing, yahoo.PAGE_SIZE)):
+        start = number * yahoo.PAGE_SIZE
+        rows = [
+            [f"{coin.symbol}-USD", f"{coin.name} USD", "", f"{price:,.2f}", "+1.05%"]
+            for coin, price in chunk
+        ]
+        payload = {
+            "finance": {
+                "result": [
+                    {
+                        "quotes": [
+                            {
+                                "symbol": f"{coin.symbol}-USD",
+                                "shortName": f"{coin.name} USD",
+                                "regularMarketPrice": {"raw": price, "fmt": f"{price:,.2f}"},
+                            }
+                            for coin, price in chunk
+                        ]
+                    }
+                ]
+            }
+        }
+        api_url = f"https://finance.yahoo.com/api/bench/screener-{start}.json"
+        site.pages[yahoo.yahoo_url(start=start)] = {"": PageState(rows, {api_url: payload})}
+    return site
+
+
+def binance_site(coins: List[CoinConfig], listing: Listing) -> Site:
+    static_data = []
+    dynamic_data = []
+    for coin, price in listing:
+        # Binance lists every base against several quotes; only USDT is read.
+        for quote, rate in (("USDT", 1.0), ("BTC", 1 / 40000), ("EUR", EUR_PER_USD)):
+            pair = f"{coin.symbol}{quote}"
+            static_data.append({"s": pair, "b": coin.symbol, "q": quote})
+            dynamic_data.append({"s": pair, "c": f"{price * rate:.8f}"})
+    return Site(
+        "binance",
+        coins,
+        documents={
+            binance.STATIC_URL: {"data": static_data},
+            binance.DYNAMIC_URL: {"data": dynamic_data},
+        },
+    )
+
+
+SITE_BUILDERS: Dict[str, Callable[[List[CoinConfig], Listing], Site]] = {
+    "coingecko": coingecko_site,
+    "kraken": kraken_site,
+    "yahoo": yahoo_site,
+    "binance": binance_site,
+    "coinmarketcap": coinmarketcap_site,
+    "coindesk": coindesk_site,
+}
+
+
+def build_site(source: str, coin_count: int) -> Site:
+    """The fixture of ``source`` tracking ``coin_count`` coins."""
+    # Seeded per source and size so every fixture is independent of the others.
+    rng = random.Random(f"{SEED}:{source}:{coin_count}")
+    coins = synthetic_coins(coin_count)
+    return SITE_BUILDERS[source](coins, build_listing(coins, rng))
+
+
+def encode_json(payload: object) -> bytes:
+    return json.dumps(payload, separators=(",", ":")).encode()
@@ -0,0 +1,308 @@
+"""Serve :mod:`benchmarks.fixtures` to the unmodified scrapers.
+
+:class:`ReplayPool` hands out in-process pages that answer the handful of
+Playwright calls the scrapers make straight from the fixtures. It needs no
+browser, so timings cover only the code in this repository and are stable
+enough to compare between commits. :class:`RoutedPool` is a real
+:class:`~scrapers.browser.BrowserPool` whose contexts fulfil every request
+from the same fixtures through ``context.route``, for end-to-end numbers that
+include Chromium. Binance talks to its API directly, so
+:func:`serve_documents` runs a local HTTP stand-in and points the scraper at
+it.
+"""
+from __future__ import annotations
+
+import json
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from types import ModuleType
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from playwright.sync_api import TimeoutError
+
+from benchmarks.fixtures import PageState, Site, encode_json
+from scrapers.browser import BrowserPool
+
+JSON_TYPE = "application/json"
+HTML_TYPE = "text/html; charset=utf-8"
+CURRENCY_BUTTON = "currency-selector-button"
+OPTION_SELECTOR = "[role='option']"
+
+
+def page_states(sites: Iterable[Site]) -> Dict[str, Dict[str, PageState]]:
+    pages: Dict[str, Dict[str, PageState]] = {}
+    for site in sites:
+        pages.update(site.pages)
+    return pages
+
+
+class ReplayResponse:
+    def __init__(self, url: str, payload: object) -> None:
+        self.url = url
+        self.headers = {"content-type": JSON_TYPE}
+        self._payload = payload
+
+    def json(self) -> object:
+        # A fresh copy, as if it had just come over the wire.
+        return json.loads(encode_json(self._payload))
+
+
+class ReplayLocator:
+    def __init__(self, page: "ReplayPage", selector: str, text: Optional[str] = None) -> None:
+        self._page = page
+        self._selector = selector
+        self._text = text
+
+    def _options(self) -> List[str]:
+        return [
+            name
+            for name in self._page.states
+            if name and (self._text is None or self._text in name)
+        ]
+
+    def count(self) -> int:
+        if OPTION_SELECTOR in self._selector:
+            return len(self._options())
+        if CURRENCY_BUTTON in self._selector:
+            return int(any(self._page.states))
+        return 0
+
+    @property
+    def first(self) -> "ReplayLocator":
+        return self
+
+    def filter(self, has_text: Optional[str] = None) -> "ReplayLocator":
+        return ReplayLocator(self._page, self._selector, has_text)
+
+    def click(self) -> None:
+        if OPTION_SELECTOR in self._selector:
+            self._page.show(self._options()[0])
+
+
+class ReplayPage:
+    """Just enough of a Playwright page to run a scraper against fixtures."""
+
+    def __init__(self, pages: Dict[str, Dict[str, PageState]]) -> None:
+        self._pages = pages
+        self._listeners: List = []
+        self.url = "about:blank"
+        self.states: Dict[str, PageState] = {}
+        self._state = PageState([])
+        self._responses = {
+            url: payload
+            for states in pages.values()
+            for state in states.values()
+            for url, payload in state.responses.items()
+        }
+
+    def on(self, event: str, handler) -> None:
+        if event == "response":
+            self._listeners.append(handler)
+
+    def remove_listener(self, event: str, handler) -> None:
+        if event == "response" and handler in self._listeners:
+            self._listeners.remove(handler)
+
+    def goto(self, url: str, wait_until: Optional[str] = None, timeout: Optional[float] = None):
+        if url not in self._pages:
+            raise RuntimeError(f"No fixture for {url}")
+        self.url = url
+        self.states = self._pages[url]
+        self.show("")
+
+    def show(self, name: str) -> None:
+        self._state = self.states[name]
+        for url, payload in self._state.responses.items():
+            for listener in list(self._listeners):
+                listener(ReplayResponse(url, payload))
+
+    def wait_for_load_state(self, state: str = "load", timeout: Optional[float] = None) -> None:
+        return None
+
+    def wait_for_selector(self, selector: str, timeout: Optional[float] = None) -> None:
+        if not self._state.rows:
+            raise TimeoutError(f"Timeout {timeout}ms exceeded waiting for {selector}")
+
+    def wait_for_function(self, script: str, arg=None, timeout: Optional[float] = None) -> None:
+        return None
+
+    def wait_for_url(self, url, timeout: Optional[float] = None) -> None:
+        return None
+
+    def evaluate(self, script: str, arg=None) -> object:
+        # Scrapers only evaluate scripts that fetch JSON, with the URL as arg.
+        payload = self._responses.get(arg)
+        if payload is None:
+            return None
+        return json.loads(encode_json(payload))
+
+    def eval_on_selector_all(self, selector: str, script: str) -> List[List[str]]:
+        return [list(cells) for cells in self._state.rows]
+
+    def locator(self, selector: str) -> ReplayLocator:
+        return ReplayLocator(self, selector)
+
+    def close(self) -> None:
+        self._listeners.clear()
+
+
+class ReplayPool:
+    """Stands in for :class:`~scrapers.browser.BrowserPool`, one page per source."""
+
+    def __init__(self, sites: Iterable[Site]) -> None:
+        self._pages = page_states(sites)
+        self._idle: Dict[str, ReplayPage] = {}
+
+    @contextmanager
+    def page(self, source: str, init_script: Optional[str] = None) -> Iterator[ReplayPage]:
+        page = self._idle.pop(source, None) or ReplayPage(self._pages)
+        yield page
+        self._idle[source] = page
+
+    def release(self) -> None:
+        self._idle.clear()
+
+    def close(self) -> None:
+        self.release()
+
+
+# Rebuilds the table and fetches the state's JSON, like a client-rendered page.
+PAGE_SCRIPT = """
+function show(name) {
+  const state = STATES[name];
+  const body = document.querySelector('table tbody');
+  body.replaceChildren(...state.rows.map(cells => {
+    const row = document.createElement('tr');
+    for (const text of cells) {
+      const cell = row.insertCell();
+      text.split('\\n').forEach((line, i) => {
+        if (i) cell.append(document.createElement('br'));
+        cell.append(line);
+      });
+    }
+    return row;
+  }));
+  for (const url of state.responses) fetch(url);
+}
+show('');
+"""
+
+
+def render_page(states: Dict[str, PageState]) -> str:
+    """One fixture page as HTML, with an option to pick for every extra state."""
+    controls = ""
+    options = [name for name in states if name]
+    if options:
+        controls = (
+            f'<button data-testid="prices-table-{CURRENCY_BUTTON}" '
+            "onclick=\"document.getElementById('options').hidden = false\">Currency</button>"
+            '<div id="options" hidden>'
+            + "".join(
+                f'<div role="option" onclick="show(\'{name}\')">{name}</div>' for name in options
+            )
+            + "</div>"
+        )
+    data = {
+        name: {"rows": state.rows, "responses": list(state.responses)}
+        for name, state in states.items()
+    }
+    script = json.dumps(data).replace("</", "<\\/")
+    return (
+        '<!doctype html><html><head><meta charset="utf-8"></head><body>'
+        f"{controls}<table><tbody></tbody></table>"
+        f"<script>const STATES = {script};{PAGE_SCRIPT}</script></body></html>"
+    )
+
+
+def render_site(sites: Iterable[Site]) -> Dict[str, Tuple[str, bytes]]:
+    """Every URL the fixture pages load, mapped to its content type and body."""
+    bodies: Dict[str, Tuple[str, bytes]] = {}
+    for url, states in page_states(sites).items():
+        bodies[url] = (HTML_TYPE, render_page(states).encode())
+        for state in states.values():
+            for api_url, payload in state.responses.items():
+                bodies[api_url] = (JSON_TYPE, encode_json(payload))
+    return bodies
+
+
+class RoutedPool(BrowserPool):
+    """A real browser pool whose contexts are served from fixtures only.
+
+    Requests for anything the fixtures do not cover are aborted, so a run
+    never reaches the network.
+    """
+
+    def __init__(self, sites: Iterable[Site], **kwargs) -> None:
+        kwargs.setdefault("block_resources", False)
+        super().__init__(**kwargs)
+        self._bodies = render_site(sites)
+
+    def handle(self, route) -> None:
+        body = self._bodies.get(route.request.url)
+        if body is None:
+            route.abort()
+            return
+        content_type, content = body
+        route.fulfill(status=200, content_type=content_type, body=content)
+
+    def context(self, source: str, init_script: Optional[str] = None):
+        fresh = source not in self._session().contexts
+        context = super().context(source, init_script=init_script)
+        if fresh:
+            context.route("**/*", self.handle)
+        return context
+
+
+@contextmanager
+def serve_documents(site: Site, module: ModuleType) -> Iterator[str]:
+    """Serve ``site.documents`` on localhost and point ``module``'s URLs at them.
+
+    Every module-level constant of ``module`` holding one of the document URLs
+    is swapped for the local URL until the block exits.
+    """
+    bodies = {}
+    for number, (url, payload) in enumerate(site.documents.items()):
+        bodies[f"/{number}?{urlsplit(url).query}"] = (url, encode_json(payload))
+
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, like the real API; without Nagle's algorithm a response
+        # written in several parts does not wait for the client's delayed ACK.
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self) -> None:
+            entry = bodies.get(self.path)
+            if entry is None:
+                self.send_error(404)
+                return
+            content = entry[1]
+            self.send_response(200)
+            self.send_header("Content-Type", JSON_TYPE)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = Thread(target=server.serve_forever, name="fixture-server", daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    local = {url: f"{base}{path}" for path, (url, _) in bodies.items()}
+    patched = {
+        name: value
+        for name, value in vars(module).items()
+        if isinstance(value, str) and value in local
+    }
+    try:
+        for name, value in patched.items():
+            setattr(module, name, local[value])
+        yield base
+    finally:
+        for name, value in patched.items():
+            setattr(module, name, value)
+        server.shutdown()
+        server.server_close()
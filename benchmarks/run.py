@@ -0,0 +1,255 @@
+"""Benchmark every scraper against offline fixtures.
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --compare bench.json
+
+Each source is run for 7, 100 and 1000 tracked coins, reading prices from
+the table (``table``) and from captured JSON (``api``). For every case the
+report has the median time of a fetch, the time spent matching rows (the
+``table.match``, ``capture.match`` and ``api.match`` spans) per row read,
+and the peak memory traced during one fetch. Pages are replayed in-process
+unless ``--browser`` is given, which serves the same fixtures to Chromium
+through request routing. Only ``--browser`` times a scrape end to end
+(``end_to_end_ms``); replayed fetches leave out the browser and time this
+repository's Python alone (``python_ms``).
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from benchmarks.fixtures import COIN_COUNTS, FIXTURE_VERSION, SITE_BUILDERS, Site, build_site
+from benchmarks.replay import ReplayPool, RoutedPool, serve_documents
+from scrapers import binance, coindesk, coingecko, coinmarketcap, kraken, yahoo
+from scrapers.timing import Tracer, set_tracer
+
+SCRAPERS = {
+    "coingecko": coingecko,
+    "kraken": kraken,
+    "yahoo": yahoo,
+    "binance": binance,
+    "coinmarketcap": coinmarketcap,
+    "coindesk": coindesk,
+}
+MODES = ("table", "api")
+# Binance has no page; its prices always come from the API.
+API_ONLY = frozenset({"binance"})
+EXTRACTION_SPANS = frozenset({"table.match", "capture.match", "api.match"})
+DEFAULT_REPEAT = 5
+# What a fetch's time covers on each backend, which names its metric.
+TIMINGS = {"replay": "python", "browser": "end_to_end"}
+
+
+def expected_results(source: str, site: Site) -> int:
+    currencies = len(kraken.CURRENCIES) if source == "kraken" else 1
+    return len(site.coins) * currencies
+
+
+def fetcher(source: str, site: Site, pool, mode: str) -> Callable[[], list]:
+    module = SCRAPERS[source]
+    if source in API_ONLY:
+        return lambda: module.fetch_prices(site.coins)
+    return lambda: module.fetch_prices(site.coins, pool=pool, capture_api=mode == "api")
+
+
+def measure(
+    source: str,
+    site: Site,
+    fetch: Callable[[], list],
+    repeat: int,
+    timing: str = TIMINGS["replay"],
+) -> Dict[str, object]:
+    """Time ``fetch`` ``repeat`` times after a warm-up run, then trace its memory once.
+
+    The times are reported as ``<timing>_ms`` and ``<timing>_min_ms``.
+    """
+    gc.collect()
+    found = len(fetch())
+    if found != expected_results(source, site):
+        raise RuntimeError(
+            f"{source}: replay found {found} of {expected_results(source, site)} prices"
+        )
+
+    elapsed: List[float] = []
+    extraction: List[float] = []
+    for _ in range(repeat):
+        tracer = Tracer()
+        previous = set_tracer(tracer)
+        started = time.perf_counter()
+        try:
+            fetch()
+        finally:
+            elapsed.append((time.perf_counter() - started) * 1000)
+            set_tracer(previous)
+        extraction.append(
+            sum(row["total_ms"] for row in tracer.summary() if row["name"] in EXTRACTION_SPANS)
+        )
+
+    tracemalloc.start()
+    try:
+        fetch()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    extract_ms = statistics.median(extraction)
+    return {
+        f"{timing}_ms": round(statistics.median(elapsed), 3),
+        f"{timing}_min_ms": round(min(elapsed), 3),
+        "extract_ms": round(extract_ms, 3),
+        "extract_us_per_row": round(extract_ms * 1000 / max(1, site.rows), 3),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(
+    sources: Sequence[str],
+    coin_counts: Sequence[int],
+    modes: Sequence[str],
+    repeat: int = DEFAULT_REPEAT,
+    browser: bool = False,
+    baseline: Optional[Dict[tuple, Dict[str, object]]] = None,
+) -> List[Dict[str, object]]:
+    """Measure every case, printing each as it finishes (with changes against ``baseline``)."""
+    results = []
+    timing = TIMINGS["browser" if browser else "replay"]
+    for coin_count in coin_counts:
+        sites = {source: build_site(source, coin_count) for source in sources}
+        pool = RoutedPool(sites.values()) if browser else ReplayPool(sites.values())
+        try:
+            for source, site in sites.items():
+                documents = serve_documents(site, SCRAPERS[source]) if site.documents else None
+                with documents or nullcontext():
+                    for mode in modes:
+                        if source in API_ONLY and mode != "api":
+                            continue
+                        row = {"source": source, "coins": coin_count, "mode": mode}
+                        row["rows"] = site.rows
+                        fetch = fetcher(source, site, pool, mode)
+                        row.update(measure(source, site, fetch, repeat, timing))
+                        results.append(row)
+                        previous = baseline.get(case_key(row)) if baseline is not None else None
+                        print(format_row(row, previous), flush=True)
+        finally:
+            pool.close()
+    return results
+
+
+def current_commit() -> Optional[str]:
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parents[1],
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return completed.stdout.strip() or None
+
+
+def time_key(row: Dict[str, object]) -> str:
+    return next(f"{timing}_ms" for timing in TIMINGS.values() if f"{timing}_ms" in row)
+
+
+def format_row(row: Dict[str, object], baseline: Optional[Dict[str, object]] = None) -> str:
+    elapsed = time_key(row)
+    line = (
+        f"{row['source']:<14} {row['coins']:>5} {row['mode']:<5} "
+        f"{elapsed[:-len('_ms')]:<10} {row[elapsed]:>10.2f} ms "
+        f"{row['extract_us_per_row']:>8.2f} us/row {row['peak_kib']:>9.1f} KiB"
+    )
+    if baseline is not None:
+        changes = []
+        for key in (elapsed, "extract_us_per_row", "peak_kib"):
+            before = baseline.get(key)
+            changes.append(f"{(row[key] - before) / before:+.0%}" if before else "n/a")
+        line += "  (" + " / ".join(changes) + ")"
+    return line
+
+
+def case_key(row: Dict[str, object]) -> tuple:
+    return row["source"], row["coins"], row["mode"]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sources",
+        nargs="+",
+        choices=list(SITE_BUILDERS),
+        default=list(SITE_BUILDERS),
+        help="Sources to benchmark (default: all)",
+    )
+    parser.add_argument(
+        "--coins",
+        nargs="+",
+        type=int,
+        default=list(COIN_COUNTS),
+        help="Numbers of tracked coins to benchmark (default: 7 100 1000)",
+    )
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=MODES,
+        default=list(MODES),
+        help="Read prices from the table, the captured JSON, or both (default)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=DEFAULT_REPEAT,
+        help="Timed fetches per case; the median is reported",
+    )
+    parser.add_argument(
+        "--browser",
+        action="store_true",
+        help="Serve the fixtures to Chromium instead of replaying pages in-process",
+    )
+    parser.add_argument("--output", type=Path, help="Write the results to this JSON file")
+    parser.add_argument(
+        "--compare", type=Path, help="Show changes against results saved with --output"
+    )
+    args = parser.parse_args()
+
+    backend = "browser" if args.browser else "replay"
+    baseline = None
+    if args.compare:
+        baseline_report = json.loads(args.compare.read_text())
+        if baseline_report.get("fixture_version") != FIXTURE_VERSION:
+            print("Baseline was recorded with other fixtures; changes are not comparable")
+        if baseline_report.get("backend") != backend:
+            print("Baseline was recorded with another backend; changes are not comparable")
+        baseline = {case_key(row): row for row in baseline_report["results"]}
+        print(f"Changes against {baseline_report.get('commit') or args.compare}:")
+
+    results = run_benchmarks(
+        args.sources, args.coins, args.modes, args.repeat, args.browser, baseline
+    )
+    report = {
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "backend": backend,
+        "fixture_version": FIXTURE_VERSION,
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,114 @@
+"""Long-running scheduler that polls each source on its own interval.
+
+Every source gets a dedicated thread. Sync Playwright objects are bound to
+the thread that created them, so running a source on the same thread tick
+after tick is what keeps its browser, context and pages in the
+:class:`~scrapers.browser.BrowserPool` warm between ticks. Ticks follow a
+fixed grid of ``interval`` seconds, each delayed by up to ``jitter`` seconds.
+Because a source's ticks run on one thread they can never overlap: a tick
+that falls due while the previous one is still running is skipped, and the
+schedule resumes at the next grid point.
+"""
+from __future__ import annotations
+
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from scrapers import PriceResult, Scraper, fetch_source
+from scrapers.browser import BrowserPool
+
+DEFAULT_INTERVAL = 300.0
+DEFAULT_JITTER = 0.1
+JOIN_POLL_SECONDS = 0.5
+
+# Called after every tick with (source, fetched_at, results, errors); a source
+# that misses some coins reports what it found plus one error per miss.
+TickHandler = Callable[[str, datetime, Sequence[PriceResult], List[Dict[str, str]]], None]
+
+
+@dataclass(frozen=True)
+class Schedule:
+    """How often a source is polled; ``jitter`` is the maximum extra delay in seconds."""
+
+    interval: float = DEFAULT_INTERVAL
+    jitter: float = 0.0
+
+
+def next_due(due: float, interval: float, now: float) -> Tuple[float, int]:
+    """The next grid point after ``due`` that is not already past, and how many were missed."""
+    due += interval
+    if due > now:
+        return due, 0
+    missed = int((now - due) // interval) + 1
+    return due + missed * interval, missed
+
+
+def source_loop(
+    scraper: Scraper,
+    schedule: Schedule,
+    on_tick: TickHandler,
+    stop: threading.Event,
+    pool: Optional[BrowserPool] = None,
+    clock: Callable[[], float] = time.monotonic,
+    rng: Optional[random.Random] = None,
+) -> None:
+    """Poll ``scraper`` until ``stop`` is set, handing every outcome to ``on_tick``."""
+    rng = rng or random.Random()
+    try:
+        due = clock()
+        while not stop.is_set():
+            delay = due + rng.uniform(0, schedule.jitter) - clock()
+            if delay > 0 and stop.wait(delay):
+                break
+            fetched_at = datetime.now(timezone.utc)
+            results, errors = fetch_source(scraper)
+            try:
+                on_tick(scraper.name, fetched_at, results or [], errors)
+            except Exception as exc:
+                print(f"{scraper.name}: could not record tick: {exc}", file=sys.stderr)
+            due, missed = next_due(due, schedule.interval, clock())
+            if missed:
+                print(
+                    f"{scraper.name}: tick overran its interval, skipped {missed} tick(s)",
+                    file=sys.stderr,
+                )
+    finally:
+        if pool is not None:
+            pool.release()
+
+
+def run_daemon(
+    scrapers: Sequence[Scraper],
+    schedules: Mapping[str, Schedule],
+    on_tick: TickHandler,
+    pool: Optional[BrowserPool] = None,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    """Run every scraper on its schedule until ``stop`` is set or Ctrl-C.
+
+    Sources missing from ``schedules`` use the default :class:`Schedule`.
+    """
+    stop = stop or threading.Event()
+    threads = [
+        threading.Thread(
+            target=source_loop,
+            args=(scraper, schedules.get(scraper.name, Schedule()), on_tick, stop, pool),
+            name=f"poll-{scraper.name}",
+        )
+        for scraper in scrapers
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(JOIN_POLL_SECONDS)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
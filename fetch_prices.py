@@ -1,27 +1,301 @@
 #!/usr/bin/env python3
 import argparse
 import json
+import queue
 import sys
-from dataclasses import asdict
-from datetime import datetime, timezone
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
-from scrapers import PriceResult, list_sources, merge_results
+from daemon import DEFAULT_INTERVAL, DEFAULT_JITTER, Schedule, run_daemon
+from history import HistoryStore, intraday_log_paths, record_snapshot, snapshot_date
+from scrapers import (
+    PRICE_FIELDS,
+    PriceBatch,
+    PriceResult,
+    Scraper,
+    fetch_source,
+    list_sources,
+    merge_results,
+)
+from scrapers.browser import BrowserPool
+from scrapers.recording import Recording
+from scrapers.response_cache import DEFAULT_MAX_BYTES, ResponseCache
+from scrapers.storage_state import DEFAULT_MAX_AGE, StorageStates
+from scrapers.retry import LatencyHistory, RetryPolicy
+from scrapers.timing import Tracer, set_tracer, span
 from scrapers.coingecko import CoinGeckoScraper
-from scrapers.kraken import KrakenScraper
-from scrapers.yahoo import YahooScraper
-from scrapers.binance import BinanceScraper
+from scrapers.kraken import CURRENCIES as KRAKEN_CURRENCIES, KrakenScraper
+from scrapers.yahoo import PageOffsets, YahooScraper
+from scrapers.binance import QUOTES as BINANCE_QUOTES, BinanceScraper
 from scrapers.coinmarketcap import CoinMarketCapScraper
 from scrapers.coindesk import CoinDeskScraper
+from snapshots import (
+    SNAPSHOT_DATE_FORMAT,
+    SNAPSHOT_SUFFIX,
+    append_intraday,
+    available_compressions,
+    compact_intraday,
+    compress,
+    encode_snapshot,
+    intraday_log_path,
+    snapshot_suffix,
+    write_snapshot_files,
+)
 
 
-def output_path(output_dir: Path, date: datetime) -> Path:
-    return output_dir / f"{date.strftime('%Y-%m-%d')}.json"
+DEFAULT_OUTPUT_DIR = Path("data")
+DEFAULT_LATENCY_FILE = Path(".cache/latency.json")
+DEFAULT_HTTP_CACHE_DIR = Path(".cache/http")
+DEFAULT_YAHOO_OFFSETS_FILE = Path(".cache/yahoo_offsets.json")
+DEFAULT_BROWSER_STATE_DIR = Path(".cache/browser-state")
 
 
-def serialize_prices(prices: List[PriceResult]) -> List[Dict[str, object]]:
-    return [asdict(price) for price in prices]
+def output_path(output_dir: Path, date: datetime, suffix: str = SNAPSHOT_SUFFIX) -> Path:
+    return output_dir / f"{date.strftime(SNAPSHOT_DATE_FORMAT)}{suffix}"
+
+
+def serialize_prices(prices: Iterable[PriceResult]) -> List[Dict[str, object]]:
+    if isinstance(prices, PriceBatch):
+        return prices.records()
+    return [
+        {field: getattr(price, field) for field in PRICE_FIELDS} for price in prices
+    ]
+
+
+def compact_intraday_logs(
+    output_dir: Path,
+    before: Optional[date] = None,
+    compact: bool = False,
+    compression: Optional[str] = None,
+) -> List[Path]:
+    """Roll the intraday logs dated before ``before`` (all of them by default)."""
+    end = before - timedelta(days=1) if before is not None else None
+    suffix = snapshot_suffix(compression)
+    return [
+        compact_intraday(
+            log_path,
+            output_path(output_dir, snapshot_date(log_path), suffix),
+            compact=compact,
+            compression=compression,
+        )
+        for log_path in intraday_log_paths(output_dir, end=end)
+    ]
+
+
+def save_snapshot(
+    output_dir: Path,
+    payload: Dict[str, object],
+    fetched_at: datetime,
+    intraday: bool = False,
+    compact: bool = False,
+    compression: Optional[str] = None,
+    latest_payload: Optional[Dict[str, object]] = None,
+) -> Path:
+    """Store one run and point ``latest`` at it; returns where the run went.
+
+    Normally that replaces the day's snapshot file. In intraday mode the run
+    is appended to the day's log instead, after any logs left over from
+    earlier days have been compacted. ``latest_payload`` replaces what
+    ``latest`` shows, for callers that merge several runs into it.
+    """
+    suffix = snapshot_suffix(compression)
+    with span("encode"):
+        content = compress(encode_snapshot(payload, compact=compact), compression)
+    latest_path = output_dir / f"latest{suffix}"
+    if not intraday:
+        destination = output_path(output_dir, fetched_at, suffix)
+        with span("write"):
+            write_snapshot_files(content, [destination, latest_path])
+        return destination
+
+    compact_intraday_logs(
+        output_dir, before=fetched_at.date(), compact=compact, compression=compression
+    )
+    destination = intraday_log_path(output_dir, fetched_at)
+    if latest_payload is not None:
+        with span("encode"):
+            content = compress(encode_snapshot(latest_payload, compact=compact), compression)
+    with span("write"):
+        append_intraday(destination, payload)
+        write_snapshot_files(content, [latest_path])
+    return destination
+
+
+def snapshot_payload(
+    fetched_at: datetime,
+    sources: Sequence[str],
+    quotes: List[Dict[str, object]],
+    errors: List[Dict[str, str]],
+) -> Dict[str, object]:
+    return {
+        "date": fetched_at.date().isoformat(),
+        "fetched_at": fetched_at.isoformat(),
+        "sources": list(sources),
+        "quotes": quotes,
+        "errors": errors,
+    }
+
+
+class DaemonRecorder:
+    """Persists every daemon tick as one intraday run.
+
+    Each tick is appended to the day's log with only its own source, while
+    ``latest`` is rewritten to show the newest quotes from every source (a
+    source that fails outright keeps its last quotes there, next to its error).
+    Ticks arrive from one thread per source, so writes are serialized.
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        sources: Sequence[str],
+        store: Optional[HistoryStore] = None,
+        compact: bool = False,
+        compression: Optional[str] = None,
+        latency: Optional[LatencyHistory] = None,
+    ) -> None:
+        self._output_dir = output_dir
+        self._sources = list(sources)
+        self._store = store
+        self._compact = compact
+        self._compression = compression
+        self._latency = latency
+        self._quotes: Dict[str, List[Dict[str, object]]] = {}
+        self._errors: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(
+        self,
+        source: str,
+        fetched_at: datetime,
+        results: Sequence[PriceResult],
+        errors: List[Dict[str, str]],
+    ) -> None:
+        batch = merge_results([(source, results)])
+        quotes = serialize_prices(batch)
+        with self._lock:
+            if quotes:
+                self._quotes[source] = quotes
+            self._errors[source] = errors
+            latest = snapshot_payload(
+                fetched_at,
+                self._sources,
+                [quote for name in self._sources for quote in self._quotes.get(name, [])],
+                [error for name in self._sources for error in self._errors.get(name, [])],
+            )
+            destination = save_snapshot(
+                self._output_dir,
+                snapshot_payload(fetched_at, [source], quotes, errors),
+                fetched_at,
+                intraday=True,
+                compact=self._compact,
+                compression=self._compression,
+                latest_payload=latest,
+            )
+            if self._store is not None and len(batch):
+                record_snapshot(self._store, self._output_dir, fetched_at, batch)
+            if self._latency is not None:
+                self._latency.save()
+        for error in errors:
+            print(f"{source}: {error['error']}", file=sys.stderr)
+        print(f"Saved {len(batch)} {source} prices to {destination}")
+
+
+def write_timings(
+    tracer: Tracer,
+    fetched_at: datetime,
+    timings_path: Optional[Path] = None,
+    trace_path: Optional[Path] = None,
+) -> None:
+    """Write the run's span summary and/or its Chrome trace."""
+    if timings_path is not None:
+        report = {"fetched_at": fetched_at.isoformat(), "spans": tracer.summary()}
+        timings_path.parent.mkdir(parents=True, exist_ok=True)
+        timings_path.write_text(json.dumps(report, indent=2) + "\n")
+    if trace_path is not None:
+        trace_path.parent.mkdir(parents=True, exist_ok=True)
+        trace_path.write_text(json.dumps(tracer.chrome_trace()) + "\n")
+
+
+def format_timings(summary: Sequence[Dict[str, object]], limit: int = 10) -> str:
+    """The ``limit`` most expensive spans, one per line."""
+    rows = sorted(summary, key=lambda row: row["total_ms"], reverse=True)[:limit]
+    return "\n".join(
+        f"{row['total_ms']:10.1f} ms  {row['count']:4d}x  "
+        f"{row['source'] or '-'}: {row['name']}"
+        for row in rows
+    )
+
+
+def parse_source_interval(text: str) -> Tuple[str, float]:
+    name, separator, seconds = text.partition("=")
+    try:
+        interval = float(seconds)
+    except ValueError:
+        interval = 0.0
+    if not separator or not name or interval <= 0:
+        raise argparse.ArgumentTypeError(f"expected SOURCE=SECONDS, got {text!r}")
+    return name, interval
+
+
+def parse_source_currencies(text: str) -> Tuple[str, List[str]]:
+    name, separator, codes = text.partition("=")
+    currencies = [code.strip().upper() for code in codes.split(",") if code.strip()]
+    if not separator or not name or not currencies:
+        raise argparse.ArgumentTypeError(f"expected SOURCE=CODE[,CODE...], got {text!r}")
+    return name, currencies
+
+
+def run_scrapers(
+    scrapers: Sequence[Scraper],
+    max_workers: Optional[int] = None,
+    pool: Optional[BrowserPool] = None,
+) -> Tuple[List[Tuple[str, Sequence[PriceResult]]], List[Dict[str, str]]]:
+    """Run every scraper, at most ``max_workers`` at a time.
+
+    Each worker thread pulls scrapers off a shared queue until it is empty, so
+    a scraper's Playwright session always lives on a single thread. Workers
+    release their browser from ``pool`` once the queue is drained. Results and
+    errors are returned in the order of ``scrapers`` regardless of which one
+    finishes first. A source that misses some coins still contributes the
+    prices it found, with one error per missing coin.
+    """
+    workers = max(1, min(max_workers or len(scrapers), len(scrapers) or 1))
+    pending: "queue.SimpleQueue[Tuple[int, Scraper]]" = queue.SimpleQueue()
+    for index, scraper in enumerate(scrapers):
+        pending.put((index, scraper))
+
+    outcomes: List[
+        Optional[Tuple[str, Optional[Sequence[PriceResult]], List[Dict[str, str]]]]
+    ] = [None] * len(scrapers)
+
+    def worker() -> None:
+        try:
+            while True:
+                try:
+                    index, scraper = pending.get_nowait()
+                except queue.Empty:
+                    return
+                outcomes[index] = (scraper.name, *fetch_source(scraper))
+        finally:
+            if pool is not None:
+                pool.release()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(worker) for _ in range(workers)]
+        for future in futures:
+            future.result()
+
+    collected: List[Tuple[str, Sequence[PriceResult]]] = []
+    errors: List[Dict[str, str]] = []
+    for name, data, source_errors in filter(None, outcomes):
+        if data is not None:
+            collected.append((name, data))
+        errors.extend(source_errors)
+    return collected, errors
 
 
 def main() -> int:
@@ -31,48 +305,337 @@ def main() -> int:
     parser.add_argument(
         "--output-dir",
         type=Path,
-        default=Path("data"),
-        help="Directory to write price JSON files",
+        default=None,
+        help=f"Directory to write price JSON files (default: {DEFAULT_OUTPUT_DIR})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Maximum number of scrapers to run at once (default: all of them)",
+    )
+    parser.add_argument(
+        "--no-block-resources",
+        dest="block_resources",
+        action="store_false",
+        help="Let pages load images, fonts, media, ads and analytics",
+    )
+    parser.add_argument(
+        "--no-api-capture",
+        dest="capture_api",
+        action="store_false",
+        help="Read prices from the page tables only, ignoring the JSON the pages fetch",
+    )
+    parser.add_argument(
+        "--history-dir",
+        type=Path,
+        default=None,
+        help="Columnar history store to append to (default: OUTPUT_DIR/history)",
+    )
+    parser.add_argument(
+        "--no-history",
+        dest="history",
+        action="store_false",
+        help="Do not append the quotes to the columnar history store",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Write the snapshot without indentation",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=available_compressions(),
+        default=None,
+        help="Compress the snapshot (zstd needs the zstandard package)",
+    )
+    parser.add_argument(
+        "--intraday",
+        action="store_true",
+        help="Append this run to the day's intraday log instead of replacing the daily file",
+    )
+    parser.add_argument(
+        "--compact-intraday",
+        action="store_true",
+        help="Roll every intraday log into its daily snapshot and exit",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and poll every source on its own schedule (implies --intraday)",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=DEFAULT_INTERVAL,
+        help="Seconds between polls of each source in daemon mode",
+    )
+    parser.add_argument(
+        "--source-interval",
+        dest="source_intervals",
+        type=parse_source_interval,
+        action="append",
+        default=[],
+        metavar="SOURCE=SECONDS",
+        help="Poll one source on its own interval in daemon mode (repeatable)",
+    )
+    parser.add_argument(
+        "--currencies",
+        dest="source_currencies",
+        type=parse_source_currencies,
+        action="append",
+        default=[],
+        metavar="SOURCE=CODES",
+        help=(
+            "Quote currencies to fetch from one source, e.g. kraken=EUR,USD,GBP or "
+            "binance=USDT,USDC,EUR (repeatable; only kraken and binance take it)"
+        ),
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=DEFAULT_JITTER,
+        help="Delay each daemon poll by up to this fraction of its interval",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=2,
+        help="Retry a failed source this many times, refetching only missing coins",
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Exit with status 1 when any coin is missing, not only when a source fails",
+    )
+    parser.add_argument(
+        "--latency-file",
+        type=Path,
+        default=DEFAULT_LATENCY_FILE,
+        help="Where per-source wait latencies are kept between runs",
+    )
+    parser.add_argument(
+        "--http-cache",
+        type=Path,
+        default=DEFAULT_HTTP_CACHE_DIR,
+        metavar="DIR",
+        help="Where slow-changing API documents are cached between runs",
+    )
+    parser.add_argument(
+        "--http-cache-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        metavar="MIB",
+        help="Evict the least recently used cache entries beyond this size",
+    )
+    parser.add_argument(
+        "--no-http-cache",
+        dest="use_http_cache",
+        action="store_false",
+        help="Fetch every API document from the network",
+    )
+    parser.add_argument(
+        "--browser-state",
+        type=Path,
+        default=DEFAULT_BROWSER_STATE_DIR,
+        metavar="DIR",
+        help="Where each source's cookies and local storage are kept between runs",
+    )
+    parser.add_argument(
+        "--browser-state-max-age",
+        type=float,
+        default=DEFAULT_MAX_AGE / 3600,
+        metavar="HOURS",
+        help="Start a source from a clean profile once its saved state is this old",
+    )
+    parser.add_argument(
+        "--no-browser-state",
+        dest="use_browser_state",
+        action="store_false",
+        help="Start every source from a clean profile",
+    )
+    parser.add_argument(
+        "--clear-browser-state",
+        action="store_true",
+        help="Delete every saved browser state before the run",
+    )
+    parser.add_argument(
+        "--no-adaptive-timeouts",
+        dest="adaptive_timeouts",
+        action="store_false",
+        help="Always use the fixed default timeouts",
+    )
+    parser.add_argument(
+        "--timings",
+        type=Path,
+        default=None,
+        help="Write a per-span timing summary of the run to this JSON file",
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        default=None,
+        help="Write the run's spans as a Chrome trace (chrome://tracing, Perfetto)",
+    )
+    recording_group = parser.add_mutually_exclusive_group()
+    recording_group.add_argument(
+        "--record",
+        type=Path,
+        default=None,
+        metavar="DIR",
+        help="Save every source's network traffic to DIR (HAR files, Binance JSON)",
+    )
+    recording_group.add_argument(
+        "--replay",
+        type=Path,
+        default=None,
+        metavar="DIR",
+        help="Serve every source from traffic saved with --record instead of the network",
     )
     args = parser.parse_args()
 
+    if args.replay is not None and (
+        args.output_dir is None or args.output_dir.resolve() == DEFAULT_OUTPUT_DIR.resolve()
+    ):
+        # Replayed quotes would overwrite today's real snapshot and, through
+        # the daily files, end up in the history after all.
+        parser.error(f"--replay needs an --output-dir other than {DEFAULT_OUTPUT_DIR}")
+    if args.output_dir is None:
+        args.output_dir = DEFAULT_OUTPUT_DIR
+
+    if args.compact_intraday:
+        for path in compact_intraday_logs(
+            args.output_dir, compact=args.compact, compression=args.compress
+        ):
+            print(f"Compacted intraday log into {path}")
+        return 0
+
+    recording = None
+    if args.record:
+        recording = Recording(args.record)
+    elif args.replay:
+        recording = Recording(args.replay, replay=True)
+    if args.daemon and args.record:
+        parser.error("--record only applies to single runs")
+
+    # Recorded and replayed runs start from a clean profile, like the recording did.
+    states = None
+    if args.use_browser_state and recording is None:
+        states = StorageStates(args.browser_state, max_age=args.browser_state_max_age * 3600)
+        if args.clear_browser_state:
+            states.clear()
+    pool = BrowserPool(
+        block_resources=args.block_resources, recording=recording, states=states
+    )
+    # Replayed waits say nothing about the live sites, so they are not learned from.
+    latency = None
+    if args.adaptive_timeouts and not args.replay:
+        latency = LatencyHistory(args.latency_file)
+    retry = RetryPolicy(attempts=args.retries + 1)
+    http_cache = None
+    if args.use_http_cache and not args.replay:
+        http_cache = ResponseCache(args.http_cache, max_bytes=args.http_cache_size * 1024 * 1024)
+    browser_options = dict(
+        pool=pool, capture_api=args.capture_api, latency=latency, retry=retry
+    )
+    currencies = dict(args.source_currencies)
+    unknown = sorted(set(currencies) - {"kraken", "binance"})
+    if unknown:
+        parser.error(f"--currencies only applies to kraken and binance, not {', '.join(unknown)}")
+    try:
+        kraken = KrakenScraper(
+            **browser_options, currencies=currencies.get("kraken", KRAKEN_CURRENCIES)
+        )
+    except ValueError as exc:
+        parser.error(str(exc))
     scrapers = [
-        CoinGeckoScraper(),
-        KrakenScraper(),
-        YahooScraper(),
-        BinanceScraper(),
-        CoinMarketCapScraper(),
-        CoinDeskScraper(),
+        CoinGeckoScraper(**browser_options),
+        kraken,
+        # Offsets seen in a replay are kept for the run but not written back.
+        YahooScraper(
+            **browser_options,
+            offsets=PageOffsets(None if args.replay else DEFAULT_YAHOO_OFFSETS_FILE),
+        ),
+        BinanceScraper(
+            retry=retry,
+            recording=recording,
+            cache=http_cache,
+            quotes=currencies.get("binance", BINANCE_QUOTES),
+        ),
+        CoinMarketCapScraper(**browser_options),
+        CoinDeskScraper(**browser_options),
     ]
+    # Replayed quotes are not real observations; keep them out of the history.
+    keep_history = args.history and not args.replay
 
-    errors: List[Dict[str, str]] = []
-    collected = []
-    for scraper in scrapers:
+    if args.daemon:
+        if args.timings or args.trace:
+            parser.error("--timings and --trace only apply to single runs")
+        store = None
+        if keep_history:
+            store = HistoryStore(args.history_dir or args.output_dir / "history")
+        recorder = DaemonRecorder(
+            args.output_dir,
+            list_sources(scrapers),
+            store=store,
+            compact=args.compact,
+            compression=args.compress,
+            latency=latency,
+        )
+        overrides = dict(args.source_intervals)
+        unknown = sorted(set(overrides) - set(list_sources(scrapers)))
+        if unknown:
+            parser.error(f"unknown source(s) in --source-interval: {', '.join(unknown)}")
+        schedules = {}
+        for name in list_sources(scrapers):
+            interval = overrides.get(name, args.interval)
+            schedules[name] = Schedule(interval, jitter=interval * args.jitter)
         try:
-            collected.append((scraper.name, scraper.fetch()))
-        except Exception as exc:
-            errors.append({"source": scraper.name, "error": str(exc)})
+            run_daemon(scrapers, schedules, recorder, pool=pool)
+        finally:
+            pool.close()
+        return 0
 
-    results = merge_results(collected)
+    tracer = Tracer() if args.timings or args.trace else None
+    set_tracer(tracer)
+    try:
+        with span("scrape"):
+            collected, errors = run_scrapers(scrapers, max_workers=args.workers, pool=pool)
+    finally:
+        pool.close()
+    if latency is not None:
+        latency.save()
 
     now = datetime.now(timezone.utc)
-    payload = {
-        "date": now.date().isoformat(),
-        "fetched_at": now.isoformat(),
-        "sources": list_sources(scrapers),
-        "quotes": serialize_prices(results),
-        "errors": errors,
-    }
+    with span("serialize"):
+        results = merge_results(collected)
+        payload = snapshot_payload(
+            now, list_sources(scrapers), serialize_prices(results), errors
+        )
+
+    destination = save_snapshot(
+        args.output_dir,
+        payload,
+        now,
+        intraday=args.intraday,
+        compact=args.compact,
+        compression=args.compress,
+    )
 
-    args.output_dir.mkdir(parents=True, exist_ok=True)
-    destination = output_path(args.output_dir, now)
-    content = json.dumps(payload, indent=2, sort_keys=True) + "\n"
-    destination.write_text(content)
-    latest_path = args.output_dir / "latest.json"
-    latest_path.write_text(content)
+    if keep_history:
+        history_dir = args.history_dir or args.output_dir / "history"
+        with span("history"):
+            record_snapshot(HistoryStore(history_dir), args.output_dir, now, results)
 
     print(f"Saved prices to {destination}")
-    return 1 if errors else 0
+    if tracer is not None:
+        set_tracer(None)
+        write_timings(tracer, now, args.timings, args.trace)
+        print(format_timings(tracer.summary()))
+    # Missing coins are recorded in the snapshot; only a failed source fails the
+    # run unless asked.
+    failed = errors if args.strict else [error for error in errors if "slug" not in error]
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
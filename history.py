@@ -0,0 +1,630 @@
+#!/usr/bin/env python3
+"""Columnar history of every quote written to ``data/``.
+
+Each column lives in its own little-endian file under the history directory
+and is appended to in place, so adding a snapshot never rewrites old data:
+
+- ``timestamp.i64``: fetch time in microseconds since the epoch
+- ``slug.u16``, ``source.u16``, ``currency.u16``: dictionary codes
+- ``price.f64``: the quoted price
+
+An index makes :func:`query` touch only the rows it returns: ``meta.json``
+maps each UTC date to the row ranges appended on it, and ``postings/`` holds
+one sorted ``uint32`` row-id file per slug, source and currency code.
+
+``meta.json`` also holds the dictionaries, the committed row count and the
+committed length of every postings file. It is replaced atomically after the
+data files are written, so a crash mid-append leaves trailing bytes that the
+next append truncates away.
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import csv
+import json
+import os
+import sys
+from array import array
+from dataclasses import asdict, dataclass, fields
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from scrapers import PriceBatch, PriceResult
+from snapshots import (
+    INTRADAY_DIR,
+    INTRADAY_SUFFIX,
+    SNAPSHOT_DATE_FORMAT,
+    SNAPSHOT_SUFFIXES,
+    read_batches,
+)
+
+try:
+    import numpy
+except ImportError:  # numpy is optional; fall back to array.array columns.
+    numpy = None
+
+HISTORY_VERSION = 2
+COLUMNS = {
+    "timestamp": "q",
+    "slug": "H",
+    "source": "H",
+    "currency": "H",
+    "price": "d",
+}
+NUMPY_DTYPES = {"q": "<i8", "H": "<u2", "d": "<f8"}
+COLUMN_SUFFIXES = {"q": "i64", "H": "u16", "d": "f64"}
+DICTIONARY_COLUMNS = ("slug", "source", "currency")
+POSTING_TYPECODE = "I"
+QUERY_FIELDS = ["fetched_at", "slug", "source", "currency", "price"]
+SNAPSHOT_META_FIELDS = ("date", "fetched_at")
+SNAPSHOT_FIELDS = SNAPSHOT_META_FIELDS + tuple(field.name for field in fields(PriceResult))
+
+
+def to_micros(moment: datetime) -> int:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    delta = moment - datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def from_micros(micros: int) -> datetime:
+    return datetime.fromtimestamp(micros / 1_000_000, tz=timezone.utc)
+
+
+def write_json_atomic(path: Path, data: object) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(json.dumps(data, sort_keys=True) + "\n")
+    os.replace(tmp_path, path)
+
+
+def append_array(path: Path, values: array, committed: int) -> None:
+    """Append ``values`` after the first ``committed`` items of ``path``."""
+    with open(path, "ab") as handle:
+        # Drop bytes from an append that never reached meta.json.
+        handle.truncate(committed * values.itemsize)
+        if sys.byteorder != "little":
+            values = array(values.typecode, values)
+            values.byteswap()
+        values.tofile(handle)
+
+
+def contiguous_runs(row_ids: Sequence[int]) -> Iterator[Tuple[int, int]]:
+    """Group sorted row ids into ``[start, stop)`` runs."""
+    run_start = run_stop = None
+    for row in row_ids:
+        if run_stop is not None and row == run_stop:
+            run_stop += 1
+            continue
+        if run_start is not None:
+            yield run_start, run_stop
+        run_start, run_stop = row, row + 1
+    if run_start is not None:
+        yield run_start, run_stop
+
+
+@dataclass
+class HistoryColumns:
+    """Loaded history: one array per column plus the code dictionaries.
+
+    Arrays are NumPy arrays when NumPy is installed, ``array.array``
+    otherwise. ``slugs[slug[i]]`` is the slug of row ``i``, and likewise for
+    sources and currencies.
+    """
+
+    timestamp: object
+    slug: object
+    source: object
+    currency: object
+    price: object
+    slugs: List[str]
+    sources: List[str]
+    currencies: List[str]
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+
+@dataclass(frozen=True)
+class HistoryQuote:
+    fetched_at: datetime
+    slug: str
+    source: str
+    currency: str
+    price: float
+
+
+class PostingList:
+    """Sorted row ids of one postings file, read from disk on demand.
+
+    Supports ``len`` and indexing, so :mod:`bisect` can locate a row range
+    with a handful of reads instead of loading the whole file.
+    """
+
+    def __init__(self, path: Path, length: int) -> None:
+        self._length = length
+        self._handle = open(path, "rb") if length else None
+        self._itemsize = array(POSTING_TYPECODE).itemsize
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> int:
+        return self.read(index, index + 1)[0]
+
+    def read(self, start: int, stop: int) -> array:
+        values = array(POSTING_TYPECODE)
+        if stop > start:
+            self._handle.seek(start * self._itemsize)
+            values.fromfile(self._handle, stop - start)
+            if sys.byteorder != "little":
+                values.byteswap()
+        return values
+
+    def between(self, start: int, stop: int) -> array:
+        """Row ids in ``[start, stop)``."""
+        first = bisect.bisect_left(self, start)
+        return self.read(first, bisect.bisect_left(self, stop, lo=first))
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+
+    def __enter__(self) -> "PostingList":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+class HistoryStore:
+    def __init__(self, directory: Path) -> None:
+        self.directory = Path(directory)
+        self._meta: Optional[Dict[str, object]] = None
+
+    def column_path(self, column: str) -> Path:
+        typecode = COLUMNS[column]
+        return self.directory / f"{column}.{COLUMN_SUFFIXES[typecode]}"
+
+    def posting_path(self, column: str, code: int) -> Path:
+        return self.directory / "postings" / f"{column}-{code}.u32"
+
+    @property
+    def meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    def meta(self) -> Dict[str, object]:
+        if self._meta is None:
+            if self.meta_path.exists():
+                self._meta = json.loads(self.meta_path.read_text())
+            else:
+                self._meta = {
+                    "version": HISTORY_VERSION,
+                    "rows": 0,
+                    "dictionaries": {column: [] for column in DICTIONARY_COLUMNS},
+                    "days": {},
+                    "postings": {column: {} for column in DICTIONARY_COLUMNS},
+                }
+            if "days" not in self._meta:
+                # Stores written before the index existed.
+                self._meta["days"] = {}
+                self.rebuild_index()
+        return self._meta
+
+    @property
+    def rows(self) -> int:
+        return int(self.meta()["rows"])
+
+    def append(self, fetched_at: datetime, quotes: Iterable[PriceResult]) -> int:
+        """Append ``quotes`` fetched at ``fetched_at``; returns the rows added."""
+        meta = self.meta()
+        dictionaries: Dict[str, List[str]] = meta["dictionaries"]
+        lookups = {
+            column: {value: code for code, value in enumerate(values)}
+            for column, values in dictionaries.items()
+        }
+
+        def encode(column: str, value: str) -> int:
+            lookup = lookups[column]
+            code = lookup.get(value)
+            if code is None:
+                code = len(dictionaries[column])
+                dictionaries[column].append(value)
+                lookup[value] = code
+            return code
+
+        timestamp = to_micros(fetched_at)
+        rows = self.rows
+        columns = {column: array(typecode) for column, typecode in COLUMNS.items()}
+        postings: Dict[str, Dict[int, array]] = {
+            column: {} for column in DICTIONARY_COLUMNS
+        }
+        if isinstance(quotes, PriceBatch):
+            # Read the batch's columns directly instead of building records.
+            values = zip(
+                quotes.price, *(quotes.column(column) for column in DICTIONARY_COLUMNS)
+            )
+        else:
+            values = (
+                (quote.price, *(getattr(quote, column) for column in DICTIONARY_COLUMNS))
+                for quote in quotes
+            )
+        for price, *keys in values:
+            row = rows + len(columns["price"])
+            columns["timestamp"].append(timestamp)
+            columns["price"].append(price)
+            for column, key in zip(DICTIONARY_COLUMNS, keys):
+                code = encode(column, key)
+                columns[column].append(code)
+                postings[column].setdefault(code, array(POSTING_TYPECODE)).append(row)
+
+        added = len(columns["price"])
+        if not added:
+            return 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for column, values in columns.items():
+            append_array(self.column_path(column), values, committed=rows)
+
+        (self.directory / "postings").mkdir(exist_ok=True)
+        committed_postings: Dict[str, Dict[str, int]] = meta["postings"]
+        for column, by_code in postings.items():
+            counts = committed_postings[column]
+            for code, row_ids in by_code.items():
+                count = counts.get(str(code), 0)
+                append_array(self.posting_path(column, code), row_ids, committed=count)
+                counts[str(code)] = count + len(row_ids)
+
+        day = from_micros(timestamp).date().isoformat()
+        runs: List[List[int]] = meta["days"].setdefault(day, [])
+        if runs and runs[-1][1] == rows:
+            runs[-1][1] = rows + added
+        else:
+            runs.append([rows, rows + added])
+
+        meta["rows"] = rows + added
+        write_json_atomic(self.meta_path, meta)
+        return added
+
+    def rebuild_index(self) -> None:
+        """Recreate the day ranges and postings files from the column data."""
+        meta = self.meta()
+        rows = int(meta["rows"])
+        meta["days"] = {}
+        meta["postings"] = {column: {} for column in DICTIONARY_COLUMNS}
+        postings_dir = self.directory / "postings"
+        postings_dir.mkdir(parents=True, exist_ok=True)
+        for path in postings_dir.glob("*.u32"):
+            path.unlink()
+
+        timestamps = self.read_column("timestamp", 0, rows)
+        for row, timestamp in enumerate(timestamps):
+            day = from_micros(timestamp).date().isoformat()
+            runs = meta["days"].setdefault(day, [])
+            if runs and runs[-1][1] == row:
+                runs[-1][1] = row + 1
+            else:
+                runs.append([row, row + 1])
+
+        for column in DICTIONARY_COLUMNS:
+            by_code: Dict[int, array] = {}
+            for row, code in enumerate(self.read_column(column, 0, rows)):
+                by_code.setdefault(code, array(POSTING_TYPECODE)).append(row)
+            for code, row_ids in by_code.items():
+                append_array(self.posting_path(column, code), row_ids, committed=0)
+                meta["postings"][column][str(code)] = len(row_ids)
+
+        meta["version"] = HISTORY_VERSION
+        write_json_atomic(self.meta_path, meta)
+
+    def postings(self, column: str, value: str) -> Optional[PostingList]:
+        """Row ids for ``value`` in ``column``, or ``None`` if it never occurs."""
+        meta = self.meta()
+        try:
+            code = meta["dictionaries"][column].index(value)
+        except ValueError:
+            return None
+        count = meta["postings"][column].get(str(code), 0)
+        return PostingList(self.posting_path(column, code), count)
+
+    def day_ranges(
+        self, start: Optional[date] = None, end: Optional[date] = None
+    ) -> List[Tuple[int, int]]:
+        """Row ranges appended on UTC dates within ``[start, end]``, in row order."""
+        ranges = []
+        for day, runs in self.meta()["days"].items():
+            if start is not None and day < start.isoformat():
+                continue
+            if end is not None and day > end.isoformat():
+                continue
+            ranges.extend((run_start, run_stop) for run_start, run_stop in runs)
+        return sorted(ranges)
+
+    def read_column(self, column: str, start: int = 0, stop: Optional[int] = None):
+        """Read rows ``[start, stop)`` of one column as an ``array.array``."""
+        typecode = COLUMNS[column]
+        stop = self.rows if stop is None else min(stop, self.rows)
+        values = array(typecode)
+        if stop <= start:
+            return values
+        with open(self.column_path(column), "rb") as handle:
+            handle.seek(start * values.itemsize)
+            values.fromfile(handle, stop - start)
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values
+
+    def read_rows(self, column: str, row_ids: Sequence[int]) -> array:
+        """Read the given sorted rows of one column, one seek per contiguous run."""
+        values = array(COLUMNS[column])
+        with open(self.column_path(column), "rb") as handle:
+            for run_start, run_stop in contiguous_runs(row_ids):
+                handle.seek(run_start * values.itemsize)
+                values.fromfile(handle, run_stop - run_start)
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values
+
+    def load(self) -> HistoryColumns:
+        """Load every committed row, as NumPy arrays when NumPy is available."""
+        rows = self.rows
+        loaded = {}
+        for column, typecode in COLUMNS.items():
+            path = self.column_path(column)
+            if numpy is not None:
+                if rows:
+                    loaded[column] = numpy.fromfile(
+                        path, dtype=NUMPY_DTYPES[typecode], count=rows
+                    )
+                else:
+                    loaded[column] = numpy.empty(0, dtype=NUMPY_DTYPES[typecode])
+            else:
+                loaded[column] = self.read_column(column)
+        dictionaries = self.meta()["dictionaries"]
+        return HistoryColumns(
+            slugs=list(dictionaries["slug"]),
+            sources=list(dictionaries["source"]),
+            currencies=list(dictionaries["currency"]),
+            **loaded,
+        )
+
+
+def query(
+    store: HistoryStore,
+    slug: Optional[str] = None,
+    source: Optional[str] = None,
+    currency: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> List[HistoryQuote]:
+    """Quotes matching every given filter, oldest first.
+
+    ``start`` and ``end`` are inclusive UTC dates. Only the index entries for
+    the requested dates and values are read, followed by the matching rows.
+    """
+    ranges = store.day_ranges(start, end)
+    filters = {"slug": slug, "source": source, "currency": currency}
+    posting_lists: List[PostingList] = []
+    try:
+        for column, value in filters.items():
+            if value is None:
+                continue
+            postings = store.postings(column, value)
+            if postings is None:
+                return []
+            posting_lists.append(postings)
+
+        row_ids: List[int] = []
+        for range_start, range_stop in ranges:
+            if not posting_lists:
+                row_ids.extend(range(range_start, range_stop))
+                continue
+            candidates = [
+                postings.between(range_start, range_stop) for postings in posting_lists
+            ]
+            candidates.sort(key=len)
+            matched = set(candidates[0])
+            for other in candidates[1:]:
+                matched.intersection_update(other)
+            row_ids.extend(sorted(matched))
+    finally:
+        for postings in posting_lists:
+            postings.close()
+
+    if not row_ids:
+        return []
+    dictionaries = store.meta()["dictionaries"]
+    columns = {column: store.read_rows(column, row_ids) for column in COLUMNS}
+    return [
+        HistoryQuote(
+            fetched_at=from_micros(columns["timestamp"][i]),
+            slug=dictionaries["slug"][columns["slug"][i]],
+            source=dictionaries["source"][columns["source"][i]],
+            currency=dictionaries["currency"][columns["currency"][i]],
+            price=columns["price"][i],
+        )
+        for i in range(len(row_ids))
+    ]
+
+
+def snapshot_quotes(payload: Dict[str, object]) -> List[PriceResult]:
+    return [PriceResult(**quote) for quote in payload.get("quotes", [])]
+
+
+def import_snapshots(store: HistoryStore, paths: Sequence[Path]) -> int:
+    """Append snapshot files and intraday logs to ``store``, one run at a time.
+
+    Files are read one at a time in date order; every run they hold is
+    appended under its own ``fetched_at``.
+    """
+    added = 0
+    for path in sorted(paths, key=lambda path: (snapshot_date(path) or date.min, path.name)):
+        for batch in read_batches(path):
+            fetched_at = datetime.fromisoformat(batch["fetched_at"])
+            added += store.append(fetched_at, snapshot_quotes(batch))
+    return added
+
+
+def snapshot_date(path: Path) -> Optional[date]:
+    """The date a daily snapshot file is named after, or ``None`` for other files."""
+    try:
+        return datetime.strptime(path.name.split(".")[0], SNAPSHOT_DATE_FORMAT).date()
+    except ValueError:
+        return None
+
+
+def daily_snapshot_paths(
+    data_dir: Path, start: Optional[date] = None, end: Optional[date] = None
+) -> List[Path]:
+    """Daily snapshot files in date order, pruned to ``[start, end]`` by name alone.
+
+    Compressed snapshots count too; if a day has several, the uncompressed
+    one wins.
+    """
+    by_day: Dict[date, Path] = {}
+    for path in sorted(data_dir.glob("*.json*")):
+        if not path.name.endswith(SNAPSHOT_SUFFIXES):
+            continue
+        day = snapshot_date(path)
+        if day is None:
+            continue
+        if (start is not None and day < start) or (end is not None and day > end):
+            continue
+        by_day.setdefault(day, path)
+    return [by_day[day] for day in sorted(by_day)]
+
+
+def intraday_log_paths(
+    data_dir: Path, start: Optional[date] = None, end: Optional[date] = None
+) -> List[Path]:
+    """Intraday logs under ``data_dir`` not yet compacted, in date order."""
+    dated = []
+    for path in (data_dir / INTRADAY_DIR).glob(f"*{INTRADAY_SUFFIX}"):
+        day = snapshot_date(path)
+        if day is None:
+            continue
+        if (start is not None and day < start) or (end is not None and day > end):
+            continue
+        dated.append((day, path))
+    return [path for _, path in sorted(dated)]
+
+
+def iter_snapshot_quotes(
+    data_dir: Path,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    fields: Optional[Sequence[str]] = None,
+) -> Iterator[object]:
+    """Lazily yield every quote in the daily snapshots, oldest run first.
+
+    Files dated outside ``[start, end]`` are skipped without being opened, and
+    only one snapshot is held in memory at a time, so memory use does not grow
+    with the size of the archive. Without ``fields`` each quote is a
+    :class:`PriceResult`; with them it is a tuple of those fields, which may
+    also name the run's ``date`` and ``fetched_at``. Intraday logs are only
+    covered once they have been compacted into their daily snapshot.
+    """
+    if fields is not None:
+        unknown = [field for field in fields if field not in SNAPSHOT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown snapshot field(s): {', '.join(unknown)}")
+
+    for path in daily_snapshot_paths(data_dir, start, end):
+        for batch in read_batches(path):
+            for quote in batch.get("quotes", []):
+                if fields is None:
+                    yield PriceResult(**quote)
+                else:
+                    yield tuple(
+                        batch.get(field) if field in SNAPSHOT_META_FIELDS else quote.get(field)
+                        for field in fields
+                    )
+
+
+def record_snapshot(
+    store: HistoryStore,
+    data_dir: Path,
+    fetched_at: datetime,
+    quotes: Sequence[PriceResult],
+) -> int:
+    """Add a freshly written snapshot to the history.
+
+    An empty store is seeded from every daily file and intraday log in
+    ``data_dir`` instead, which already include the snapshot just written.
+    """
+    if store.rows:
+        return store.append(fetched_at, quotes)
+    return import_snapshots(
+        store, daily_snapshot_paths(data_dir) + intraday_log_paths(data_dir)
+    )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Manage the columnar price history")
+    parser.add_argument(
+        "--history-dir",
+        type=Path,
+        default=Path("data/history"),
+        help="Directory holding the columnar history store",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser(
+        "import",
+        help="Append the daily snapshots and intraday logs to an empty history store",
+    )
+    import_parser.add_argument(
+        "--data-dir",
+        type=Path,
+        default=Path("data"),
+        help="Directory containing YYYY-MM-DD.json snapshots",
+    )
+
+    query_parser = commands.add_parser("query", help="Print quotes matching the filters")
+    query_parser.add_argument("--slug", help="Coin slug, e.g. bitcoin")
+    query_parser.add_argument("--source", help="Source name, e.g. kraken")
+    query_parser.add_argument("--currency", help="Quote currency, e.g. EUR")
+    query_parser.add_argument(
+        "--start", type=date.fromisoformat, help="First UTC date to include (YYYY-MM-DD)"
+    )
+    query_parser.add_argument(
+        "--end", type=date.fromisoformat, help="Last UTC date to include (YYYY-MM-DD)"
+    )
+    query_parser.add_argument(
+        "--format", choices=["csv", "json"], default="csv", help="Output format"
+    )
+
+    args = parser.parse_args(argv)
+    store = HistoryStore(args.history_dir)
+
+    if args.command == "import":
+        if store.rows:
+            print(f"{args.history_dir} already holds {store.rows} rows", file=sys.stderr)
+            return 1
+        paths = daily_snapshot_paths(args.data_dir) + intraday_log_paths(args.data_dir)
+        added = import_snapshots(store, paths)
+        print(f"Imported {added} quotes into {args.history_dir}")
+    elif args.command == "query":
+        quotes = query(
+            store,
+            slug=args.slug,
+            source=args.source,
+            currency=args.currency,
+            start=args.start,
+            end=args.end,
+        )
+        records = [
+            {**asdict(quote), "fetched_at": quote.fetched_at.isoformat()} for quote in quotes
+        ]
+        if args.format == "json":
+            print(json.dumps(records, indent=2))
+        else:
+            writer = csv.DictWriter(sys.stdout, fieldnames=QUERY_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, replace
-from typing import Dict, Iterable, List, Protocol, Sequence
+import sys
+from array import array
+from dataclasses import dataclass, fields
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Protocol, Sequence, Tuple
 
+from scrapers.timing import span
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class PriceResult:
     slug: str
     symbol: str
@@ -16,19 +20,144 @@ class PriceResult:
     url: str
 
 
+PRICE_FIELDS = tuple(field.name for field in fields(PriceResult))
+# Columns with few distinct values; interning lets every row share one string.
+INTERNED_FIELDS = frozenset({"slug", "symbol", "name", "source", "currency"})
+
+
+class PriceBatch:
+    """Many price results stored column by column.
+
+    Each field of :class:`PriceResult` is one list (``price`` is an
+    ``array('d')``), and the low-cardinality string columns are interned, so
+    a batch costs a few pointers per row instead of one object per result.
+    Iterating or indexing a batch builds :class:`PriceResult` objects on
+    demand.
+    """
+
+    __slots__ = PRICE_FIELDS
+
+    def __init__(self) -> None:
+        for field in PRICE_FIELDS:
+            setattr(self, field, array("d") if field == "price" else [])
+
+    @classmethod
+    def from_results(
+        cls, results: Iterable[PriceResult], source: Optional[str] = None
+    ) -> "PriceBatch":
+        batch = cls()
+        batch.extend(results, source=source)
+        return batch
+
+    def extend(self, results: Iterable[PriceResult], source: Optional[str] = None) -> None:
+        """Append ``results``, tagging every row with ``source`` when given."""
+        intern = sys.intern
+        if source is not None:
+            source = intern(source)
+        for result in results:
+            self.slug.append(intern(result.slug))
+            self.symbol.append(intern(result.symbol))
+            self.name.append(intern(result.name))
+            self.source.append(source if source is not None else intern(result.source))
+            self.raw.append(result.raw)
+            self.price.append(result.price)
+            self.currency.append(intern(result.currency))
+            self.url.append(result.url)
+
+    def column(self, field: str) -> Sequence[object]:
+        if field not in PRICE_FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def records(self) -> List[Dict[str, object]]:
+        """Every row as a plain dict, keyed like :func:`dataclasses.asdict`."""
+        columns = [getattr(self, field) for field in PRICE_FIELDS]
+        return [dict(zip(PRICE_FIELDS, row)) for row in zip(*columns)]
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+    def __getitem__(self, index: int) -> PriceResult:
+        return PriceResult(*(getattr(self, field)[index] for field in PRICE_FIELDS))
+
+    def __iter__(self) -> Iterator[PriceResult]:
+        columns = [getattr(self, field) for field in PRICE_FIELDS]
+        for row in zip(*columns):
+            yield PriceResult(*row)
+
+
+class MissingPrices(RuntimeError):
+    """A source found prices for only some coins.
+
+    ``results`` holds the prices that were found and ``misses`` the slugs
+    that were not, so callers can keep the former and retry or report the
+    latter. A source quoting in several currencies also gives, in
+    ``currencies``, the currencies each missing coin lacks.
+    """
+
+    def __init__(
+        self,
+        results: Sequence[PriceResult],
+        misses: Sequence[str],
+        currencies: Optional[Mapping[str, Sequence[str]]] = None,
+    ) -> None:
+        self.results = list(results)
+        self.misses = list(misses)
+        self.currencies = {slug: list(codes) for slug, codes in (currencies or {}).items()}
+        super().__init__(f"Could not find price for {', '.join(self.misses)}")
+
+    def errors(self, source: str) -> List[Dict[str, str]]:
+        """One error entry per missing coin and currency, in the shape ``errors`` uses."""
+        errors: List[Dict[str, str]] = []
+        for slug in self.misses:
+            codes = self.currencies.get(slug)
+            if not codes:
+                errors.append(
+                    {"source": source, "slug": slug, "error": f"Could not find price for {slug}"}
+                )
+                continue
+            for code in codes:
+                errors.append(
+                    {
+                        "source": source,
+                        "slug": slug,
+                        "currency": code,
+                        "error": f"Could not find {code} price for {slug}",
+                    }
+                )
+        return errors
+
+
 class Scraper(Protocol):
     name: str
 
     def fetch(self) -> Sequence[PriceResult]:
         ...
 
-def merge_results(results: Iterable[tuple[str, Sequence[PriceResult]]]) -> List[PriceResult]:
-    merged: List[PriceResult] = []
+def merge_results(results: Iterable[tuple[str, Sequence[PriceResult]]]) -> PriceBatch:
+    """Collect every scraper's results into one batch, tagged with its source."""
+    merged = PriceBatch()
     for source, data in results:
-        for entry in data:
-            merged.append(replace(entry, source=source))
+        merged.extend(data, source=source)
     return merged
 
 
+def fetch_source(
+    scraper: Scraper,
+) -> Tuple[Optional[Sequence[PriceResult]], List[Dict[str, str]]]:
+    """Run one scraper, returning whatever it found and its errors.
+
+    A :class:`MissingPrices` failure keeps the prices that were found and
+    reports each missing coin separately; any other failure loses the source.
+    """
+    try:
+        with span("fetch", source=scraper.name):
+            return scraper.fetch(), []
+    except MissingPrices as exc:
+        return exc.results, exc.errors(scraper.name)
+    except Exception as exc:
+        return None, [{"source": scraper.name, "error": str(exc)}]
+
+
 def list_sources(scrapers: Iterable[Scraper]) -> List[str]:
     return [scraper.name for scraper in scrapers]
@@ -1,11 +1,18 @@
 from __future__ import annotations
 
-from typing import Dict, Iterable, List
+import hashlib
+import json
+import time
+from http.client import HTTPException
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
-from playwright.sync_api import sync_playwright
-
-from scrapers import PriceResult
+from scrapers import MissingPrices, PriceResult
 from scrapers.coins import COINS, CoinConfig
+from scrapers.http_client import HttpClient
+from scrapers.recording import Recording
+from scrapers.response_cache import ResponseCache, Validated
+from scrapers.retry import NO_RETRY, RetryPolicy, fetch_with_retries
+from scrapers.timing import span, timed
 
 STATIC_URL = (
     "https://www.binance.com/bapi/asset/v2/friendly/asset-service/"
@@ -16,67 +23,192 @@ DYNAMIC_URL = (
     "product/get-product-dynamic?includeEtf=true"
 )
 HOME_URL = "https://www.binance.com/en/markets/overview"
-
-
-def fetch_prices(coins: Iterable[CoinConfig]) -> List[PriceResult]:
+# The product list only changes when pairs are listed or delisted.
+STATIC_MAX_AGE = 60 * 60
+QUOTES = ("USDT",)
+
+PairMap = Dict[Tuple[str, str], str]
+
+# The pair map of the last product list seen, keyed by a hash of its body.
+_pair_maps: Dict[str, PairMap] = {}
+
+
+def pair_map(static_data: Iterable[dict]) -> PairMap:
+    """Binance's trading pairs by ``(base, quote)``, from its product list."""
+    return {
+        (entry.get("b"), entry.get("q")): entry["s"] for entry in static_data if entry.get("s")
+    }
+
+
+def cached_pair_map(static_body: bytes, cache: Optional[ResponseCache] = None) -> PairMap:
+    """The pair map of a product list body, built once per distinct body.
+
+    It is kept in memory and, with a ``cache``, on disk for later runs, so an
+    unchanged product list is never parsed again.
+    """
+    digest = hashlib.sha1(static_body).hexdigest()
+    pairs = _pair_maps.get(digest)
+    if pairs is not None:
+        return pairs
+    key = f"binance:pairs:{digest}"
+    stored = cache.get(key) if cache is not None else None
+    if stored is not None:
+        pairs = {(base, quote): pair for base, quote, pair in json.loads(stored.body)}
+    else:
+        pairs = pair_map(json.loads(static_body).get("data", []))
+        if cache is not None:
+            triples = [[base, quote, pair] for (base, quote), pair in pairs.items()]
+            cache.put(key, Validated(json.dumps(triples).encode(), stored_at=time.time()))
+    _pair_maps.clear()
+    _pair_maps[digest] = pairs
+    return pairs
+
+
+@timed("api.match")
+def match_market_data(
+    pairs: PairMap,
+    dynamic_data: List[dict],
+    coins: Iterable[CoinConfig],
+    quotes: Sequence[str] = QUOTES,
+) -> List[PriceResult]:
+    """Look up each tracked coin's pair in every quote and read its price from the tickers.
+
+    One pass over the tickers serves every quote; a coin with no pair in
+    some quote simply has no price in it.
+    """
     results: List[PriceResult] = []
-    coins_by_symbol = {coin.symbol: coin for coin in coins}
-
-    with sync_playwright() as playwright:
-        request = playwright.request.new_context()
-
-        static_res = request.get(STATIC_URL)
-        dynamic_res = request.get(DYNAMIC_URL)
-        if not static_res.ok or not dynamic_res.ok:
-            raise RuntimeError("Failed to fetch Binance market data")
-
-        static_data = static_res.json().get("data", [])
-        dynamic_data = dynamic_res.json().get("data", [])
-
-        dynamic_map = {item.get("s"): item for item in dynamic_data}
-
-        for entry in static_data:
-            if entry.get("q") != "USDT":
-                continue
-            symbol = entry.get("b")
-            coin = coins_by_symbol.get(symbol)
-            if not coin:
-                continue
-            pair = entry.get("s")
-            dynamic = dynamic_map.get(pair)
-            if not dynamic:
-                continue
-            last_price = dynamic.get("c")
-            if not last_price:
-                continue
-            try:
-                price = float(last_price)
-            except ValueError:
-                continue
-
-            results.append(
-                PriceResult(
-                    slug=coin.slug,
-                    symbol=coin.symbol,
-                    name=coin.name,
-                    source="",
-                    raw=last_price,
-                    price=price,
-                    currency="USDT",
-                    url=HOME_URL,
-                )
+    wanted: Dict[str, Tuple[CoinConfig, str]] = {}
+    for coin in coins:
+        for quote in quotes:
+            pair = pairs.get((coin.symbol, quote))
+            if pair:
+                wanted[pair] = (coin, quote)
+    if not wanted:
+        return results
+
+    for dynamic in dynamic_data:
+        match = wanted.get(dynamic.get("s"))
+        if not match:
+            continue
+        coin, quote = match
+        last_price = dynamic.get("c")
+        if not last_price:
+            continue
+        try:
+            price = float(last_price)
+        except ValueError:
+            continue
+
+        results.append(
+            PriceResult(
+                slug=coin.slug,
+                symbol=coin.symbol,
+                name=coin.name,
+                source="",
+                raw=last_price,
+                price=price,
+                currency=quote,
+                url=HOME_URL,
             )
+        )
 
-        request.dispose()
+    return results
 
+
+def download_bodies(client: Optional[HttpClient] = None) -> Dict[str, bytes]:
+    """Fetch the product list and the tickers in parallel, without a browser.
+
+    The product list is reused for ``STATIC_MAX_AGE`` seconds when the
+    client has kept it, and revalidated after that.
+    """
+    urls = [STATIC_URL, DYNAMIC_URL]
+    own_client = client is None
+    client = client or HttpClient()
+    try:
+        with span("download"):
+            bodies = client.get_many(urls, max_age={STATIC_URL: STATIC_MAX_AGE})
+    except (OSError, HTTPException, RuntimeError) as exc:
+        raise RuntimeError("Failed to fetch Binance market data") from exc
+    finally:
+        if own_client:
+            client.close()
+    return dict(zip(urls, bodies))
+
+
+def download_documents(client: Optional[HttpClient] = None) -> Dict[str, dict]:
+    return {url: json.loads(body) for url, body in download_bodies(client).items()}
+
+
+def require_all_quotes(
+    results: List[PriceResult],
+    pairs: PairMap,
+    coins: Iterable[CoinConfig],
+    quotes: Sequence[str],
+) -> List[PriceResult]:
+    """Return ``results``, or raise :class:`MissingPrices` for every coin
+    with a pair in one of ``quotes`` but no price for it.
+
+    A coin without a pair is not listed in that quote and no retry can
+    change that, so it is skipped rather than reported.
+    """
+    priced = {(result.slug, result.currency) for result in results}
+    missed: Dict[str, List[str]] = {}
+    for coin in coins:
+        for quote in quotes:
+            if (coin.symbol, quote) in pairs and (coin.slug, quote) not in priced:
+                missed.setdefault(coin.slug, []).append(quote)
+    if missed:
+        raise MissingPrices(results, list(missed), missed)
     return results
 
 
+def fetch_prices(
+    coins: Iterable[CoinConfig],
+    recording: Optional[Recording] = None,
+    client: Optional[HttpClient] = None,
+    quotes: Sequence[str] = QUOTES,
+) -> List[PriceResult]:
+    coins = list(coins)
+    if recording is None:
+        bodies = download_bodies(client)
+        cache = client.cache if client is not None else None
+        pairs = cached_pair_map(bodies[STATIC_URL], cache)
+        dynamic_data = json.loads(bodies[DYNAMIC_URL]).get("data", [])
+    else:
+        if recording.replay:
+            documents = recording.load_documents("binance")
+        else:
+            documents = download_documents(client)
+            recording.save_documents("binance", documents)
+        pairs = pair_map(documents.get(STATIC_URL, {}).get("data", []))
+        dynamic_data = documents.get(DYNAMIC_URL, {}).get("data", [])
+    results = match_market_data(pairs, dynamic_data, coins, quotes)
+    return require_all_quotes(results, pairs, coins, quotes)
+
+
 class BinanceScraper:
     name = "binance"
 
-    def __init__(self, coins: Iterable[CoinConfig] = COINS) -> None:
+    def __init__(
+        self,
+        coins: Iterable[CoinConfig] = COINS,
+        retry: RetryPolicy = NO_RETRY,
+        recording: Optional[Recording] = None,
+        cache: Optional[ResponseCache] = None,
+        quotes: Sequence[str] = QUOTES,
+    ) -> None:
         self._coins = list(coins)
+        self._retry = retry
+        self._recording = recording
+        self._quotes = list(quotes)
+        # Kept across fetches so connections and validators are reused.
+        self._client = HttpClient(cache=cache)
 
     def fetch(self) -> List[PriceResult]:
-        return fetch_prices(self._coins)
+        return fetch_with_retries(
+            lambda coins: fetch_prices(
+                coins, recording=self._recording, client=self._client, quotes=self._quotes
+            ),
+            self._coins,
+            self._retry,
+        )
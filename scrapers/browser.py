@@ -0,0 +1,403 @@
+from __future__ import annotations
+
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterator, List, Mapping, Optional, Sequence, Set, Tuple
+from urllib.parse import urlsplit
+
+from playwright.sync_api import sync_playwright
+
+from scrapers.recording import Recording
+from scrapers.storage_state import StorageStates
+from scrapers.timing import span
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36"
+)
+LAUNCH_ARGS = ["--disable-blink-features=AutomationControlled"]
+HIDE_WEBDRIVER_SCRIPT = (
+    "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+)
+
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "media", "font"})
+BLOCKED_HOSTS = (
+    "doubleclick.net",
+    "googlesyndication.com",
+    "googletagmanager.com",
+    "google-analytics.com",
+    "googleadservices.com",
+    "adservice.google.com",
+    "amazon-adsystem.com",
+    "criteo.com",
+    "taboola.com",
+    "outbrain.com",
+    "scorecardresearch.com",
+    "quantserve.com",
+    "hotjar.com",
+    "facebook.net",
+    "twitter.com",
+    "ads-twitter.com",
+    "linkedin.com",
+    "bing.com",
+    "clarity.ms",
+    "segment.io",
+    "segment.com",
+    "mixpanel.com",
+    "amplitude.com",
+    "intercom.io",
+    "onetrust.com",
+    "cookielaw.org",
+    "youtube.com",
+    "ytimg.com",
+    "vimeo.com",
+)
+
+
+def host_matches(host: str, domains: Sequence[str]) -> bool:
+    return any(host == domain or host.endswith(f".{domain}") for domain in domains)
+
+
+@dataclass(frozen=True)
+class ResourcePolicy:
+    """Which requests a source's context aborts before they hit the network.
+
+    ``blocked_types`` are Playwright resource types. ``blocked_hosts`` match a
+    host and its subdomains. When ``allowed_hosts`` is set, every other host is
+    blocked too.
+    """
+
+    blocked_types: FrozenSet[str] = BLOCKED_RESOURCE_TYPES
+    blocked_hosts: Tuple[str, ...] = BLOCKED_HOSTS
+    allowed_hosts: Tuple[str, ...] = ()
+
+    def blocks(self, resource_type: str, url: str) -> bool:
+        if resource_type in self.blocked_types:
+            return True
+        host = urlsplit(url).hostname or ""
+        if self.allowed_hosts and not host_matches(host, self.allowed_hosts):
+            return True
+        return host_matches(host, self.blocked_hosts)
+
+    def install(self, context) -> None:
+        def handle(route) -> None:
+            request = route.request
+            if self.blocks(request.resource_type, request.url):
+                route.abort()
+            else:
+                route.fallback()
+
+        context.route("**/*", handle)
+
+
+DEFAULT_RESOURCE_POLICY = ResourcePolicy()
+
+
+DEVTOOLS_PORT_TIMEOUT = 10.0
+
+
+def devtools_port(user_data_dir: Path, timeout: float = DEVTOOLS_PORT_TIMEOUT) -> int:
+    """The port Chromium bound for ``--remote-debugging-port=0``.
+
+    Chromium picks the port itself and writes it on the first line of
+    ``DevToolsActivePort`` in its profile, so no other process can take it
+    between choosing and binding.
+    """
+    path = user_data_dir / "DevToolsActivePort"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            lines = path.read_text().splitlines()
+        except OSError:
+            lines = []
+        if lines and lines[0].strip().isdigit():
+            return int(lines[0])
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"Chromium did not report its DevTools port in {path}")
+        time.sleep(0.05)
+
+
+class _BrowserHost:
+    """Owns the one Chromium a pool launches, on a thread of its own.
+
+    Sync Playwright objects are bound to the thread that created them, so
+    the browser is launched and closed on this thread, and every thread that
+    borrows from the pool connects to it over CDP (:attr:`endpoint`) with a
+    Playwright instance of its own. The endpoint listens on 127.0.0.1 only,
+    on a port Chromium chose, in a throwaway profile that is deleted with it.
+    """
+
+    def __init__(self, headless: bool, launch_args: Sequence[str]) -> None:
+        self.endpoint: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(headless, list(launch_args)), name="browser-host", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, headless: bool, launch_args: List[str]) -> None:
+        with tempfile.TemporaryDirectory(prefix="scrapers-chromium-") as user_data_dir:
+            try:
+                manager = sync_playwright()
+                playwright = manager.start()
+                try:
+                    # A persistent context, so the profile holding
+                    # DevToolsActivePort is known; pages go in contexts of
+                    # their own on the connected browser.
+                    browser = playwright.chromium.launch_persistent_context(
+                        user_data_dir,
+                        headless=headless,
+                        args=[
+                            *launch_args,
+                            "--remote-debugging-address=127.0.0.1",
+                            "--remote-debugging-port=0",
+                        ],
+                    )
+                    try:
+                        port = devtools_port(Path(user_data_dir))
+                    except BaseException:
+                        browser.close()
+                        raise
+                except BaseException:
+                    manager.stop()
+                    raise
+            except BaseException as exc:
+                self.error = exc
+                self._ready.set()
+                return
+            self.endpoint = f"http://127.0.0.1:{port}"
+            self._ready.set()
+            self._stop.wait()
+            try:
+                browser.close()
+            finally:
+                manager.stop()
+
+    def wait(self) -> str:
+        """The browser's CDP endpoint, once it has been launched."""
+        self._ready.wait()
+        if self.error is not None:
+            raise RuntimeError("Could not launch Chromium") from self.error
+        return self.endpoint
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+class _Session:
+    def __init__(self, manager, playwright, browser) -> None:
+        self.manager = manager
+        self.playwright = playwright
+        self.browser = browser
+        self.contexts: Dict[str, object] = {}
+        self.idle_pages: Dict[str, List[object]] = {}
+        # Sources whose storage state was saved, or must not be, this session.
+        self.saved_states: Set[str] = set()
+        self.failed: Set[str] = set()
+
+    def close(self) -> None:
+        for context in self.contexts.values():
+            context.close()
+        self.contexts.clear()
+        self.idle_pages.clear()
+        self.browser.close()
+        self.manager.stop()
+
+
+class BrowserPool:
+    """Launches Chromium once and hands out pages from per-source contexts.
+
+    Sync Playwright objects cannot cross threads, so the browser lives on a
+    thread of the pool's own and every thread that borrows from the pool
+    connects to it with its own Playwright instance: one browser is launched
+    however many threads scrape at once. Each source gets its own isolated
+    context inside that browser, and pages are returned to the pool after
+    use so the next borrow for the same source skips ``new_page``. Threads
+    must call :meth:`release` when they are done with the pool, and its owner
+    :meth:`close` (or use it as a context manager) to shut the browser down.
+
+    Unless ``block_resources`` is off, every context gets a
+    :class:`ResourcePolicy` (``resource_policies`` overrides it per source,
+    ``None`` disables it for that source). With a ``recording``, every
+    context's traffic is recorded to it or replayed from it. With ``states``,
+    every context starts from its source's saved cookies and local storage,
+    and saves them again once a page was used without error and when the
+    browser is released; a page that fails invalidates its source's state.
+    """
+
+    def __init__(
+        self,
+        headless: bool = True,
+        launch_args: Sequence[str] = LAUNCH_ARGS,
+        block_resources: bool = True,
+        resource_policies: Optional[Mapping[str, Optional[ResourcePolicy]]] = None,
+        recording: Optional[Recording] = None,
+        states: Optional[StorageStates] = None,
+    ) -> None:
+        self._headless = headless
+        self._launch_args = list(launch_args)
+        self._block_resources = block_resources
+        self._resource_policies = dict(resource_policies or {})
+        self._recording = recording
+        self._states = states
+        self._local = threading.local()
+        self._host: Optional[_BrowserHost] = None
+        self._host_lock = threading.Lock()
+
+    def _endpoint(self) -> str:
+        with self._host_lock:
+            if self._host is None:
+                self._host = _BrowserHost(self._headless, self._launch_args)
+            host = self._host
+        try:
+            return host.wait()
+        except RuntimeError:
+            # Let the next borrow try a fresh launch.
+            with self._host_lock:
+                if self._host is host:
+                    self._host = None
+            raise
+
+    def _session(self) -> _Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            with span("browser.launch"):
+                endpoint = self._endpoint()
+            with span("browser.connect"):
+                manager = sync_playwright()
+                playwright = manager.start()
+                try:
+                    browser = playwright.chromium.connect_over_cdp(endpoint)
+                except BaseException:
+                    manager.stop()
+                    raise
+            session = _Session(manager, playwright, browser)
+            self._local.session = session
+        return session
+
+    def resource_policy(self, source: str) -> Optional[ResourcePolicy]:
+        if not self._block_resources:
+            return None
+        return self._resource_policies.get(source, DEFAULT_RESOURCE_POLICY)
+
+    def context(self, source: str, init_script: Optional[str] = None):
+        session = self._session()
+        context = session.contexts.get(source)
+        if context is None:
+            with span("browser.context"):
+                options: Dict[str, object] = {"user_agent": USER_AGENT}
+                if self._recording is not None:
+                    options.update(self._recording.context_options(source))
+                state = self._states.load(source, USER_AGENT) if self._states else None
+                if state is not None:
+                    options["storage_state"] = state
+                try:
+                    context = session.browser.new_context(**options)
+                except Exception:
+                    if state is None:
+                        raise
+                    # A state Playwright rejects is as good as none.
+                    self._states.invalidate(source)
+                    del options["storage_state"]
+                    context = session.browser.new_context(**options)
+                if init_script:
+                    context.add_init_script(init_script)
+                policy = self.resource_policy(source)
+                if policy is not None:
+                    policy.install(context)
+                if self._recording is not None:
+                    # Routes added last are tried first, so the HAR wins.
+                    try:
+                        self._recording.install(source, context)
+                    except Exception:
+                        context.close()
+                        raise
+            session.contexts[source] = context
+        return context
+
+    @contextmanager
+    def page(self, source: str, init_script: Optional[str] = None) -> Iterator[object]:
+        context = self.context(source, init_script=init_script)
+        idle = self._session().idle_pages.setdefault(source, [])
+        if idle:
+            page = idle.pop()
+        else:
+            with span("browser.new_page"):
+                page = context.new_page()
+        try:
+            yield page
+        except BaseException:
+            page.close()
+            self._discard_state(source)
+            raise
+        idle.append(page)
+        if source not in self._session().saved_states:
+            self._save_state(source)
+
+    def _save_state(self, source: str) -> None:
+        session = self._session()
+        context = session.contexts.get(source)
+        if self._states is None or context is None or source in session.failed:
+            return
+        session.saved_states.add(source)
+        try:
+            with span("browser.save_state"):
+                state = context.storage_state()
+                self._states.save(source, USER_AGENT, state)
+        except Exception:
+            # Losing the state only costs the next run a cold start.
+            pass
+
+    def _discard_state(self, source: str) -> None:
+        if self._states is None:
+            return
+        self._session().failed.add(source)
+        self._states.invalidate(source)
+
+    def release(self) -> None:
+        """Close the calling thread's contexts and connection, if any."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            return
+        for source in list(session.contexts):
+            self._save_state(source)
+        self._local.session = None
+        with span("browser.close"):
+            session.close()
+
+    def close(self) -> None:
+        """Release the calling thread and shut the browser down."""
+        self.release()
+        with self._host_lock:
+            host, self._host = self._host, None
+        if host is not None:
+            with span("browser.shutdown"):
+                host.close()
+
+    def __enter__(self) -> "BrowserPool":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+@contextmanager
+def open_page(
+    pool: Optional[BrowserPool], source: str, init_script: Optional[str] = None
+) -> Iterator[object]:
+    """Borrow a page from ``pool``, or from a throwaway pool when none is given."""
+    if pool is not None:
+        with pool.page(source, init_script=init_script) as page:
+            yield page
+        return
+
+    with BrowserPool() as own_pool:
+        with own_pool.page(source, init_script=init_script) as page:
+            yield page
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import re
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from scrapers import PriceResult
+from scrapers.browser import host_matches
+from scrapers.coins import CoinConfig, CoinIndex
+from scrapers.timing import span
+
+NAME_KEYS = ("name", "shortName", "longName", "displayName", "fullName")
+SYMBOL_KEYS = ("symbol", "ticker", "base", "baseAsset")
+PRICE_KEYS = (
+    "price",
+    "current_price",
+    "currentPrice",
+    "regularMarketPrice",
+    "lastPrice",
+    "last_price",
+    "priceUsd",
+    "price_usd",
+)
+CURRENCY_KEYS = ("currency", "quoteCurrency", "quote_currency", "vs_currency")
+NESTED_QUOTE_KEYS = ("quote", "quotes")
+CURRENCY_CODE = re.compile(r"^[A-Z]{3,5}$")
+
+
+def iter_records(payload: object) -> Iterator[dict]:
+    """Yield every JSON object nested anywhere in ``payload``."""
+    stack = [payload]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            yield node
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+
+
+def as_price(value: object) -> Optional[Tuple[str, float]]:
+    if isinstance(value, dict):
+        value = value.get("raw")
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    elif isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            return None
+    else:
+        return None
+    if number <= 0:
+        return None
+    return str(value), number
+
+
+def first_string(record: dict, keys: Sequence[str]) -> Optional[str]:
+    for key in keys:
+        value = record.get(key)
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    return None
+
+
+def record_price(
+    record: dict, currency: str, assume_currency: bool = True
+) -> Optional[Tuple[str, float, str]]:
+    """A record's price as ``(raw, value, currency code)``.
+
+    A price without a currency code of its own is taken to be in
+    ``currency``, unless ``assume_currency`` is false.
+    """
+    for key in PRICE_KEYS:
+        price = as_price(record.get(key))
+        if price:
+            code = first_string(record, CURRENCY_KEYS)
+            if code is None or not CURRENCY_CODE.match(code.upper()):
+                if not assume_currency:
+                    break
+                code = currency
+            return price[0], price[1], code.upper()
+
+    # CoinMarketCap-style payloads keep prices under a per-currency quote,
+    # either {"quote": {"USD": {"price": ...}}} or {"quotes": [{"name": "USD", ...}]}.
+    for key in NESTED_QUOTE_KEYS:
+        nested = record.get(key)
+        if isinstance(nested, dict):
+            nested = nested.get(currency)
+        elif isinstance(nested, list):
+            nested = next(
+                (
+                    item
+                    for item in nested
+                    if isinstance(item, dict) and item.get("name") == currency
+                ),
+                None,
+            )
+        if isinstance(nested, dict):
+            price = as_price(nested.get("price"))
+            if price:
+                return price[0], price[1], currency
+    return None
+
+
+def record_coin(record: dict, index: CoinIndex) -> Optional[CoinConfig]:
+    name = first_string(record, NAME_KEYS)
+    symbol = first_string(record, SYMBOL_KEYS)
+    base = re.split(r"[-/]", symbol)[0].upper() if symbol else None
+
+    if name:
+        if name.endswith(" USD"):
+            name = name[: -len(" USD")]
+        coin = index.by_name(name)
+        if coin and base and not base.startswith(coin.symbol.upper()):
+            return None
+        return coin
+
+    if base:
+        return index.by_symbol(base)
+    return None
+
+
+def extract_json_prices(
+    payload: object,
+    index: CoinIndex,
+    url: str,
+    currency: str = "USD",
+    assume_currency: bool = True,
+) -> Dict[str, PriceResult]:
+    """Find tracked coins and their prices anywhere in a JSON payload.
+
+    A record counts when it names a tracked coin (by name, or by symbol when it
+    has no name) and carries a price under one of :data:`PRICE_KEYS`. With
+    ``assume_currency`` false, it must also name ``currency`` itself.
+    """
+    results: Dict[str, PriceResult] = {}
+    for record in iter_records(payload):
+        coin = record_coin(record, index)
+        if coin is None or coin.slug in results:
+            continue
+        price = record_price(record, currency, assume_currency)
+        if price is None:
+            continue
+        raw, value, code = price
+        if code != currency:
+            continue
+        results[coin.slug] = PriceResult(
+            slug=coin.slug,
+            symbol=coin.symbol,
+            name=coin.name,
+            source="",
+            raw=raw,
+            price=value,
+            currency=code,
+            url=url,
+        )
+    return results
+
+
+class ResponseCapture:
+    """Parses prices out of the JSON responses a page fetches while attached.
+
+    Only responses from ``hosts`` (and their subdomains) with a JSON content
+    type are considered; the first price seen for each coin wins, and
+    ``sources`` lists the URLs of the responses that had any. Use it as a
+    context manager around the navigation so the listener is removed before
+    the page goes back to the pool.
+    """
+
+    def __init__(
+        self,
+        page,
+        index: CoinIndex,
+        hosts: Sequence[str],
+        url: str,
+        currency: str = "USD",
+    ) -> None:
+        self._page = page
+        self._index = index
+        self._hosts = tuple(hosts)
+        self._url = url
+        self._currency = currency
+        self.results: Dict[str, PriceResult] = {}
+        self.sources: List[str] = []
+
+    @property
+    def complete(self) -> bool:
+        return all(coin.slug in self.results for coin in self._index)
+
+    def handle_response(self, response) -> None:
+        if self.complete:
+            return
+        try:
+            host = urlsplit(response.url).hostname or ""
+            if not host_matches(host, self._hosts):
+                return
+            if "json" not in response.headers.get("content-type", ""):
+                return
+            payload = response.json()
+        except Exception:
+            return
+        with span("capture.match"):
+            found = extract_json_prices(payload, self._index, self._url, self._currency)
+        if found:
+            self.sources.append(response.url)
+        for slug, price in found.items():
+            self.results.setdefault(slug, price)
+
+    def merge(self, fallback: Dict[str, PriceResult]) -> Dict[str, PriceResult]:
+        """Captured prices, topped up from ``fallback`` for coins the JSON lacked."""
+        merged = dict(fallback)
+        merged.update(self.results)
+        return merged
+
+    def __enter__(self) -> "ResponseCapture":
+        self._page.on("response", self.handle_response)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._page.remove_listener("response", self.handle_response)
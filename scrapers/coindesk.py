@@ -1,36 +1,52 @@
 from __future__ import annotations
 
-from typing import Dict, Iterable, Optional
+from typing import Dict, Iterable, Optional, Sequence, Tuple
 
-from playwright.sync_api import TimeoutError, sync_playwright
+from playwright.sync_api import TimeoutError
 
 from scrapers import PriceResult
-from scrapers.coins import COINS, CoinConfig
-from scrapers.utils import normalize_price_text
+from scrapers.browser import BrowserPool, open_page
+from scrapers.capture import ResponseCapture
+from scrapers.coins import COINS, CoinConfig, CoinIndex
+from scrapers.retry import (
+    NO_RETRY,
+    LatencyHistory,
+    RetryPolicy,
+    fetch_with_retries,
+    timed_wait,
+)
+from scrapers.table import (
+    ROW_SELECTOR,
+    TableSnapshot,
+    price_results,
+    require_all,
+    snapshot_table,
+)
+from scrapers.timing import span, timed
 
 HOME_URL = "https://www.coindesk.com/price"
 MAX_PAGES = 6
+API_HOSTS = ("coindesk.com",)
+TABLE_TIMEOUT = 15000
 
 
-def extract_price_from_row(row) -> Optional[str]:
-    cells = row.locator("td")
-    if cells.count() > 3:
-        candidate = cells.nth(3).inner_text().strip()
+def extract_price_from_row(cells: Sequence[str]) -> Optional[str]:
+    if len(cells) > 3:
+        candidate = cells[3].strip()
         if candidate:
             return candidate
 
-    for i in range(cells.count()):
-        candidate = cells.nth(i).inner_text().strip()
+    for cell in cells:
+        candidate = cell.strip()
         if candidate.startswith("$"):
             return candidate
 
     return None
 
 
-def parse_coin_from_row(row) -> Optional[str]:
-    cells = row.locator("td")
-    if cells.count() > 1:
-        name_cell = cells.nth(1).inner_text().strip()
+def parse_coin_from_row(cells: Sequence[str]) -> Optional[str]:
+    if len(cells) > 1:
+        name_cell = cells[1].strip()
         for line in name_cell.splitlines():
             name = line.strip()
             if name:
@@ -38,97 +54,78 @@ def parse_coin_from_row(row) -> Optional[str]:
     return None
 
 
-def fetch_coin_price_from_table(page, coin: CoinConfig) -> Optional[PriceResult]:
-    rows = page.locator("table tbody tr")
-    if rows.count() == 0:
-        raise RuntimeError("Could not find price table on CoinDesk")
-
-    candidates = rows.filter(has_text=coin.name)
-    for i in range(candidates.count()):
-        row = candidates.nth(i)
-        text = extract_price_from_row(row)
-        if text:
-            return PriceResult(
-                slug=coin.slug,
-                symbol=coin.symbol,
-                name=coin.name,
-                source="",
-                raw=text,
-                price=normalize_price_text(text),
-                currency="USD",
-                url=HOME_URL,
-            )
-
-    return None
-
-
-def fetch_page_prices(page, coins: Dict[str, CoinConfig]) -> Dict[str, PriceResult]:
-    results: Dict[str, PriceResult] = {}
-    rows = page.locator("table tbody tr")
-    for i in range(rows.count()):
-        row = rows.nth(i)
-        name = parse_coin_from_row(row)
+@timed("table.match")
+def fetch_page_prices(rows: TableSnapshot, index: CoinIndex) -> Dict[str, PriceResult]:
+    matches: Dict[str, Tuple[CoinConfig, str]] = {}
+    for cells in rows:
+        name = parse_coin_from_row(cells)
         if not name:
             continue
-        coin = coins.get(name)
-        if not coin or coin.slug in results:
+        coin = index.by_name(name)
+        if not coin or coin.slug in matches:
             continue
-        text = extract_price_from_row(row)
+        text = extract_price_from_row(cells)
         if not text:
             continue
-        results[coin.slug] = PriceResult(
-            slug=coin.slug,
-            symbol=coin.symbol,
-            name=coin.name,
-            source="",
-            raw=text,
-            price=normalize_price_text(text),
-            currency="USD",
-            url=HOME_URL,
-        )
-    return results
-
-
-def fetch_prices(coins: Iterable[CoinConfig]) -> list[PriceResult]:
-    results: list[PriceResult] = []
-    coin_by_name = {coin.name: coin for coin in coins}
-    remaining = {coin.name for coin in coins}
-    with sync_playwright() as playwright:
-        browser = playwright.chromium.launch()
-        page = browser.new_page(
-            user_agent=(
-                "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
-                "(KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36"
-            )
-        )
-
+        matches[coin.slug] = (coin, text)
+    return price_results(matches.values(), HOME_URL, currency="USD")
+
+
+def fetch_prices(
+    coins: Iterable[CoinConfig],
+    pool: Optional[BrowserPool] = None,
+    capture_api: bool = True,
+    latency: Optional[LatencyHistory] = None,
+) -> list[PriceResult]:
+    index = CoinIndex(coins)
+    found: Dict[str, PriceResult] = {}
+    hosts = API_HOSTS if capture_api else ()
+    with open_page(pool, "coindesk") as page, ResponseCapture(
+        page, index, hosts, url=HOME_URL
+    ) as capture:
         for page_number in range(1, MAX_PAGES + 1):
             url = HOME_URL if page_number == 1 else f"{HOME_URL}?page={page_number}"
-            page.goto(url, wait_until="domcontentloaded")
-            try:
-                page.wait_for_selector("table tbody tr", timeout=15000)
-            except TimeoutError:
-                continue
-
-            page_results = fetch_page_prices(page, coin_by_name)
-            for slug, price in page_results.items():
-                if price.name in remaining:
-                    results.append(price)
-                    remaining.discard(price.name)
-
-            if not remaining:
+            with span("goto"):
+                page.goto(url, wait_until="domcontentloaded")
+            if not capture.complete:
+                try:
+                    with timed_wait(latency, "coindesk.table", TABLE_TIMEOUT) as timeout:
+                        page.wait_for_selector(ROW_SELECTOR, timeout=timeout)
+                except TimeoutError:
+                    continue
+
+                for slug, price in fetch_page_prices(snapshot_table(page), index).items():
+                    found.setdefault(slug, price)
+
+            found.update(capture.results)
+            if all(coin.slug in found for coin in index):
                 break
 
-        browser.close()
-
-    return results
+    return require_all(index, found)
 
 
 class CoinDeskScraper:
     name = "coindesk"
 
-    def __init__(self, coins: Iterable[CoinConfig] = COINS) -> None:
+    def __init__(
+        self,
+        coins: Iterable[CoinConfig] = COINS,
+        pool: Optional[BrowserPool] = None,
+        capture_api: bool = True,
+        latency: Optional[LatencyHistory] = None,
+        retry: RetryPolicy = NO_RETRY,
+    ) -> None:
         self._coins = list(coins)
+        self._pool = pool
+        self._capture_api = capture_api
+        self._latency = latency
+        self._retry = retry
 
     def fetch(self) -> list[PriceResult]:
-        return fetch_prices(self._coins)
+        return fetch_with_retries(
+            lambda coins: fetch_prices(
+                coins, pool=self._pool, capture_api=self._capture_api, latency=self._latency
+            ),
+            self._coins,
+            self._retry,
+        )
@@ -1,94 +1,118 @@
 from __future__ import annotations
 
 import re
-from typing import Dict, Iterable, Optional
+from typing import Dict, Iterable, Optional, Sequence, Tuple
 
-from playwright.sync_api import TimeoutError, sync_playwright
+from playwright.sync_api import TimeoutError
 
 from scrapers import PriceResult
-from scrapers.coins import COINS, CoinConfig
-from scrapers.utils import currency_from_text, normalize_price_text
+from scrapers.browser import BrowserPool, open_page
+from scrapers.capture import ResponseCapture
+from scrapers.coins import COINS, CoinConfig, CoinIndex
+from scrapers.retry import (
+    NO_RETRY,
+    LatencyHistory,
+    RetryPolicy,
+    fetch_with_retries,
+    timed_wait,
+)
+from scrapers.table import (
+    ROW_SELECTOR,
+    TableSnapshot,
+    match_rows,
+    price_results,
+    require_all,
+    snapshot_table,
+)
+from scrapers.timing import span, timed
 
 HOME_URL = "https://www.coingecko.com/"
+API_HOSTS = ("coingecko.com",)
+TABLE_TIMEOUT = 15000
 PRICE_REGEX = re.compile(r"[$€£][0-9]")
 
 
-def extract_price_from_row(row) -> Optional[str]:
-    cells = row.locator("td")
-    if cells.count() > 4:
-        candidate = cells.nth(4).inner_text().strip()
+def extract_price_from_row(cells: Sequence[str]) -> Optional[str]:
+    if len(cells) > 4:
+        candidate = cells[4].strip()
         if candidate and PRICE_REGEX.search(candidate):
             return candidate
 
-    for i in range(cells.count()):
-        candidate = cells.nth(i).inner_text().strip()
+    for cell in cells:
+        candidate = cell.strip()
         if candidate and PRICE_REGEX.search(candidate):
             return candidate
 
     return None
 
 
-def fetch_coin_price_from_home(page, coin: CoinConfig) -> PriceResult:
-    rows = page.locator("table tbody tr")
-    if rows.count() == 0:
+@timed("table.match")
+def fetch_prices_from_home(
+    rows: TableSnapshot, index: CoinIndex
+) -> Dict[str, PriceResult]:
+    if not rows:
         raise RuntimeError("Could not find price table on CoinGecko homepage")
 
-    candidates = rows.filter(has_text=coin.name)
-    for i in range(candidates.count()):
-        row = candidates.nth(i)
-        cells = row.locator("td")
-        if cells.count() > 2:
-            name_cell = cells.nth(2).inner_text()
-            if coin.name not in name_cell:
-                continue
-
-        text = extract_price_from_row(row)
+    matches: Dict[str, Tuple[CoinConfig, str]] = {}
+    for coin, cells in match_rows(rows, index, name_column=2):
+        if coin.slug in matches:
+            continue
+        text = extract_price_from_row(cells)
         if text:
-            return PriceResult(
-                slug=coin.slug,
-                symbol=coin.symbol,
-                name=coin.name,
-                source="",
-                raw=text,
-                price=normalize_price_text(text),
-                currency=currency_from_text(text, default="USD"),
-                url=HOME_URL,
-            )
-
-    raise RuntimeError(f"Could not find price for {coin.slug}")
-
-
-def fetch_prices(coins: Iterable[CoinConfig]) -> list[PriceResult]:
-    results: list[PriceResult] = []
-    with sync_playwright() as playwright:
-        browser = playwright.chromium.launch()
-        page = browser.new_page(
-            user_agent=(
-                "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
-                "(KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36"
-            )
-        )
+            matches[coin.slug] = (coin, text)
+
+    return price_results(matches.values(), HOME_URL)
+
+
+def fetch_prices(
+    coins: Iterable[CoinConfig],
+    pool: Optional[BrowserPool] = None,
+    capture_api: bool = True,
+    latency: Optional[LatencyHistory] = None,
+) -> list[PriceResult]:
+    index = CoinIndex(coins)
+    hosts = API_HOSTS if capture_api else ()
+    with open_page(pool, "coingecko") as page, ResponseCapture(
+        page, index, hosts, url=HOME_URL
+    ) as capture:
+        with span("goto"):
+            page.goto(HOME_URL, wait_until="domcontentloaded")
+        if capture.complete:
+            return require_all(index, capture.results)
 
-        page.goto(HOME_URL, wait_until="domcontentloaded")
         try:
-            page.wait_for_selector("table tbody tr", timeout=15000)
+            with timed_wait(latency, "coingecko.table", TABLE_TIMEOUT) as timeout:
+                page.wait_for_selector(ROW_SELECTOR, timeout=timeout)
         except TimeoutError as exc:
             raise RuntimeError("Timed out waiting for CoinGecko table") from exc
 
-        for coin in coins:
-            price = fetch_coin_price_from_home(page, coin)
-            results.append(price)
+        found = capture.merge(fetch_prices_from_home(snapshot_table(page), index))
 
-        browser.close()
-
-    return results
+    return require_all(index, found)
 
 
 class CoinGeckoScraper:
     name = "coingecko"
 
-    def __init__(self, coins: Iterable[CoinConfig] = COINS) -> None:
+    def __init__(
+        self,
+        coins: Iterable[CoinConfig] = COINS,
+        pool: Optional[BrowserPool] = None,
+        capture_api: bool = True,
+        latency: Optional[LatencyHistory] = None,
+        retry: RetryPolicy = NO_RETRY,
+    ) -> None:
         self._coins = list(coins)
+        self._pool = pool
+        self._capture_api = capture_api
+        self._latency = latency
+        self._retry = retry
 
     def fetch(self) -> list[PriceResult]:
-        return fetch_prices(self._coins)
+        return fetch_with_retries(
+            lambda coins: fetch_prices(
+                coins, pool=self._pool, capture_api=self._capture_api, latency=self._latency
+            ),
+            self._coins,
+            self._retry,
+        )
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, Optional
 
 
 @dataclass(frozen=True)
@@ -19,3 +20,54 @@ COINS = [
     CoinConfig(slug="monero", name="Monero", symbol="XMR"),
     CoinConfig(slug="binancecoin", name="BNB", symbol="BNB"),
 ]
+
+
+def normalize_key(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+class CoinIndex:
+    """Dictionary lookup of tracked coins by normalized name and symbol.
+
+    Built once per fetch so that matching a table costs one pass over its
+    rows, however many coins are tracked.
+    """
+
+    def __init__(self, coins: Iterable[CoinConfig]) -> None:
+        self.coins = list(coins)
+        self._by_name: Dict[str, CoinConfig] = {}
+        self._by_symbol: Dict[str, CoinConfig] = {}
+        for coin in self.coins:
+            self._by_name.setdefault(normalize_key(coin.name), coin)
+            self._by_symbol.setdefault(normalize_key(coin.symbol), coin)
+
+    def __len__(self) -> int:
+        return len(self.coins)
+
+    def __iter__(self) -> Iterator[CoinConfig]:
+        return iter(self.coins)
+
+    def by_name(self, name: str) -> Optional[CoinConfig]:
+        return self._by_name.get(normalize_key(name))
+
+    def by_symbol(self, symbol: str) -> Optional[CoinConfig]:
+        return self._by_symbol.get(normalize_key(symbol))
+
+    def match_cell(self, text: str) -> Optional[CoinConfig]:
+        """Find the coin a table name cell refers to.
+
+        Name cells put the name and ticker either on separate lines
+        ("Bitcoin\\nBTC") or on one line ("Bitcoin BTC").
+        """
+        for line in text.splitlines():
+            key = normalize_key(line)
+            if not key:
+                continue
+            coin = self._by_name.get(key)
+            if coin:
+                return coin
+            head, _, tail = key.rpartition(" ")
+            coin = self._by_name.get(head)
+            if coin and normalize_key(coin.symbol) == tail:
+                return coin
+        return None
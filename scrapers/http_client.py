@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import ssl
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from http.client import HTTPConnection, HTTPResponse, HTTPSConnection
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from scrapers.browser import USER_AGENT
+from scrapers.response_cache import ResponseCache, Validated
+
+REQUEST_TIMEOUT = 15.0
+READ_CHUNK = 64 * 1024
+
+ConnectionKey = Tuple[str, str, int]
+
+_ssl_context: Optional[ssl.SSLContext] = None
+_ssl_lock = threading.Lock()
+
+
+def default_ssl_context() -> ssl.SSLContext:
+    """One verifying TLS context for every client; loading the CA store is slow."""
+    global _ssl_context
+    with _ssl_lock:
+        if _ssl_context is None:
+            _ssl_context = ssl.create_default_context()
+        return _ssl_context
+
+
+def read_body(response: HTTPResponse) -> bytes:
+    """Read ``response`` in chunks, gunzipping each one as it arrives."""
+    encoding = (response.getheader("Content-Encoding") or "").lower()
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding == "gzip" else None
+    chunks = []
+    while True:
+        chunk = response.read(READ_CHUNK)
+        if not chunk:
+            break
+        chunks.append(decoder.decompress(chunk) if decoder else chunk)
+    if decoder:
+        chunks.append(decoder.flush())
+    return b"".join(chunks)
+
+
+class HttpClient:
+    """A small keep-alive HTTP(S) client for JSON APIs, built on ``http.client``.
+
+    Connections are pooled per host and reused by later requests from any
+    thread, one request at a time per connection; a pooled connection the
+    server has meanwhile closed is transparently replaced. Responses
+    are requested gzip-encoded.
+
+    Only requests made with a ``max_age`` are cached: the body is kept with
+    its ``ETag``/``Last-Modified``, returned without a request while it is
+    younger than ``max_age`` seconds, and revalidated after that, a ``304
+    Not Modified`` returning the body kept from before. Anything else, such
+    as live prices, always goes to the network and is never kept. With a
+    :class:`~scrapers.response_cache.ResponseCache` the kept bodies and
+    validators outlive the process.
+    """
+
+    def __init__(
+        self,
+        timeout: float = REQUEST_TIMEOUT,
+        headers: Optional[Mapping[str, str]] = None,
+        cache: Optional[ResponseCache] = None,
+    ) -> None:
+        self._timeout = timeout
+        self._headers = {
+            "User-Agent": USER_AGENT,
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip",
+            **(headers or {}),
+        }
+        self._idle: Dict[ConnectionKey, List[HTTPConnection]] = {}
+        self.cache = cache
+        self._validated: Dict[str, Validated] = {}
+        self._lock = threading.Lock()
+
+    def _checkout(self, key: ConnectionKey) -> Tuple[HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        scheme, host, port = key
+        if scheme == "https":
+            connection: HTTPConnection = HTTPSConnection(
+                host, port, timeout=self._timeout, context=default_ssl_context()
+            )
+        else:
+            connection = HTTPConnection(host, port, timeout=self._timeout)
+        return connection, False
+
+    def _checkin(self, key: ConnectionKey, connection: HTTPConnection) -> None:
+        with self._lock:
+            self._idle.setdefault(key, []).append(connection)
+
+    def _lookup(self, url: str) -> Optional[Validated]:
+        with self._lock:
+            validated = self._validated.get(url)
+        if validated is None and self.cache is not None:
+            validated = self.cache.get(url)
+            if validated is not None:
+                with self._lock:
+                    self._validated.setdefault(url, validated)
+        return validated
+
+    def _store(self, url: str, validated: Validated, body_changed: bool = True) -> None:
+        with self._lock:
+            self._validated[url] = validated
+        if self.cache is not None:
+            self.cache.put(url, validated, body_changed=body_changed)
+
+    def get(self, url: str, max_age: Optional[float] = None) -> bytes:
+        """The body of ``url``; raises :class:`RuntimeError` unless it is 200 or 304.
+
+        With ``max_age``, the response is cached, and a body kept from a
+        response less than ``max_age`` seconds old is returned without a
+        request (``0`` always revalidates).
+        """
+        validated = self._lookup(url) if max_age is not None else None
+        if validated is not None and time.time() - validated.stored_at < max_age:
+            return validated.body
+
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        key = (scheme, parts.hostname or "", parts.port or (443 if scheme == "https" else 80))
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+        headers = dict(self._headers)
+        if validated is not None:
+            if validated.etag:
+                headers["If-None-Match"] = validated.etag
+            if validated.last_modified:
+                headers["If-Modified-Since"] = validated.last_modified
+
+        while True:
+            connection, reused = self._checkout(key)
+            try:
+                connection.request("GET", target, headers=headers)
+                response = connection.getresponse()
+                body = read_body(response)
+            except ConnectionError:
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            break
+        if response.will_close:
+            connection.close()
+        else:
+            self._checkin(key, connection)
+
+        if response.status == 304 and validated is not None:
+            self._store(url, replace(validated, stored_at=time.time()), body_changed=False)
+            return validated.body
+        if response.status != 200:
+            raise RuntimeError(f"GET {url} returned HTTP {response.status}")
+        if max_age is not None:
+            etag = response.getheader("ETag")
+            last_modified = response.getheader("Last-Modified")
+            self._store(url, Validated(body, etag, last_modified, time.time()))
+        return body
+
+    def get_many(
+        self, urls: Sequence[str], max_age: Optional[Mapping[str, float]] = None
+    ) -> List[bytes]:
+        """Fetch every URL in parallel, returning the bodies in order.
+
+        ``max_age`` maps the URLs to cache to the ``max_age`` of their
+        :meth:`get`; the others are never cached.
+        """
+        ages = max_age or {}
+        if len(urls) <= 1:
+            return [self.get(url, ages.get(url)) for url in urls]
+        with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            return list(executor.map(lambda url: self.get(url, ages.get(url)), urls))
+
+    def close(self) -> None:
+        with self._lock:
+            idle = [connection for pool in self._idle.values() for connection in pool]
+            self._idle.clear()
+        for connection in idle:
+            connection.close()
+
+    def __enter__(self) -> "HttpClient":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
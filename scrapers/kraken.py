@@ -1,67 +1,105 @@
 from __future__ import annotations
 
-from typing import Dict, Iterable, Optional
+import re
+import statistics
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
 
-from playwright.sync_api import TimeoutError, sync_playwright
+from playwright.sync_api import TimeoutError
 
-from scrapers import PriceResult
-from scrapers.coins import COINS, CoinConfig
-from scrapers.utils import normalize_price_text
+from scrapers import MissingPrices, PriceResult
+from scrapers.browser import HIDE_WEBDRIVER_SCRIPT, BrowserPool, open_page
+from scrapers.capture import ResponseCapture, extract_json_prices
+from scrapers.coins import COINS, CoinConfig, CoinIndex
+from scrapers.retry import (
+    NO_RETRY,
+    LatencyHistory,
+    RetryPolicy,
+    fetch_with_retries,
+    timed_wait,
+)
+from scrapers.table import (
+    ROW_SELECTOR,
+    TableSnapshot,
+    match_rows,
+    price_results,
+    require_all,
+    snapshot_table,
+)
+from scrapers.timing import span, timed
 
 HOME_URL = "https://www.kraken.com/prices"
+API_HOSTS = ("kraken.com",)
 CURRENCIES = ["EUR", "USD"]
 CURRENCY_SYMBOLS = {
     "EUR": "€",
     "USD": "$",
+    "GBP": "£",
 }
+TABLE_TIMEOUT = 20000
+CURRENCY_SWITCH_TIMEOUT = 10000
+# How far a variant's prices may stray from one exchange rate, and how close
+# to 1 that rate may not be.
+FX_TOLERANCE = 0.02
+
+# Resolves once every price cell in the table shows the requested currency
+# symbol, i.e. the table has re-rendered after a currency switch.
+CURRENCY_SHOWN_SCRIPT = """
+([selector, symbol]) => {
+  const rows = Array.from(document.querySelectorAll(selector));
+  const prices = rows
+    .map(row => row.querySelectorAll('td')[2])
+    .filter(cell => cell && /[0-9]/.test(cell.innerText));
+  return prices.length > 0 && prices.every(cell => cell.innerText.includes(symbol));
+}
+"""
+
+# Fetches a JSON document from the page, so it carries the page's cookies
+# and goes through the context's routing; null when the request fails.
+FETCH_JSON_SCRIPT = """
+async url => {
+  try {
+    const response = await fetch(url, {credentials: 'include'});
+    return response.ok ? await response.json() : null;
+  } catch (error) {
+    return null;
+  }
+}
+"""
 
 
-def extract_price_from_row(row) -> Optional[str]:
-    cells = row.locator("td")
-    if cells.count() > 2:
-        candidate = cells.nth(2).inner_text().strip()
+def extract_price_from_row(cells: Sequence[str]) -> Optional[str]:
+    if len(cells) > 2:
+        candidate = cells[2].strip()
         if candidate and any(symbol in candidate for symbol in CURRENCY_SYMBOLS.values()):
             return candidate
 
-    for i in range(cells.count()):
-        candidate = cells.nth(i).inner_text().strip()
+    for cell in cells:
+        candidate = cell.strip()
         if candidate and any(symbol in candidate for symbol in CURRENCY_SYMBOLS.values()):
             return candidate
 
     return None
 
 
-def fetch_coin_price_from_table(page, coin: CoinConfig, currency: str) -> PriceResult:
-    rows = page.locator("table tbody tr")
-    if rows.count() == 0:
+@timed("table.match")
+def fetch_prices_from_table(
+    rows: TableSnapshot, index: CoinIndex, currency: str
+) -> Dict[str, PriceResult]:
+    if not rows:
         raise RuntimeError("Could not find price table on Kraken prices page")
 
-    candidates = rows.filter(has_text=coin.name)
-    for i in range(candidates.count()):
-        row = candidates.nth(i)
-        cells = row.locator("td")
-        if cells.count() > 1:
-            name_cell = cells.nth(1).inner_text()
-            if coin.name not in name_cell:
-                continue
-
-        text = extract_price_from_row(row)
+    matches: Dict[str, Tuple[CoinConfig, str]] = {}
+    for coin, cells in match_rows(rows, index, name_column=1):
+        if coin.slug in matches:
+            continue
+        text = extract_price_from_row(cells)
         if text:
-            return PriceResult(
-                slug=coin.slug,
-                symbol=coin.symbol,
-                name=coin.name,
-                source="",
-                raw=text,
-                price=normalize_price_text(text),
-                currency=currency,
-                url=HOME_URL,
-            )
+            matches[coin.slug] = (coin, text)
 
-    raise RuntimeError(f"Could not find price for {coin.slug}")
+    return price_results(matches.values(), HOME_URL, currency=currency)
 
 
-def set_currency(page, currency: str) -> None:
+def set_currency(page, currency: str, latency: Optional[LatencyHistory] = None) -> None:
     button = page.locator(
         "button[data-testid='prices-table-currency-selector-button']:visible"
     )
@@ -75,57 +113,198 @@ def set_currency(page, currency: str) -> None:
         raise RuntimeError(f"Could not find currency option {currency}")
 
     option.first.click()
-    page.wait_for_timeout(1500)
+    try:
+        with timed_wait(latency, "kraken.currency", CURRENCY_SWITCH_TIMEOUT) as timeout:
+            page.wait_for_function(
+                CURRENCY_SHOWN_SCRIPT,
+                arg=[ROW_SELECTOR, CURRENCY_SYMBOLS[currency]],
+                timeout=timeout,
+            )
+    except TimeoutError as exc:
+        raise RuntimeError(f"Timed out waiting for Kraken prices in {currency}") from exc
 
 
 def fetch_prices_for_currency(
-    page, coins: Iterable[CoinConfig], currency: str
-) -> Dict[str, PriceResult]:
-    results: Dict[str, PriceResult] = {}
-    set_currency(page, currency)
-    for coin in coins:
-        results[coin.slug] = fetch_coin_price_from_table(page, coin, currency)
-    return results
+    page,
+    index: CoinIndex,
+    currency: str,
+    hosts: Sequence[str] = (),
+    latency: Optional[LatencyHistory] = None,
+    api_urls: Optional[List[str]] = None,
+) -> list[PriceResult]:
+    # Switching currency makes the page refetch its prices; capture that
+    # payload and only read the table for coins it does not cover.
+    with ResponseCapture(page, index, hosts, url=HOME_URL, currency=currency) as capture:
+        set_currency(page, currency, latency)
+        rows = snapshot_table(page)
+    if api_urls is not None:
+        api_urls.extend(capture.sources)
+    found = capture.merge(fetch_prices_from_table(rows, index, currency))
+    return require_all(index, found)
 
 
-def fetch_prices(coins: Iterable[CoinConfig]) -> list[PriceResult]:
-    results: list[PriceResult] = []
-    with sync_playwright() as playwright:
-        browser = playwright.chromium.launch(
-            headless=True,
-            args=["--disable-blink-features=AutomationControlled"],
-        )
-        context = browser.new_context(
-            user_agent=(
-                "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
-                "(KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36"
+def currency_variant(url: str, currency: str, target: str) -> Optional[str]:
+    """``url`` asking for ``target`` instead of ``currency``, if it names it."""
+    pattern = re.compile(rf"(?<![A-Za-z]){currency}(?![A-Za-z])", re.IGNORECASE)
+    if not pattern.search(url):
+        return None
+    return pattern.sub(
+        lambda match: target.lower() if match.group().islower() else target, url
+    )
+
+
+def converted(prices: Mapping[str, PriceResult], shown: Mapping[str, PriceResult]) -> bool:
+    """Whether ``prices`` read like ``shown`` converted at a single exchange rate.
+
+    Every shared coin's price must stand in about the same ratio to the one
+    shown, and that ratio must be clearly away from 1: a refreshed payload
+    in the shown currency moves each price a little and on its own.
+    """
+    ratios = sorted(
+        prices[slug].price / shown[slug].price for slug in prices if slug in shown
+    )
+    if not ratios:
+        return False
+    rate = statistics.median(ratios)
+    return abs(rate - 1) > FX_TOLERANCE and ratios[-1] / ratios[0] <= 1 + FX_TOLERANCE
+
+
+def fetch_variant_prices(
+    page,
+    index: CoinIndex,
+    api_urls: Sequence[str],
+    currency: str,
+    target: str,
+    shown: Mapping[str, PriceResult],
+) -> Dict[str, PriceResult]:
+    """Prices in ``target`` from the price JSON seen for ``currency``, without the UI.
+
+    ``shown`` holds the prices read in ``currency``. A server may ignore the
+    swapped code and answer in ``currency`` again, so a variant's prices only
+    count when their records name ``target``, or, for records without a
+    currency, when they are ``shown`` converted at one exchange rate.
+    """
+    found: Dict[str, PriceResult] = {}
+    for url in api_urls:
+        variant = currency_variant(url, currency, target)
+        if variant is None:
+            continue
+        with span("fetch_variant"):
+            payload = page.evaluate(FETCH_JSON_SCRIPT, variant)
+        if payload is None:
+            continue
+        with span("capture.match"):
+            prices = extract_json_prices(
+                payload, index, HOME_URL, target, assume_currency=False
             )
-        )
-        page = context.new_page()
-        page.add_init_script(
-            "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
-        )
+            if not prices:
+                prices = extract_json_prices(payload, index, HOME_URL, target)
+                if not converted(prices, shown):
+                    continue
+        for slug, price in prices.items():
+            found.setdefault(slug, price)
+    return found
+
+
+def fetch_prices(
+    coins: Iterable[CoinConfig],
+    pool: Optional[BrowserPool] = None,
+    capture_api: bool = True,
+    latency: Optional[LatencyHistory] = None,
+    currencies: Sequence[str] = CURRENCIES,
+) -> list[PriceResult]:
+    """Prices of ``coins`` in every one of ``currencies``.
 
-        page.goto(HOME_URL, wait_until="domcontentloaded")
+    The first currency is picked in the page's currency selector. When the
+    price JSON the page fetched for it names that currency in its URL, every
+    other currency is read from the same URL with the code swapped instead
+    of switching the table again; a currency the variant does not fully
+    cover falls back to the selector.
+    """
+    results: list[PriceResult] = []
+    # The currencies each missing coin lacks.
+    missed: Dict[str, List[str]] = {}
+    index = CoinIndex(coins)
+    with open_page(pool, "kraken", init_script=HIDE_WEBDRIVER_SCRIPT) as page:
+        with span("goto"):
+            page.goto(HOME_URL, wait_until="domcontentloaded")
         try:
-            page.wait_for_selector("table tbody tr", timeout=20000)
+            with timed_wait(latency, "kraken.table", TABLE_TIMEOUT) as timeout:
+                page.wait_for_selector(ROW_SELECTOR, timeout=timeout)
         except TimeoutError as exc:
             raise RuntimeError("Timed out waiting for Kraken prices table") from exc
 
-        for currency in CURRENCIES:
-            currency_results = fetch_prices_for_currency(page, coins, currency)
-            results.extend(currency_results.values())
-
-        browser.close()
+        hosts = API_HOSTS if capture_api else ()
+        # The price JSON last seen through the selector, its currency and
+        # the prices read in it.
+        api_urls: List[str] = []
+        selected: Optional[str] = None
+        selected_prices: Dict[str, PriceResult] = {}
+        for currency in currencies:
+            # A coin missing in one currency should not cost the other's prices.
+            try:
+                if selected is not None:
+                    found = fetch_variant_prices(
+                        page, index, api_urls, selected, currency, selected_prices
+                    )
+                    if all(coin.slug in found for coin in index):
+                        results.extend(require_all(index, found))
+                        continue
+                seen: List[str] = []
+                shown: List[PriceResult] = []
+                try:
+                    shown = fetch_prices_for_currency(
+                        page, index, currency, hosts, latency, api_urls=seen
+                    )
+                except MissingPrices as exc:
+                    shown = exc.results
+                    raise
+                finally:
+                    if seen:
+                        api_urls, selected = seen, currency
+                        selected_prices = {price.slug: price for price in shown}
+                results.extend(shown)
+            except MissingPrices as exc:
+                results.extend(exc.results)
+                for slug in exc.misses:
+                    missed.setdefault(slug, []).append(currency)
 
+    if missed:
+        raise MissingPrices(results, list(missed), missed)
     return results
 
 
 class KrakenScraper:
     name = "kraken"
 
-    def __init__(self, coins: Iterable[CoinConfig] = COINS) -> None:
+    def __init__(
+        self,
+        coins: Iterable[CoinConfig] = COINS,
+        pool: Optional[BrowserPool] = None,
+        capture_api: bool = True,
+        latency: Optional[LatencyHistory] = None,
+        retry: RetryPolicy = NO_RETRY,
+        currencies: Sequence[str] = CURRENCIES,
+    ) -> None:
+        unsupported = [code for code in currencies if code not in CURRENCY_SYMBOLS]
+        if unsupported:
+            raise ValueError(f"Kraken does not list prices in {', '.join(unsupported)}")
         self._coins = list(coins)
+        self._pool = pool
+        self._capture_api = capture_api
+        self._latency = latency
+        self._retry = retry
+        self._currencies = list(currencies)
 
     def fetch(self) -> list[PriceResult]:
-        return fetch_prices(self._coins)
+        return fetch_with_retries(
+            lambda coins: fetch_prices(
+                coins,
+                pool=self._pool,
+                capture_api=self._capture_api,
+                latency=self._latency,
+                currencies=self._currencies,
+            ),
+            self._coins,
+            self._retry,
+        )
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict
+
+
+@dataclass(frozen=True)
+class Recording:
+    """A directory a run's network traffic is recorded to or replayed from.
+
+    Browser sources keep one HAR file per source (``<source>.har``), written
+    by Playwright when the source's context closes and served back with
+    ``route_from_har``; requests missing from it are aborted, so a replay
+    never reaches the network. Sources that call an API directly save the
+    JSON documents they fetched, keyed by URL (``<source>.json``).
+    """
+
+    directory: Path
+    replay: bool = False
+
+    def har_path(self, source: str) -> Path:
+        return self.directory / f"{source}.har"
+
+    def documents_path(self, source: str) -> Path:
+        return self.directory / f"{source}.json"
+
+    def context_options(self, source: str) -> Dict[str, object]:
+        """Extra ``new_context`` options: where to write the HAR when recording."""
+        if self.replay:
+            return {}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return {
+            "record_har_path": str(self.har_path(source)),
+            "record_har_content": "embed",
+        }
+
+    def install(self, source: str, context) -> None:
+        """Serve ``context`` from the source's HAR when replaying."""
+        if not self.replay:
+            return
+        path = self.har_path(source)
+        if not path.exists():
+            raise RuntimeError(f"No recording of {source} in {self.directory}")
+        context.route_from_har(path, not_found="abort")
+
+    def load_documents(self, source: str) -> Dict[str, object]:
+        path = self.documents_path(source)
+        if not path.exists():
+            raise RuntimeError(f"No recording of {source} in {self.directory}")
+        return json.loads(path.read_text())
+
+    def save_documents(self, source: str, documents: Dict[str, object]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.documents_path(source)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(json.dumps(documents, indent=2, sort_keys=True) + "\n")
+        os.replace(tmp_path, path)
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class Validated:
+    """A response body kept with the validators to revalidate it.
+
+    ``stored_at`` is when the body was last fetched or revalidated (epoch
+    seconds).
+    """
+
+    body: bytes
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    stored_at: float = 0.0
+
+
+def entry_name(key: str) -> str:
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Response bodies kept on disk between runs, for slow-changing documents.
+
+    Each entry is a body (``<name>.body``) next to its metadata
+    (``<name>.json``: the key, its validators and when it was stored), where
+    ``<name>`` is a hash of the key. Keys are usually URLs, but anything
+    derived from a response can be kept under a key of its own. Reading an
+    entry marks it as recently used; once the entries together exceed
+    ``max_bytes``, the least recently used are removed until they fit again.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.directory = directory
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _paths(self, key: str) -> Tuple[Path, Path]:
+        name = entry_name(key)
+        return self.directory / f"{name}.json", self.directory / f"{name}.body"
+
+    def get(self, key: str) -> Optional[Validated]:
+        meta_path, body_path = self._paths(key)
+        try:
+            meta = json.loads(meta_path.read_text())
+            body = body_path.read_bytes()
+        except (OSError, ValueError):
+            return None
+        if meta.get("key") != key or meta.get("size") != len(body):
+            return None
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+        return Validated(
+            body,
+            etag=meta.get("etag"),
+            last_modified=meta.get("last_modified"),
+            stored_at=float(meta.get("stored_at", 0.0)),
+        )
+
+    def put(self, key: str, entry: Validated, body_changed: bool = True) -> None:
+        """Store ``entry``; with ``body_changed=False`` only its metadata is rewritten."""
+        meta_path, body_path = self._paths(key)
+        meta = {
+            "key": key,
+            "etag": entry.etag,
+            "last_modified": entry.last_modified,
+            "stored_at": entry.stored_at,
+            "size": len(entry.body),
+        }
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if body_changed or not body_path.exists():
+                tmp_body = body_path.with_name(f".{body_path.name}.tmp")
+                tmp_body.write_bytes(entry.body)
+                os.replace(tmp_body, body_path)
+            tmp_meta = meta_path.with_name(f".{meta_path.name}.tmp")
+            tmp_meta.write_text(json.dumps(meta, sort_keys=True) + "\n")
+            os.replace(tmp_meta, meta_path)
+            if body_changed:
+                self._evict()
+
+    def _evict(self) -> None:
+        entries: List[Tuple[float, int, Path, Path]] = []
+        total = 0
+        for meta_path in self.directory.glob("*.json"):
+            body_path = meta_path.with_suffix(".body")
+            try:
+                used = meta_path.stat().st_mtime
+                size = meta_path.stat().st_size + body_path.stat().st_size
+            except OSError:
+                continue
+            entries.append((used, size, meta_path, body_path))
+            total += size
+        entries.sort()
+        for _, size, meta_path, body_path in entries:
+            if total <= self._max_bytes:
+                break
+            for path in (meta_path, body_path):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            total -= size
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from playwright.sync_api import TimeoutError
+
+from scrapers import MissingPrices, PriceResult
+from scrapers.coins import CoinConfig
+from scrapers.timing import span
+
+LATENCY_WINDOW = 50
+LATENCY_PERCENTILE = 0.95
+LATENCY_FACTOR = 2.0
+MIN_LATENCY_SAMPLES = 5
+MIN_TIMEOUT_MS = 2000
+
+
+class LatencyHistory:
+    """Rolling per-step latency samples, used to size timeouts.
+
+    Steps are keys such as ``"kraken.table"``. Once a step has a few samples,
+    its timeout is ``factor`` times the recent ``percentile`` latency, kept
+    between ``min_timeout_ms`` and the hardcoded default it replaces. A wait
+    that times out is recorded at the timeout it was given, so a source that
+    slows down pushes its own timeout back up. With a ``path`` the samples
+    survive between runs (see :meth:`save`).
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        window: int = LATENCY_WINDOW,
+        percentile: float = LATENCY_PERCENTILE,
+        factor: float = LATENCY_FACTOR,
+        min_samples: int = MIN_LATENCY_SAMPLES,
+        min_timeout_ms: int = MIN_TIMEOUT_MS,
+    ) -> None:
+        self.path = path
+        self._window = window
+        self._percentile = percentile
+        self._factor = factor
+        self._min_samples = min_samples
+        self._min_timeout_ms = min_timeout_ms
+        self._samples: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        if path is not None and path.exists():
+            try:
+                stored = json.loads(path.read_text())
+            except ValueError:
+                stored = {}
+            for key, samples in stored.items():
+                self._samples[key] = [float(sample) for sample in samples][-window:]
+
+    def samples(self, key: str) -> List[float]:
+        with self._lock:
+            return list(self._samples.get(key, []))
+
+    def record(self, key: str, elapsed_ms: float) -> None:
+        with self._lock:
+            samples = self._samples.setdefault(key, [])
+            samples.append(round(elapsed_ms, 1))
+            del samples[: -self._window]
+
+    def timeout(self, key: str, default_ms: int) -> int:
+        samples = sorted(self.samples(key))
+        if len(samples) < self._min_samples:
+            return default_ms
+        rank = min(len(samples) - 1, int(self._percentile * len(samples)))
+        adaptive = int(samples[rank] * self._factor)
+        return max(self._min_timeout_ms, min(default_ms, adaptive))
+
+    @contextmanager
+    def measure(self, key: str, default_ms: int) -> Iterator[int]:
+        """Yield the timeout for ``key`` and record how long the block took."""
+        timeout_ms = self.timeout(key, default_ms)
+        started = time.perf_counter()
+        try:
+            yield timeout_ms
+        except TimeoutError:
+            self.record(key, timeout_ms)
+            raise
+        self.record(key, (time.perf_counter() - started) * 1000)
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            data = {key: list(samples) for key, samples in self._samples.items()}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        tmp_path.write_text(json.dumps(data, sort_keys=True) + "\n")
+        os.replace(tmp_path, self.path)
+
+
+@contextmanager
+def timed_wait(
+    latency: Optional[LatencyHistory], key: str, default_ms: int
+) -> Iterator[int]:
+    """Timeout to use for one wait: adaptive with ``latency``, ``default_ms`` without.
+
+    ``key`` is ``"<source>.<step>"``; the wait is timed as span ``wait.<step>``.
+    """
+    with span(f"wait.{key.rpartition('.')[2]}"):
+        if latency is None:
+            yield default_ms
+            return
+        with latency.measure(key, default_ms) as timeout_ms:
+            yield timeout_ms
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How often a failed fetch is retried and how long to back off in between.
+
+    The delay before retry ``n`` (1-based) is ``base_delay * 2 ** (n - 1)``,
+    capped at ``max_delay``, plus up to ``jitter`` of itself at random.
+    """
+
+    attempts: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 8.0
+    jitter: float = 0.25
+
+    def delay(self, retry: int, rng: Optional[random.Random] = None) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+        return delay * (1 + (rng or random).uniform(0, self.jitter))
+
+
+NO_RETRY = RetryPolicy(attempts=1)
+
+
+def fetch_with_retries(
+    fetch: Callable[[List[CoinConfig]], Sequence[PriceResult]],
+    coins: Sequence[CoinConfig],
+    policy: RetryPolicy = NO_RETRY,
+    sleep: Callable[[float], None] = time.sleep,
+) -> List[PriceResult]:
+    """Call ``fetch(coins)``, retrying failures according to ``policy``.
+
+    When a fetch fails with :class:`MissingPrices`, the prices it did find are
+    kept and only the missing coins are fetched again. Once the attempts run
+    out, the last error is raised, wrapped in a :class:`MissingPrices` that
+    carries everything found across attempts if anything was.
+    """
+    pending = list(coins)
+    found: Dict[Tuple[str, str], PriceResult] = {}
+    for attempt in range(1, max(1, policy.attempts) + 1):
+        try:
+            results = fetch(pending)
+        except MissingPrices as exc:
+            error: Exception = exc
+            results = exc.results
+            pending = [coin for coin in pending if coin.slug in exc.misses]
+        except Exception as exc:
+            error = exc
+            results = []
+        else:
+            pending = []
+        for result in results:
+            found.setdefault((result.slug, result.currency), result)
+        # A currency one attempt missed may have been found by an earlier one.
+        missed: Dict[str, List[str]] = {}
+        if pending and isinstance(error, MissingPrices) and error.currencies:
+            for coin in pending:
+                codes = error.currencies.get(coin.slug)
+                if codes:
+                    missed[coin.slug] = [code for code in codes if (coin.slug, code) not in found]
+            pending = [coin for coin in pending if missed.get(coin.slug, True)]
+        if not pending:
+            return list(found.values())
+        if attempt >= policy.attempts:
+            if found:
+                raise MissingPrices(
+                    list(found.values()), [coin.slug for coin in pending], missed
+                ) from error
+            raise error
+        sleep(policy.delay(attempt))
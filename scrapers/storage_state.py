@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+# Daily runs drift by hours, so a day-old state must still be usable.
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+
+
+@dataclass(frozen=True)
+class StorageStates:
+    """Each source's cookies and local storage, carried from one run to the next.
+
+    A source's context starts from the Playwright ``storage_state`` its last
+    run saved (``<source>.json``), so accepted consent banners and the site's
+    other cookies survive between runs. A state is not used once it is older
+    than ``max_age`` seconds or was saved under another user agent, and it
+    is deleted when one of the source's pages fails, so a bad state costs at
+    most one run.
+    """
+
+    directory: Path
+    max_age: float = DEFAULT_MAX_AGE
+
+    def path(self, source: str) -> Path:
+        return self.directory / f"{source}.json"
+
+    def load(self, source: str, user_agent: str) -> Optional[Dict[str, object]]:
+        """The saved state of ``source``, or ``None`` if there is no usable one."""
+        try:
+            stored = json.loads(self.path(source).read_text())
+        except (OSError, ValueError):
+            return None
+        saved_at = stored.get("saved_at", 0.0)
+        if stored.get("user_agent") != user_agent or time.time() - saved_at > self.max_age:
+            self.invalidate(source)
+            return None
+        return stored.get("state")
+
+    def save(self, source: str, user_agent: str, state: Dict[str, object]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(source)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        stored = {"saved_at": time.time(), "user_agent": user_agent, "state": state}
+        # Session cookies are as good as credentials, so the file is created
+        # readable by its owner only; a leftover from a crashed save would
+        # keep its own mode, so it goes first.
+        tmp_path.unlink(missing_ok=True)
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as handle:
+            handle.write(json.dumps(stored, sort_keys=True) + "\n")
+        os.replace(tmp_path, path)
+
+    def invalidate(self, source: str) -> None:
+        try:
+            self.path(source).unlink()
+        except FileNotFoundError:
+            pass
+
+    def clear(self) -> None:
+        for path in self.directory.glob("*.json"):
+            path.unlink()
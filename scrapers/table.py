@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from scrapers import MissingPrices, PriceResult
+from scrapers.coins import CoinConfig, CoinIndex
+from scrapers.timing import span
+from scrapers.utils import normalize_price_texts
+
+ROW_SELECTOR = "table tbody tr"
+
+# Runs in the page: returns every matching row as a list of its <td> texts.
+SNAPSHOT_SCRIPT = """
+rows => rows.map(row => Array.from(row.querySelectorAll('td'), cell => cell.innerText))
+"""
+
+TableSnapshot = List[List[str]]
+
+
+def snapshot_table(page, selector: str = ROW_SELECTOR) -> TableSnapshot:
+    """Read the text of every cell under ``selector`` in a single browser call.
+
+    Walking rows with locators costs one round-trip per ``count()`` and
+    ``inner_text()``; this pulls the whole grid into Python at once so the
+    scrapers can match coins against plain lists of strings.
+    """
+    with span("table.snapshot"):
+        return page.eval_on_selector_all(selector, SNAPSHOT_SCRIPT)
+
+
+def match_rows(
+    rows: TableSnapshot, index: CoinIndex, name_column: int
+) -> Iterator[Tuple[CoinConfig, List[str]]]:
+    """Yield ``(coin, cells)`` for every row whose name cell is a tracked coin."""
+    for cells in rows:
+        if len(cells) <= name_column:
+            continue
+        coin = index.match_cell(cells[name_column])
+        if coin is not None:
+            yield coin, cells
+
+
+def price_results(
+    matches: Iterable[Tuple[CoinConfig, str]], url: str, currency: Optional[str] = None
+) -> Dict[str, PriceResult]:
+    """Results for ``(coin, price text)`` pairs, with every price parsed in one batch.
+
+    Without ``currency`` each text's currency symbol decides, USD if it has none.
+    """
+    matches = list(matches)
+    prices, currencies = normalize_price_texts([text for _, text in matches])
+    return {
+        coin.slug: PriceResult(
+            slug=coin.slug,
+            symbol=coin.symbol,
+            name=coin.name,
+            source="",
+            raw=text,
+            price=price,
+            currency=currency or code,
+            url=url,
+        )
+        for (coin, text), price, code in zip(matches, prices, currencies)
+    }
+
+
+def require_all(index: CoinIndex, found: Dict[str, PriceResult]) -> List[PriceResult]:
+    """Return ``found`` in tracking order, or raise :class:`MissingPrices`."""
+    misses = [coin.slug for coin in index if coin.slug not in found]
+    if misses:
+        raise MissingPrices([found[coin.slug] for coin in index if coin.slug in found], misses)
+    return [found[coin.slug] for coin in index]
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import functools
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, TypeVar
+
+F = TypeVar("F", bound=Callable)
+
+
+@dataclass(frozen=True)
+class Span:
+    name: str
+    source: Optional[str]
+    thread: int
+    start: float
+    duration: float
+
+
+class Tracer:
+    """Collects timed spans from every thread of a run.
+
+    A span without an explicit ``source`` inherits the one of the span it is
+    nested in on the same thread, so ``span("goto")`` inside a source's fetch
+    is attributed to that source.
+    """
+
+    def __init__(self) -> None:
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.spans: List[Span] = []
+
+    @contextmanager
+    def span(self, name: str, source: Optional[str] = None) -> Iterator[None]:
+        stack = self._local.__dict__.setdefault("sources", [])
+        if source is None and stack:
+            source = stack[-1]
+        stack.append(source)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started
+            stack.pop()
+            entry = Span(name, source, threading.get_ident(), started - self._origin, duration)
+            with self._lock:
+                self.spans.append(entry)
+
+    def summary(self) -> List[Dict[str, object]]:
+        """Count, total and slowest duration per (source, span name), in first-seen order."""
+        rows: Dict[tuple, Dict[str, object]] = {}
+        with self._lock:
+            spans = sorted(self.spans, key=lambda entry: entry.start)
+        for entry in spans:
+            row = rows.setdefault(
+                (entry.source, entry.name),
+                {
+                    "source": entry.source,
+                    "name": entry.name,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                },
+            )
+            duration_ms = entry.duration * 1000
+            row["count"] += 1
+            row["total_ms"] += duration_ms
+            row["max_ms"] = max(row["max_ms"], duration_ms)
+        for row in rows.values():
+            row["total_ms"] = round(row["total_ms"], 3)
+            row["max_ms"] = round(row["max_ms"], 3)
+        return list(rows.values())
+
+    def chrome_trace(self) -> Dict[str, object]:
+        """The spans as Chrome trace events (load in chrome://tracing or Perfetto)."""
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "displayTimeUnit": "ms",
+            "traceEvents": [
+                {
+                    "name": entry.name,
+                    "cat": entry.source or "run",
+                    "ph": "X",
+                    "ts": round(entry.start * 1_000_000, 3),
+                    "dur": round(entry.duration * 1_000_000, 3),
+                    "pid": 1,
+                    "tid": entry.thread,
+                }
+                for entry in sorted(spans, key=lambda entry: entry.start)
+            ],
+        }
+
+
+_tracer: Optional[Tracer] = None
+
+
+def set_tracer(tracer: Optional[Tracer]) -> Optional[Tracer]:
+    """Make ``tracer`` collect every :func:`span`; returns the previous one."""
+    global _tracer
+    previous, _tracer = _tracer, tracer
+    return previous
+
+
+def span(name: str, source: Optional[str] = None):
+    """Time a block on the active tracer; a no-op when none is set."""
+    tracer = _tracer
+    if tracer is None:
+        return nullcontext()
+    return tracer.span(name, source)
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """Decorator form of :func:`span`."""
+
+    def decorate(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import re
+from array import array
+from typing import Iterable, List, Tuple
 
 CURRENCY_SYMBOLS = {
     "$": "USD",
@@ -8,6 +10,9 @@ CURRENCY_SYMBOLS = {
     "£": "GBP",
 }
 
+NON_NUMERIC = re.compile(r"[^0-9,\.]")
+DECIMAL_COMMA = re.compile(r",\d{1,2}$")
+
 
 def currency_from_text(text: str, default: str = "USD") -> str:
     for symbol, code in CURRENCY_SYMBOLS.items():
@@ -16,15 +21,14 @@ def currency_from_text(text: str, default: str = "USD") -> str:
     return default
 
 
-def normalize_price_text(text: str) -> float:
-    cleaned = re.sub(r"[^0-9,\.]", "", text)
+def parse_cleaned(cleaned: str, text: str) -> float:
     if "," in cleaned and "." in cleaned:
         if cleaned.rfind(",") > cleaned.rfind("."):
             cleaned = cleaned.replace(".", "").replace(",", ".")
         else:
             cleaned = cleaned.replace(",", "")
     elif "," in cleaned and "." not in cleaned:
-        if re.search(r",\d{1,2}$", cleaned):
+        if DECIMAL_COMMA.search(cleaned):
             cleaned = cleaned.replace(",", ".")
         else:
             cleaned = cleaned.replace(",", "")
@@ -33,3 +37,40 @@ def normalize_price_text(text: str) -> float:
         raise ValueError(f"Could not parse price from {text!r}")
 
     return float(cleaned)
+
+
+def normalize_price_text(text: str) -> float:
+    return parse_cleaned(NON_NUMERIC.sub("", text), text)
+
+
+def normalize_price_texts(
+    texts: Iterable[str], default_currency: str = "USD"
+) -> Tuple[array, List[str]]:
+    """Parse many price texts at once into ``(prices, currencies)``.
+
+    ``prices`` is an ``array('d')`` and ``currencies`` the matching codes;
+    each entry is exactly what :func:`normalize_price_text` and
+    :func:`currency_from_text` return for that text, and a text either of
+    them rejects raises the same :class:`ValueError`. Plain numbers such as
+    ``"12345.67"``, optionally behind one currency symbol (``"$1,234.56"``),
+    skip the regular expressions altogether.
+    """
+    prices = array("d")
+    currencies: List[str] = []
+    append_price = prices.append
+    append_currency = currencies.append
+    for text in texts:
+        if text.isascii() and text.replace(".", "", 1).isdigit():
+            append_price(float(text))
+            append_currency(default_currency)
+            continue
+        currency = CURRENCY_SYMBOLS.get(text[:1])
+        number = text[1:] if currency else text
+        # Only digits, commas and dots left: that is already the cleaned text.
+        if number.isascii() and number.replace(",", "").replace(".", "").isdigit():
+            append_price(parse_cleaned(number, text))
+            append_currency(currency or default_currency)
+            continue
+        append_price(parse_cleaned(NON_NUMERIC.sub("", text), text))
+        append_currency(currency_from_text(text, default_currency))
+    return prices, currencies
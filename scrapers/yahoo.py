@@ -1,28 +1,114 @@
 from __future__ import annotations
 
+import json
+import os
 import re
-from typing import Iterable, Optional
-
-from playwright.sync_api import TimeoutError, sync_playwright
-
-from scrapers import PriceResult
-from scrapers.coins import COINS, CoinConfig
-from scrapers.utils import normalize_price_text
+import threading
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from playwright.sync_api import TimeoutError
+
+from scrapers import MissingPrices, PriceResult
+from scrapers.browser import BrowserPool
+from scrapers.capture import ResponseCapture
+from scrapers.coins import COINS, CoinConfig, CoinIndex
+from scrapers.retry import (
+    NO_RETRY,
+    LatencyHistory,
+    RetryPolicy,
+    fetch_with_retries,
+    timed_wait,
+)
+from scrapers.table import ROW_SELECTOR, TableSnapshot, price_results, snapshot_table
+from scrapers.timing import span, timed
 
 BASE_URL = "https://finance.yahoo.com/markets/crypto/all/"
+API_HOSTS = ("finance.yahoo.com",)
 PAGE_SIZE = 250
 # Defensive cap for scan depth. Current tracked coins are liquid large caps, so a
 # top-1000 sweep is sufficient while still preventing endless pagination if Yahoo
 # changes the table behavior or repeats pages.
 MAX_ROWS_TO_SCAN = 1000
+SWEEP_STARTS = tuple(range(0, MAX_ROWS_TO_SCAN, PAGE_SIZE))
+CONSENT_REDIRECT_TIMEOUT = 5000
+CONSENT_RELOAD_TIMEOUT = 60000
+TABLE_TIMEOUT = 15000
 
 
 def yahoo_url(start: int = 0, count: int = PAGE_SIZE) -> str:
     return f"{BASE_URL}?start={start}&count={count}"
 
 
-def accept_consent_if_needed(page, target_url: str) -> None:
-    if "consent.yahoo.com" not in page.url:
+class PageOffsets:
+    """The listing offset (``start``) each coin was last found at.
+
+    Large caps rarely change pages, so a fetch goes straight to the pages its
+    coins were last seen on. With a ``path`` the offsets survive between runs
+    (see :meth:`save`).
+    """
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = path
+        self._offsets: Dict[str, int] = {}
+        self._changed = False
+        self._lock = threading.Lock()
+        if path is not None and path.exists():
+            try:
+                stored = json.loads(path.read_text())
+            except ValueError:
+                stored = {}
+            self._offsets = {slug: int(start) for slug, start in stored.items()}
+
+    def get(self, slug: str) -> Optional[int]:
+        with self._lock:
+            return self._offsets.get(slug)
+
+    def record(self, slug: str, start: int) -> None:
+        with self._lock:
+            if self._offsets.get(slug) != start:
+                self._offsets[slug] = start
+                self._changed = True
+
+    def forget(self, slug: str) -> None:
+        with self._lock:
+            if self._offsets.pop(slug, None) is not None:
+                self._changed = True
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._changed:
+                return
+            data = dict(self._offsets)
+            self._changed = False
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        tmp_path.write_text(json.dumps(data, sort_keys=True) + "\n")
+        os.replace(tmp_path, self.path)
+
+
+def on_consent_page(page) -> bool:
+    return "consent.yahoo.com" in page.url
+
+
+def wait_for_consent_redirect(page) -> bool:
+    try:
+        page.wait_for_url(
+            lambda url: "consent.yahoo.com" not in url, timeout=CONSENT_REDIRECT_TIMEOUT
+        )
+    except TimeoutError:
+        return False
+    return True
+
+
+@timed("consent")
+def accept_consent_if_needed(
+    page, target_url: str, latency: Optional[LatencyHistory] = None
+) -> None:
+    if not on_consent_page(page):
         return
 
     buttons = page.locator("button")
@@ -38,27 +124,26 @@ def accept_consent_if_needed(page, target_url: str) -> None:
         candidate = page.locator(f"button:has-text('{label}')")
         if candidate.count():
             candidate.first.click()
-            page.wait_for_timeout(3000)
+            wait_for_consent_redirect(page)
             break
 
-    if "consent.yahoo.com" in page.url and buttons.count():
+    if on_consent_page(page) and buttons.count():
         buttons.first.click()
-        page.wait_for_timeout(3000)
+        wait_for_consent_redirect(page)
 
-    if "consent.yahoo.com" in page.url:
-        page.goto(target_url, wait_until="domcontentloaded", timeout=60000)
-        page.wait_for_timeout(5000)
+    if on_consent_page(page):
+        with timed_wait(latency, "yahoo.consent", CONSENT_RELOAD_TIMEOUT) as timeout:
+            page.goto(target_url, wait_until="domcontentloaded", timeout=timeout)
 
 
-def extract_price_from_row(row) -> Optional[str]:
-    cells = row.locator("td")
-    if cells.count() > 3:
-        candidate = cells.nth(3).inner_text().strip()
+def extract_price_from_row(cells: Sequence[str]) -> Optional[str]:
+    if len(cells) > 3:
+        candidate = cells[3].strip()
         if candidate:
             return candidate
 
-    for i in range(cells.count()):
-        candidate = cells.nth(i).inner_text().strip()
+    for cell in cells:
+        candidate = cell.strip()
         if candidate and any(char.isdigit() for char in candidate):
             return candidate
 
@@ -69,96 +154,181 @@ def normalize_whitespace(text: str) -> str:
     return re.sub(r"\s+", " ", text).strip()
 
 
-def row_matches_coin(row, coin: CoinConfig) -> bool:
-    cells = row.locator("td")
-    if cells.count() <= 1:
-        return False
+def match_row(cells: Sequence[str], index: CoinIndex) -> Optional[CoinConfig]:
+    if len(cells) <= 1:
+        return None
 
-    symbol_cell = normalize_whitespace(cells.nth(0).inner_text())
-    name_cell = normalize_whitespace(cells.nth(1).inner_text())
+    symbol_cell = normalize_whitespace(cells[0])
+    name_cell = normalize_whitespace(cells[1])
 
-    if name_cell == f"{coin.name} USD":
-        return True
+    if name_cell.endswith(" USD"):
+        coin = index.by_name(name_cell[: -len(" USD")])
+        if coin:
+            return coin
 
-    if not name_cell.startswith(coin.name):
-        return False
+    # Fall back to the longest leading run of words that names a tracked coin,
+    # confirmed by its ticker in the symbol cell.
+    words = name_cell.split(" ")
+    for end in range(len(words), 0, -1):
+        coin = index.by_name(" ".join(words[:end]))
+        if coin and coin.symbol in symbol_cell:
+            return coin
 
-    return f"{coin.symbol}-USD" in symbol_cell or f"{coin.symbol} " in symbol_cell or coin.symbol in symbol_cell
+    return None
 
 
-def fetch_coin_price_from_rows(rows, coin: CoinConfig, url: str) -> Optional[PriceResult]:
-    for i in range(rows.count()):
-        row = rows.nth(i)
-        if not row_matches_coin(row, coin):
+@timed("table.match")
+def fetch_page_prices(rows: TableSnapshot, index: CoinIndex, url: str) -> Dict[str, PriceResult]:
+    matches: Dict[str, Tuple[CoinConfig, str]] = {}
+    for cells in rows:
+        coin = match_row(cells, index)
+        if coin is None or coin.slug in matches:
             continue
 
-        text = extract_price_from_row(row)
+        text = extract_price_from_row(cells)
         if not text:
             continue
 
-        return PriceResult(
-            slug=coin.slug,
-            symbol=coin.symbol,
-            name=coin.name,
-            source="",
-            raw=text,
-            price=normalize_price_text(text),
-            currency="USD",
-            url=url,
-        )
+        matches[coin.slug] = (coin, text)
 
-    return None
+    return price_results(matches.values(), url, currency="USD")
 
 
-def wait_for_table(page) -> None:
+def wait_for_table(page, latency: Optional[LatencyHistory] = None) -> None:
     try:
-        page.wait_for_selector("table tbody tr", timeout=15000)
+        with timed_wait(latency, "yahoo.table", TABLE_TIMEOUT) as timeout:
+            page.wait_for_selector(ROW_SELECTOR, timeout=timeout)
     except TimeoutError as exc:
         raise RuntimeError("Timed out waiting for Yahoo Finance table") from exc
 
 
-def fetch_prices(coins: Iterable[CoinConfig]) -> list[PriceResult]:
-    pending = {coin.slug: coin for coin in coins}
-    results: list[PriceResult] = []
-    with sync_playwright() as playwright:
-        browser = playwright.chromium.launch()
-        page = browser.new_page(
-            user_agent=(
-                "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
-                "(KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36"
-            )
-        )
-
-        for start in range(0, MAX_ROWS_TO_SCAN, PAGE_SIZE):
+def read_page(
+    page, url: str, capture: ResponseCapture, latency: Optional[LatencyHistory] = None
+) -> TableSnapshot:
+    """Finish loading ``url``, already navigating in ``page``, and snapshot its table.
+
+    The table is skipped when the captured JSON already priced every coin.
+    """
+    page.wait_for_load_state("domcontentloaded")
+    accept_consent_if_needed(page, url, latency)
+    if capture.complete:
+        return []
+    wait_for_table(page, latency)
+    rows = snapshot_table(page)
+    if not rows:
+        raise RuntimeError("Could not find price table on Yahoo Finance crypto page")
+    return rows
+
+
+def scan_pages(
+    pool: BrowserPool,
+    starts: Sequence[int],
+    index: CoinIndex,
+    pending: Dict[str, CoinConfig],
+    results: List[PriceResult],
+    offsets: PageOffsets,
+    hosts: Sequence[str] = (),
+    latency: Optional[LatencyHistory] = None,
+    failed: Optional[List[int]] = None,
+) -> bool:
+    """Read the listing pages at ``starts`` in order, each in its own tab.
+
+    Every page starts loading before the first is read, so they load in
+    parallel. Coins found move from ``pending`` to ``results`` and their
+    offsets are recorded. Returns ``False`` once a short page shows that the
+    listing has ended. With a ``failed`` list, a page that does not load or
+    has no table is added to it and skipped instead of raising.
+    """
+    tracked = CoinIndex(pending.values())
+    with ExitStack() as stack:
+        tabs = []
+        errors: Dict[int, Exception] = {}
+        for start in starts:
+            page = stack.enter_context(pool.page("yahoo"))
             url = yahoo_url(start=start)
-            page.goto(url, wait_until="domcontentloaded")
-            page.wait_for_timeout(3000)
-            accept_consent_if_needed(page, url)
-            wait_for_table(page)
-
-            rows = page.locator("table tbody tr")
-            row_count = rows.count()
-            if row_count == 0:
-                raise RuntimeError("Could not find price table on Yahoo Finance crypto page")
-
-            for coin in list(pending.values()):
-                result = fetch_coin_price_from_rows(rows, coin, url)
-                if result is None:
-                    continue
-                results.append(result)
-                pending.pop(coin.slug, None)
-
+            capture = stack.enter_context(ResponseCapture(page, tracked, hosts, url=url))
+            try:
+                with span("goto"):
+                    page.goto(url, wait_until="commit")
+            except Exception as exc:
+                # Only raised if the page is read: it may lie past the listing's end.
+                errors[start] = exc
+            tabs.append((start, page, url, capture))
+
+        for start, page, url, capture in tabs:
+            try:
+                if start in errors:
+                    raise errors[start]
+                rows = read_page(page, url, capture, latency)
+            except Exception:
+                if failed is None:
+                    raise
+                failed.append(start)
+                continue
+            page_results = capture.merge(fetch_page_prices(rows, index, url))
+            for slug, result in page_results.items():
+                if pending.pop(slug, None) is not None:
+                    results.append(result)
+                    offsets.record(slug, start)
             if not pending:
-                break
-
-            if row_count < PAGE_SIZE:
-                break
-
-        browser.close()
+                return True
+            if len(rows) < PAGE_SIZE:
+                return False
+    return True
+
+
+def fetch_prices(
+    coins: Iterable[CoinConfig],
+    pool: Optional[BrowserPool] = None,
+    capture_api: bool = True,
+    latency: Optional[LatencyHistory] = None,
+    offsets: Optional[PageOffsets] = None,
+) -> list[PriceResult]:
+    """Prices of ``coins`` from Yahoo's crypto listing.
+
+    The pages the coins were last found on (``offsets``) are read first. The
+    rest of the top ``MAX_ROWS_TO_SCAN`` rows is swept only for coins still
+    missing, including remembered pages that failed to load. The first page
+    of a fetch is always loaded alone, so a consent wall is dealt with once;
+    the pages after it load in parallel tabs.
+    """
+    if pool is None:
+        with BrowserPool() as own_pool:
+            return fetch_prices(coins, own_pool, capture_api, latency, offsets)
+
+    offsets = offsets if offsets is not None else PageOffsets()
+    index = CoinIndex(coins)
+    pending = {coin.slug: coin for coin in index}
+    results: list[PriceResult] = []
+    hosts = API_HOSTS if capture_api else ()
+
+    hinted = sorted({offsets.get(slug) for slug in pending} - {None})
+    # A remembered page that fails is not fatal: its hints are dropped and
+    # the sweep, which includes that page again, looks for its coins.
+    failed: List[int] = []
+    for starts in (hinted[:1], hinted[1:]):
+        if pending and starts:
+            scan_pages(
+                pool, starts, index, pending, results, offsets, hosts, latency, failed=failed
+            )
+    for coin in index:
+        if offsets.get(coin.slug) in failed:
+            offsets.forget(coin.slug)
+
+    read = set(hinted) - set(failed)
+    sweep = [start for start in SWEEP_STARTS if start not in read]
+    for starts in ([sweep] if read else [sweep[:1], sweep[1:]]):
+        if not pending:
+            break
+        if starts and not scan_pages(
+            pool, starts, index, pending, results, offsets, hosts, latency
+        ):
+            break
 
     if pending:
-        missing = ", ".join(sorted(pending))
-        raise RuntimeError(f"Could not find price(s) for {missing}")
+        for slug in pending:
+            offsets.forget(slug)
+        raise MissingPrices(results, sorted(pending))
 
     return results
 
@@ -166,8 +336,35 @@ def fetch_prices(coins: Iterable[CoinConfig]) -> list[PriceResult]:
 class YahooScraper:
     name = "yahoo"
 
-    def __init__(self, coins: Iterable[CoinConfig] = COINS) -> None:
+    def __init__(
+        self,
+        coins: Iterable[CoinConfig] = COINS,
+        pool: Optional[BrowserPool] = None,
+        capture_api: bool = True,
+        latency: Optional[LatencyHistory] = None,
+        retry: RetryPolicy = NO_RETRY,
+        offsets: Optional[PageOffsets] = None,
+    ) -> None:
         self._coins = list(coins)
+        self._pool = pool
+        self._capture_api = capture_api
+        self._latency = latency
+        self._retry = retry
+        # Kept across fetches even without a file, so daemon ticks reuse them.
+        self._offsets = offsets if offsets is not None else PageOffsets()
 
     def fetch(self) -> list[PriceResult]:
-        return fetch_prices(self._coins)
+        try:
+            return fetch_with_retries(
+                lambda coins: fetch_prices(
+                    coins,
+                    pool=self._pool,
+                    capture_api=self._capture_api,
+                    latency=self._latency,
+                    offsets=self._offsets,
+                ),
+                self._coins,
+                self._retry,
+            )
+        finally:
+            self._offsets.save()
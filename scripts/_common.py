@@ -0,0 +1,31 @@
+"""Command-line setup shared by the ``inspect_*.py`` scripts."""
+import argparse
+from pathlib import Path
+from typing import Dict
+
+
+def inspect_parser(description: str) -> argparse.ArgumentParser:
+    """A parser with the ``--record``/``--replay`` options every script takes."""
+    parser = argparse.ArgumentParser(description=description)
+    har = parser.add_mutually_exclusive_group()
+    har.add_argument(
+        "--record", type=Path, metavar="HAR", help="Save the page's traffic to this HAR file"
+    )
+    har.add_argument(
+        "--replay",
+        type=Path,
+        metavar="HAR",
+        help="Load the page from a HAR file (e.g. one written by fetch_prices.py --record)",
+    )
+    return parser
+
+
+def har_options(args: argparse.Namespace) -> Dict[str, str]:
+    """Options for ``new_page``/``new_context`` that record traffic under ``--record``."""
+    return {"record_har_path": str(args.record)} if args.record else {}
+
+
+def replay_har(target, args: argparse.Namespace) -> None:
+    """Serve ``target`` (a page or context) from the ``--replay`` HAR, if given."""
+    if args.replay:
+        target.route_from_har(args.replay, not_found="abort")
@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 import json
 import re
+
 from playwright.sync_api import sync_playwright
 
+from _common import har_options, inspect_parser, replay_har
+
 URL = "https://www.kraken.com/prices"
 
 
 def main() -> int:
+    args = inspect_parser("Inspect the Kraken prices page").parse_args()
+
     with sync_playwright() as p:
         browser = p.chromium.launch(
             headless=True,
@@ -16,8 +21,10 @@ def main() -> int:
             user_agent=(
                 "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
                 "(KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36"
-            )
+            ),
+            **har_options(args),
         )
+        replay_har(context, args)
         page = context.new_page()
         page.add_init_script(
             "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
@@ -125,6 +132,7 @@ def main() -> int:
                     except json.JSONDecodeError as exc:
                         print("next_data json error", exc)
 
+        context.close()
         browser.close()
     return 0
 
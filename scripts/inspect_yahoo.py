@@ -1,15 +1,21 @@
 #!/usr/bin/env python3
 import json
 import re
+
 from playwright.sync_api import sync_playwright
 
+from _common import har_options, inspect_parser, replay_har
+
 URL = "https://finance.yahoo.com/markets/crypto/all/?start=0&count=100"
 
 
 def main() -> int:
+    args = inspect_parser("Inspect the Yahoo Finance crypto page").parse_args()
+
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
+        page = browser.new_page(**har_options(args))
+        replay_har(page, args)
         page.goto(URL, wait_until="domcontentloaded", timeout=60000)
         page.wait_for_timeout(5000)
 
@@ -94,6 +100,7 @@ def main() -> int:
                     except json.JSONDecodeError as exc:
                         print("next_data json error", exc)
 
+        page.context.close()
         browser.close()
     return 0
 
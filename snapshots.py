@@ -0,0 +1,262 @@
+"""Encoding, compressing and writing the daily JSON snapshots.
+
+The default output is byte-for-byte what ``json.dumps(payload, indent=2,
+sort_keys=True)`` produces, but the quotes list is encoded by a dedicated
+writer: ``indent=`` forces :mod:`json` onto its pure-Python encoder, and the
+quotes are nearly all of every snapshot. ``compact`` drops the whitespace,
+and the bytes can then be gzip- or (when ``zstandard`` is installed)
+zstd-compressed. :func:`write_snapshot_files` writes the encoded bytes once
+and links them into every destination atomically.
+
+In intraday mode each run is appended as one JSON line to
+``intraday/YYYY-MM-DD.jsonl`` instead, and :func:`compact_intraday` later
+rolls a day's log into its daily snapshot. A compacted snapshot keeps every
+run under ``batches``; its top-level fields mirror the last run of the day.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import math
+import os
+from datetime import datetime
+from json.encoder import encode_basestring_ascii
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; only --compress zstd needs it.
+    zstandard = None
+
+SNAPSHOT_DATE_FORMAT = "%Y-%m-%d"
+SNAPSHOT_SUFFIX = ".json"
+COMPRESSION_SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+SNAPSHOT_SUFFIXES = tuple(
+    SNAPSHOT_SUFFIX + suffix for suffix in COMPRESSION_SUFFIXES.values()
+)
+INTRADAY_DIR = "intraday"
+INTRADAY_SUFFIX = ".jsonl"
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+INDENT = "  "
+QUOTES_PLACEHOLDER = "\x00quotes\x00"
+
+
+def available_compressions() -> List[str]:
+    return [
+        name
+        for name in COMPRESSION_SUFFIXES
+        if name is not None and (name != "zstd" or zstandard is not None)
+    ]
+
+
+def snapshot_suffix(compression: Optional[str] = None) -> str:
+    return SNAPSHOT_SUFFIX + COMPRESSION_SUFFIXES[compression]
+
+
+def encode_scalar(value: object) -> Optional[str]:
+    """JSON for ``value`` exactly as :mod:`json` writes it, or ``None`` if not a scalar."""
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, int):
+        return int.__repr__(value)
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "Infinity" if value > 0 else "-Infinity"
+        return float.__repr__(value)
+    return None
+
+
+def encode_records(records: Sequence[Dict[str, object]], level: int) -> Optional[str]:
+    """Encode a list of flat dicts as indented JSON nested ``level`` deep.
+
+    Returns ``None`` when a record holds anything but scalars, so the caller
+    can fall back to :func:`json.dumps`.
+    """
+    if not records:
+        return "[]"
+    item_indent = "\n" + INDENT * (level + 1)
+    field_indent = item_indent + INDENT
+    item_close = item_indent + "}"
+    # Records of the same shape share one sorted list of pre-encoded keys.
+    layouts: Dict[tuple, List[Tuple[str, str]]] = {}
+    items = []
+    for record in records:
+        shape = tuple(record)
+        layout = layouts.get(shape)
+        if layout is None:
+            if not all(isinstance(key, str) for key in shape):
+                return None
+            layout = layouts[shape] = [
+                (key, f"{field_indent}{encode_basestring_ascii(key)}: ")
+                for key in sorted(shape)
+            ]
+        if not layout:
+            items.append("{}")
+            continue
+        parts = []
+        for key, prefix in layout:
+            value = record[key]
+            encoded = (
+                encode_basestring_ascii(value) if type(value) is str else encode_scalar(value)
+            )
+            if encoded is None:
+                return None
+            parts.append(prefix + encoded)
+        items.append("{" + ",".join(parts) + item_close)
+    return "[" + item_indent + ("," + item_indent).join(items) + "\n" + INDENT * level + "]"
+
+
+def encode_snapshot(payload: Dict[str, object], compact: bool = False) -> bytes:
+    """Serialize a snapshot payload to UTF-8 JSON with a trailing newline."""
+    if compact:
+        text = json.dumps(payload, separators=(",", ":"), sort_keys=True)
+        return (text + "\n").encode()
+
+    quotes = payload.get("quotes")
+    encoded_quotes = encode_records(quotes, level=1) if isinstance(quotes, list) else None
+    if encoded_quotes is None:
+        return (json.dumps(payload, indent=2, sort_keys=True) + "\n").encode()
+
+    text = json.dumps({**payload, "quotes": QUOTES_PLACEHOLDER}, indent=2, sort_keys=True)
+    text = text.replace(encode_basestring_ascii(QUOTES_PLACEHOLDER), encoded_quotes, 1)
+    return (text + "\n").encode()
+
+
+def compress(data: bytes, compression: Optional[str]) -> bytes:
+    if compression is None:
+        return data
+    if compression == "gzip":
+        # mtime=0 keeps the output identical for identical input.
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd compression needs the zstandard package")
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def decompress(data: bytes, path: Path) -> bytes:
+    if path.name.endswith(".gz"):
+        return gzip.decompress(data)
+    if path.name.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"Reading {path} needs the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def read_snapshot(path: Path) -> Dict[str, object]:
+    """Load a snapshot file, decompressing it according to its suffix."""
+    with open(path, "rb") as handle:
+        return json.loads(decompress(handle.read(), path))
+
+
+def write_snapshot_files(content: bytes, paths: Sequence[Path]) -> None:
+    """Write ``content`` once and atomically replace every path in ``paths`` with it.
+
+    The bytes go to a temporary file next to the first path, which is then
+    hard-linked (or copied, where links are unsupported) to a temporary name
+    beside each other path; every temporary is renamed into place only once
+    all of them exist, so readers never see a partially written snapshot.
+    """
+    first = paths[0]
+    first.parent.mkdir(parents=True, exist_ok=True)
+    tag = f"{os.getpid()}.tmp"
+    staged = [path.with_name(f".{path.name}.{tag}") for path in paths]
+    try:
+        staged[0].write_bytes(content)
+        for staged_path in staged[1:]:
+            try:
+                os.link(staged[0], staged_path)
+            except OSError:
+                staged_path.write_bytes(content)
+        for path, staged_path in reversed(list(zip(paths, staged))):
+            os.replace(staged_path, path)
+    except BaseException:
+        for staged_path in staged:
+            staged_path.unlink(missing_ok=True)
+        raise
+
+
+def intraday_log_path(output_dir: Path, moment: datetime) -> Path:
+    return output_dir / INTRADAY_DIR / f"{moment.strftime(SNAPSHOT_DATE_FORMAT)}{INTRADAY_SUFFIX}"
+
+
+def drop_torn_line(handle, block_size: int = 65536) -> None:
+    """Truncate a partial last line left behind by a crashed append."""
+    end = handle.seek(0, os.SEEK_END)
+    if not end:
+        return
+    handle.seek(end - 1)
+    if handle.read(1) == b"\n":
+        return
+    position = end
+    while position > 0:
+        start = max(0, position - block_size)
+        handle.seek(start)
+        newline = handle.read(position - start).rfind(b"\n")
+        if newline != -1:
+            handle.truncate(start + newline + 1)
+            return
+        position = start
+    handle.truncate(0)
+
+
+def append_intraday(path: Path, payload: Dict[str, object]) -> None:
+    """Append one run's payload to an intraday log as a single JSON line."""
+    line = (json.dumps(payload, separators=(",", ":"), sort_keys=True) + "\n").encode()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab+") as handle:
+        drop_torn_line(handle)
+        handle.write(line)
+        handle.flush()
+        os.fsync(handle.fileno())
+
+
+def read_intraday(path: Path) -> Iterator[Dict[str, object]]:
+    """Yield the payloads in an intraday log, skipping a torn final line."""
+    with open(path, "rb") as handle:
+        for line in handle:
+            if not line.endswith(b"\n"):
+                break
+            yield json.loads(line)
+
+
+def read_batches(path: Path) -> Iterator[Dict[str, object]]:
+    """Yield every run stored in a daily snapshot or an intraday log."""
+    if path.name.endswith(INTRADAY_SUFFIX):
+        yield from read_intraday(path)
+        return
+    payload = read_snapshot(path)
+    yield from payload.get("batches") or [payload]
+
+
+def compact_intraday(
+    log_path: Path,
+    snapshot_path: Path,
+    compact: bool = False,
+    compression: Optional[str] = None,
+) -> Path:
+    """Roll an intraday log into ``snapshot_path`` and delete the log.
+
+    Runs already in ``snapshot_path`` (from an earlier compaction or a plain
+    daily run) are kept ahead of the logged ones.
+    """
+    batches = list(read_batches(snapshot_path)) if snapshot_path.exists() else []
+    batches.extend(read_intraday(log_path))
+    if batches:
+        payload = {**batches[-1], "batches": batches}
+        content = compress(encode_snapshot(payload, compact=compact), compression)
+        write_snapshot_files(content, [snapshot_path])
+    log_path.unlink()
+    return snapshot_path
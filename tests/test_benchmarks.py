@@ -0,0 +1,41 @@
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.fixtures import build_site
+from benchmarks.replay import ReplayPool, serve_documents
+from benchmarks.run import expected_results, fetcher, measure
+from scrapers import binance
+
+
+@pytest.mark.parametrize("source", ["coingecko", "kraken", "yahoo", "coinmarketcap", "coindesk"])
+@pytest.mark.parametrize("mode", ["table", "api"])
+def test_replayed_fixtures_yield_every_price(source, mode):
+    site = build_site(source, 100)
+
+    results = fetcher(source, site, ReplayPool([site]), mode)()
+
+    assert len(results) == expected_results(source, site)
+    assert {result.slug for result in results} == {coin.slug for coin in site.coins}
+
+
+def test_fixtures_are_deterministic():
+    assert build_site("yahoo", 100) == build_site("yahoo", 100)
+    assert build_site("yahoo", 100) != build_site("yahoo", 7)
+
+
+def test_binance_is_measured_against_a_local_stand_in():
+    site = build_site("binance", 7)
+    original = binance.STATIC_URL
+
+    with serve_documents(site, binance) as base:
+        assert binance.STATIC_URL.startswith(base)
+        row = measure("binance", site, fetcher("binance", site, None, "api"), repeat=1)
+
+    assert binance.STATIC_URL == original
+    assert "python_ms" in row and "end_to_end_ms" not in row
+    assert row["extract_us_per_row"] > 0
+    assert row["peak_kib"] > 0
@@ -0,0 +1,126 @@
+from pathlib import Path
+import sys
+import threading
+import time
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import daemon
+from daemon import Schedule, next_due, run_daemon
+from scrapers import PriceResult
+
+
+def test_next_due_follows_grid_and_skips_missed_ticks():
+    assert next_due(10.0, 5.0, now=12.0) == (15.0, 0)
+    assert next_due(10.0, 5.0, now=15.0) == (20.0, 1)
+    assert next_due(10.0, 5.0, now=27.0) == (30.0, 3)
+
+
+class CountingScraper:
+    def __init__(self, name: str, duration: float = 0.0, error: str | None = None):
+        self.name = name
+        self._duration = duration
+        self._error = error
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def fetch(self):
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.threads.add(threading.get_ident())
+        time.sleep(self._duration)
+        with self._lock:
+            self.running -= 1
+        if self._error:
+            raise RuntimeError(self._error)
+        return [PriceResult(self.name, "X", "X", "", "1", 1.0, "USD", "u")]
+
+
+class FakePool:
+    def __init__(self):
+        self.released = []
+
+    def release(self):
+        self.released.append(threading.get_ident())
+
+
+def run_for(seconds: float, scrapers, schedules, pool=None):
+    ticks = []
+    lock = threading.Lock()
+
+    def on_tick(source, fetched_at, results, errors):
+        with lock:
+            ticks.append((source, len(results), [error["error"] for error in errors]))
+
+    stop = threading.Event()
+    timer = threading.Timer(seconds, stop.set)
+    timer.start()
+    run_daemon(scrapers, schedules, on_tick, pool=pool, stop=stop)
+    timer.cancel()
+    return ticks
+
+
+def test_run_daemon_polls_each_source_on_its_own_thread_and_interval():
+    fast = CountingScraper("fast")
+    slow = CountingScraper("slow")
+    failing = CountingScraper("failing", error="boom")
+    pool = FakePool()
+
+    ticks = run_for(
+        0.35,
+        [fast, slow, failing],
+        {"fast": Schedule(0.05), "slow": Schedule(1.0), "failing": Schedule(1.0)},
+        pool=pool,
+    )
+
+    assert fast.calls >= 5
+    assert slow.calls == 1
+    assert len(fast.threads) == len(slow.threads) == 1
+    assert fast.threads != slow.threads
+    assert ("failing", 0, ["boom"]) in ticks
+    assert ("slow", 1, []) in ticks
+    assert len(pool.released) == 3
+
+
+def test_run_daemon_skips_ticks_while_the_previous_one_runs(capsys):
+    busy = CountingScraper("busy", duration=0.12)
+
+    run_for(0.3, [busy], {"busy": Schedule(0.05)})
+
+    assert busy.max_running == 1
+    assert busy.calls <= 3
+    assert "skipped" in capsys.readouterr().err
+
+
+def test_source_loop_applies_jitter_on_top_of_the_grid(monkeypatch):
+    waits = []
+    stop = threading.Event()
+
+    class FixedRandom:
+        def uniform(self, low, high):
+            return high
+
+    def fake_wait(delay):
+        waits.append(round(delay, 6))
+        if len(waits) == 3:
+            return True
+        return False
+
+    clock_values = iter([0.0, 0.0, 0.0, 10.0, 10.0, 20.0])
+    monkeypatch.setattr(stop, "wait", fake_wait)
+
+    daemon.source_loop(
+        CountingScraper("jittery"),
+        Schedule(10.0, jitter=2.0),
+        lambda *args: None,
+        stop,
+        clock=lambda: next(clock_values),
+        rng=FixedRandom(),
+    )
+
+    assert waits == [2.0, 2.0, 2.0]
@@ -1,13 +1,41 @@
 from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
+import gzip
+import json
 import sys
+import threading
+import time
+
+import pytest
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
-from fetch_prices import output_path, serialize_prices
-from scrapers import PriceResult, merge_results
-from scrapers.coins import CoinConfig
-from scrapers.utils import normalize_price_text
+from fetch_prices import (
+    DaemonRecorder,
+    output_path,
+    run_scrapers,
+    save_snapshot,
+    serialize_prices,
+)
+from history import HistoryStore
+from scrapers import MissingPrices, PriceBatch, PriceResult, fetch_source, merge_results
+from scrapers.capture import extract_json_prices
+from scrapers.coins import COINS, CoinConfig, CoinIndex
+from scrapers.http_client import HttpClient
+from scrapers.recording import Recording
+from scrapers.response_cache import ResponseCache, Validated
+from scrapers.storage_state import StorageStates
+from scrapers.utils import currency_from_text, normalize_price_text, normalize_price_texts
+from scrapers import binance as binance_scraper
+from scrapers import browser as browser_pool
+from scrapers import coindesk as coindesk_scraper
+from scrapers import coingecko as coingecko_scraper
+from scrapers import kraken as kraken_scraper
+from scrapers import retry
+from scrapers import table
+from scrapers import timing
 from scrapers import yahoo as yahoo_scraper
 
 
@@ -23,6 +51,46 @@ def test_normalize_price_text_euro_style():
     assert normalize_price_text("1.234,56") == 1234.56
 
 
+PRICE_TEXTS = [
+    "12345.67",
+    "5.",
+    ".5",
+    "$42,123.45",
+    "€39,100.00",
+    "£0.0012",
+    "1.234,56",
+    "€1.234,56",
+    "12,345",
+    "1,5",
+    "$1,23",
+    "US$ 1,234.56",
+    "-3.5%",
+    "1e-05",
+    "€1 / $2",
+    "٣٤",
+    "1.2.3",
+    "$",
+]
+
+
+def test_normalize_price_texts_matches_scalar_parsing():
+    texts = [text for text in PRICE_TEXTS if text not in {"1.2.3", "$", "٣٤"}]
+
+    prices, currencies = normalize_price_texts(texts, default_currency="USDT")
+
+    assert prices.typecode == "d"
+    assert list(prices) == [normalize_price_text(text) for text in texts]
+    assert currencies == [currency_from_text(text, default="USDT") for text in texts]
+
+
+@pytest.mark.parametrize("text", ["1.2.3", "$", "٣٤"])
+def test_normalize_price_texts_rejects_what_scalar_rejects(text):
+    with pytest.raises(ValueError):
+        normalize_price_text(text)
+    with pytest.raises(ValueError):
+        normalize_price_texts(["1", text])
+
+
 def test_output_path_uses_date():
     target = output_path(Path("data"), datetime(2024, 1, 2, tzinfo=timezone.utc))
     assert target.as_posix() == "data/2024-01-02.json"
@@ -70,12 +138,283 @@ def test_serialize_prices_uses_dicts():
     assert serialized[0]["source"] == "source_a"
 
 
-class FakeTextNode:
-    def __init__(self, text: str):
-        self._text = text
+def test_merge_results_builds_interned_batch_without_records():
+    bitcoin = PriceResult("bitcoin", "BTC", "Bitcoin", "", "$1", 1.0, "USD", "a")
+    ethereum = PriceResult("ethereum", "ETH", "Ethereum", "", "$2", 2.0, "USD", "a")
+    merged = merge_results([("source_a", [bitcoin, ethereum]), ("source_b", [bitcoin])])
+
+    assert isinstance(merged, PriceBatch)
+    assert len(merged) == 3
+    assert list(merged.price) == [1.0, 2.0, 1.0]
+    assert merged.source == ["source_a", "source_a", "source_b"]
+    assert merged.source[0] is merged.source[1]
+    assert merged[2] == PriceResult(
+        "bitcoin", "BTC", "Bitcoin", "source_b", "$1", 1.0, "USD", "a"
+    )
+    assert not hasattr(merged[0], "__dict__")
+
+
+def test_serialize_prices_matches_asdict_for_batches():
+    results = [
+        PriceResult("bitcoin", "BTC", "Bitcoin", "kraken", "€1", 1.0, "EUR", "k"),
+        PriceResult("ethereum", "ETH", "Ethereum", "kraken", "€2", 2.0, "EUR", "k"),
+    ]
+
+    assert serialize_prices(PriceBatch.from_results(results)) == serialize_prices(results)
+
+
+def test_save_snapshot_intraday_appends_and_rolls_over_days(tmp_path):
+    day_one = datetime(2024, 1, 1, 23, 55, tzinfo=timezone.utc)
+    day_two = datetime(2024, 1, 2, 0, 0, tzinfo=timezone.utc)
+
+    def payload(moment):
+        return {"date": moment.date().isoformat(), "fetched_at": moment.isoformat(), "quotes": []}
+
+    first = save_snapshot(tmp_path, payload(day_one), day_one, intraday=True)
+    save_snapshot(tmp_path, payload(day_one), day_one, intraday=True)
+
+    assert first == tmp_path / "intraday" / "2024-01-01.jsonl"
+    assert len(first.read_text().splitlines()) == 2
+    assert not (tmp_path / "2024-01-01.json").exists()
+
+    save_snapshot(tmp_path, payload(day_two), day_two, intraday=True)
+
+    assert not first.exists()
+    rolled = json.loads((tmp_path / "2024-01-01.json").read_text())
+    assert len(rolled["batches"]) == 2
+    assert json.loads((tmp_path / "latest.json").read_text())["fetched_at"] == day_two.isoformat()
+
+
+def test_daemon_recorder_logs_each_tick_and_merges_latest(tmp_path):
+    store = HistoryStore(tmp_path / "history")
+    recorder = DaemonRecorder(tmp_path, ["kraken", "yahoo"], store=store)
+    first = datetime(2024, 1, 1, 0, 0, tzinfo=timezone.utc)
+    second = datetime(2024, 1, 1, 0, 1, tzinfo=timezone.utc)
+    bitcoin = PriceResult("bitcoin", "BTC", "Bitcoin", "", "$1", 1.0, "USD", "u")
+
+    recorder("yahoo", first, [bitcoin], [])
+    recorder("kraken", second, [bitcoin], [])
+    recorder("yahoo", second, [], [{"source": "yahoo", "error": "Timeout"}])
+
+    log = (tmp_path / "intraday" / "2024-01-01.jsonl").read_text().splitlines()
+    assert [json.loads(line)["sources"] for line in log] == [["yahoo"], ["kraken"], ["yahoo"]]
+    latest = json.loads((tmp_path / "latest.json").read_text())
+    assert [quote["source"] for quote in latest["quotes"]] == ["kraken", "yahoo"]
+    assert latest["errors"] == [{"source": "yahoo", "error": "Timeout"}]
+    assert store.rows == 2
+
+
+class FakeScraper:
+    def __init__(self, name: str, delay: float = 0.0, error: str | None = None):
+        self.name = name
+        self._delay = delay
+        self._error = error
+        self.thread = None
+
+    def fetch(self):
+        self.thread = threading.get_ident()
+        time.sleep(self._delay)
+        if self._error:
+            raise RuntimeError(self._error)
+        return [PriceResult("bitcoin", "BTC", "Bitcoin", "", "$1", 1.0, "USD", self.name)]
+
+
+def test_run_scrapers_keeps_order_and_errors():
+    scrapers = [
+        FakeScraper("slow", delay=0.05),
+        FakeScraper("broken", error="boom"),
+        FakeScraper("fast"),
+    ]
+
+    collected, errors = run_scrapers(scrapers, max_workers=3)
+
+    assert [name for name, _ in collected] == ["slow", "fast"]
+    assert errors == [{"source": "broken", "error": "boom"}]
+
+
+def test_run_scrapers_runs_concurrently():
+    scrapers = [FakeScraper(f"source_{i}", delay=0.2) for i in range(4)]
+
+    started = time.monotonic()
+    collected, errors = run_scrapers(scrapers, max_workers=4)
+    elapsed = time.monotonic() - started
+
+    assert len(collected) == 4
+    assert not errors
+    assert elapsed < 0.6
+
+
+def test_run_scrapers_respects_worker_limit():
+    scrapers = [FakeScraper(f"source_{i}") for i in range(5)]
+
+    run_scrapers(scrapers, max_workers=1)
+
+    assert len({scraper.thread for scraper in scrapers}) == 1
+
+
+class PartialScraper:
+    name = "partial"
+
+    def fetch(self):
+        bitcoin = PriceResult("bitcoin", "BTC", "Bitcoin", "", "$1", 1.0, "USD", "u")
+        raise MissingPrices([bitcoin], ["monero", "arbitrum"])
+
+
+def test_run_scrapers_keeps_partial_results_and_reports_each_miss():
+    collected, errors = run_scrapers([PartialScraper(), FakeScraper("fast")])
+
+    assert [(name, [entry.slug for entry in data]) for name, data in collected] == [
+        ("partial", ["bitcoin"]),
+        ("fast", ["bitcoin"]),
+    ]
+    assert errors == [
+        {"source": "partial", "slug": "monero", "error": "Could not find price for monero"},
+        {"source": "partial", "slug": "arbitrum", "error": "Could not find price for arbitrum"},
+    ]
+
+
+def test_kraken_keeps_prices_from_a_currency_with_misses(monkeypatch):
+    coins = COINS[:2]
+    bitcoin_eur = PriceResult("bitcoin", "BTC", "Bitcoin", "", "€1", 1.0, "EUR", "k")
+    usd = [
+        PriceResult(coin.slug, coin.symbol, coin.name, "", "$1", 1.0, "USD", "k")
+        for coin in coins
+    ]
+
+    def fetch_prices_for_currency(page, index, currency, hosts, latency, api_urls=None):
+        if currency == "EUR":
+            raise MissingPrices([bitcoin_eur], ["ethereum"])
+        return usd
+
+    page = FakePage(url="about:blank")
+    monkeypatch.setattr(
+        browser_pool, "sync_playwright", lambda: FakePlaywrightManager(lambda: page)
+    )
+    monkeypatch.setattr(kraken_scraper, "fetch_prices_for_currency", fetch_prices_for_currency)
+
+    with pytest.raises(MissingPrices) as caught:
+        kraken_scraper.fetch_prices(coins)
+
+    assert caught.value.results == [bitcoin_eur, *usd]
+    assert caught.value.misses == ["ethereum"]
+    assert caught.value.errors("kraken") == [
+        {
+            "source": "kraken",
+            "slug": "ethereum",
+            "currency": "EUR",
+            "error": "Could not find EUR price for ethereum",
+        }
+    ]
+
+
+def test_kraken_reads_other_currencies_from_the_captured_json():
+    assert (
+        kraken_scraper.currency_variant("https://k/api/prices?currency=eur&n=7", "EUR", "USD")
+        == "https://k/api/prices?currency=usd&n=7"
+    )
+    assert kraken_scraper.currency_variant("https://k/api/prices-EUR.json", "EUR", "GBP") == (
+        "https://k/api/prices-GBP.json"
+    )
+    assert kraken_scraper.currency_variant("https://k/api/europe", "EUR", "USD") is None
+
+    class JsonPage:
+        def __init__(self, record):
+            self.record = record
+            self.fetched = []
+
+        def evaluate(self, script, url):
+            self.fetched.append(url)
+            return {"result": [self.record]}
+
+    index = CoinIndex(COINS[:1])
+    eur = extract_json_prices(
+        {"name": "Bitcoin", "price": "39000.00", "currency": "EUR"}, index, kraken_scraper.HOME_URL, "EUR"
+    )
+    page = JsonPage({"name": "Bitcoin", "price": "42000.00", "currency": "USD"})
+    found = kraken_scraper.fetch_variant_prices(
+        page, index, ["https://k/api/prices-EUR.json", "https://k/other"], "EUR", "USD", eur
+    )
+
+    assert page.fetched == ["https://k/api/prices-USD.json"]
+    assert [(price.slug, price.price, price.currency) for price in found.values()] == [
+        ("bitcoin", 42000.0, "USD")
+    ]
+
+    # Without a currency field, only prices converted at one rate show the
+    # code was honoured; a refresh in the shown currency moves prices too.
+    index = CoinIndex(COINS[:3])
+    urls = ["https://k/api/prices-EUR.json"]
+    eur = {
+        slug: PriceResult(slug, "", "", "", "", value, "EUR", "k")
+        for slug, value in (("bitcoin", 39000.0), ("ethereum", 2000.0), ("solana", 100.0))
+    }
+
+    class PayloadPage:
+        def __init__(self, prices):
+            self.prices = prices
+
+        def evaluate(self, script, url):
+            names = {"bitcoin": "Bitcoin", "ethereum": "Ethereum", "solana": "Solana"}
+            return {"result": [{"name": names[slug], "price": str(value)} for slug, value in self.prices]}
+
+    refreshed = PayloadPage([("bitcoin", 39400.0), ("ethereum", 1990.0), ("solana", 103.0)])
+    assert kraken_scraper.fetch_variant_prices(refreshed, index, urls, "EUR", "USD", eur) == {}
+    same = PayloadPage([("bitcoin", 39000.0), ("ethereum", 2000.0), ("solana", 100.0)])
+    assert kraken_scraper.fetch_variant_prices(same, index, urls, "EUR", "USD", eur) == {}
+    usd = PayloadPage([("bitcoin", 42120.0), ("ethereum", 2161.0), ("solana", 108.0)])
+    found = kraken_scraper.fetch_variant_prices(usd, index, urls, "EUR", "USD", eur)
+    assert [(price.slug, price.price, price.currency) for price in found.values()] == [
+        ("bitcoin", 42120.0, "USD"),
+        ("ethereum", 2161.0, "USD"),
+        ("solana", 108.0, "USD"),
+    ]
+
+
+def test_binance_matches_every_quote_in_one_pass():
+    pairs = binance_scraper.pair_map(
+        [
+            {"s": "BTCUSDT", "b": "BTC", "q": "USDT"},
+            {"s": "BTCEUR", "b": "BTC", "q": "EUR"},
+            {"s": "ETHUSDT", "b": "ETH", "q": "USDT"},
+        ]
+    )
+    tickers = [{"s": "BTCUSDT", "c": "42000"}, {"s": "BTCEUR", "c": "39000"}, {"s": "ETHUSDT", "c": "2200"}]
+    coins = [coin for coin in COINS if coin.symbol in ("BTC", "ETH")]
+
+    results = binance_scraper.match_market_data(pairs, tickers, coins, quotes=("USDT", "EUR"))
+
+    assert [(result.symbol, result.currency, result.price) for result in results] == [
+        ("BTC", "USDT", 42000.0),
+        ("BTC", "EUR", 39000.0),
+        ("ETH", "USDT", 2200.0),
+    ]
+
+
+def test_binance_reports_only_listed_coins_without_a_price(monkeypatch, tmp_path):
+    documents = {
+        binance_scraper.STATIC_URL: {
+            "data": [
+                {"s": "BTCUSDT", "b": "BTC", "q": "USDT"},
+                {"s": "BTCEUR", "b": "BTC", "q": "EUR"},
+                {"s": "ETHUSDT", "b": "ETH", "q": "USDT"},
+                {"s": "SOLUSDT", "b": "SOL", "q": "USDT"},
+            ]
+        },
+        binance_scraper.DYNAMIC_URL: {
+            "data": [{"s": "BTCUSDT", "c": "42000"}, {"s": "BTCEUR", "c": "39000"}, {"s": "ETHUSDT", "c": "2200"}]
+        },
+    }
+    monkeypatch.setattr(binance_scraper, "download_documents", lambda client: documents)
+    coins = [coin for coin in COINS if coin.symbol in ("BTC", "ETH", "SOL", "XMR")]
+
+    # ETH has no EUR pair and XMR no pair at all: neither can be fetched, so
+    # only SOL, listed but without a ticker, is missing.
+    with pytest.raises(MissingPrices) as caught:
+        binance_scraper.fetch_prices(coins, recording=Recording(tmp_path), quotes=("USDT", "EUR"))
 
-    def inner_text(self) -> str:
-        return self._text
+    assert caught.value.misses == ["solana"]
+    assert caught.value.currencies == {"solana": ["USDT"]}
+    assert len(caught.value.results) == 3
 
 
 class FakeListLocator:
@@ -94,81 +433,468 @@ class FakeListLocator:
 
 
 class FakeButton:
-    def click(self) -> None:
-        return None
-
-
-class FakeRow:
-    def __init__(self, cells: list[str]):
-        self._cells = cells
+    def __init__(self, on_click=None):
+        self._on_click = on_click
 
-    def locator(self, selector: str):
-        assert selector == "td"
-        return FakeListLocator([FakeTextNode(cell) for cell in self._cells])
+    def click(self) -> None:
+        if self._on_click:
+            self._on_click()
 
 
 class FakePage:
-    def __init__(self, rows_by_url=None, url="https://consent.yahoo.com/v2/collectConsent"):
+    def __init__(
+        self,
+        rows_by_url=None,
+        url="https://consent.yahoo.com/v2/collectConsent",
+        responses_by_url=None,
+    ):
         self.url = url
         self._rows_by_url = rows_by_url or {}
+        self._responses_by_url = responses_by_url or {}
         self._rows = []
+        self._listeners: list = []
         self.goto_calls: list[str] = []
+        self.selector_waits = 0
+        self.buttons: dict[str, FakeButton] = {}
+
+    def on(self, event: str, handler) -> None:
+        assert event == "response"
+        self._listeners.append(handler)
+
+    def remove_listener(self, event: str, handler) -> None:
+        self._listeners.remove(handler)
 
     def goto(self, url: str, wait_until="domcontentloaded", timeout=None) -> None:
         self.url = url
         self.goto_calls.append(url)
         self._rows = self._rows_by_url.get(url, [])
+        for response in self._responses_by_url.get(url, []):
+            for handler in list(self._listeners):
+                handler(response)
+
+    def wait_for_load_state(self, state="load", timeout=None) -> None:
+        pass
 
     def wait_for_timeout(self, timeout_ms: int) -> None:
-        return None
+        raise AssertionError("fixed sleeps should not be used")
+
+    def wait_for_url(self, predicate, timeout: int) -> None:
+        if not predicate(self.url):
+            raise PlaywrightTimeoutError("still on consent page")
 
     def wait_for_selector(self, selector: str, timeout: int) -> None:
         assert selector == "table tbody tr"
-        return None
+        self.selector_waits += 1
 
     def locator(self, selector: str):
         if selector == "button":
-            return FakeListLocator([])
+            return FakeListLocator(list(self.buttons.values()))
         if selector.startswith("button:has-text("):
-            return FakeListLocator([])
-        if selector == "table tbody tr":
-            return FakeListLocator(self._rows)
+            label = selector[len("button:has-text('") : -len("')")]
+            return FakeListLocator([self.buttons[label]] if label in self.buttons else [])
         raise AssertionError(f"unexpected selector: {selector}")
 
+    def eval_on_selector_all(self, selector: str, script: str):
+        assert selector == "table tbody tr"
+        return [list(cells) for cells in self._rows]
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self, page_factory, options=None):
+        self._page_factory = page_factory
+        self.options = options or {}
+        self.init_scripts: list[str] = []
+        self.routes: list = []
+        self.har_routes: list = []
+        self.pages_created = 0
+        self.closed = False
+
+    def new_page(self):
+        self.pages_created += 1
+        return self._page_factory()
+
+    def add_init_script(self, script: str) -> None:
+        self.init_scripts.append(script)
+
+    def route(self, pattern: str, handler) -> None:
+        self.routes.append((pattern, handler))
+
+    def route_from_har(self, path, not_found="fallback") -> None:
+        self.har_routes.append((path, not_found))
+
+    def storage_state(self):
+        return {"cookies": [{"name": "consent", "value": "yes"}], "origins": []}
+
+    def close(self) -> None:
+        self.closed = True
+
 
 class FakeBrowser:
-    def __init__(self, page: FakePage):
-        self._page = page
+    def __init__(self, page_factory):
+        self._page_factory = page_factory
+        self.contexts: list[FakeContext] = []
+        self.closed = False
 
-    def new_page(self, user_agent: str):
-        return self._page
+    def new_context(self, user_agent: str, **options):
+        context = FakeContext(self._page_factory, options)
+        self.contexts.append(context)
+        return context
 
     def close(self) -> None:
-        return None
+        self.closed = True
 
 
 class FakeChromium:
-    def __init__(self, page: FakePage):
-        self._page = page
+    def __init__(self, page_factory):
+        self._page_factory = page_factory
+        self.browsers: list[FakeBrowser] = []
+        self.connections: list[str] = []
+
+    def launch_persistent_context(self, user_data_dir, headless=True, args=None):
+        # Chromium reports the port it picked for --remote-debugging-port=0.
+        assert "--remote-debugging-port=0" in args
+        Path(user_data_dir, "DevToolsActivePort").write_text("9222\n/devtools/browser/fake\n")
+        browser = FakeBrowser(self._page_factory)
+        self.browsers.append(browser)
+        return browser
 
-    def launch(self):
-        return FakeBrowser(self._page)
+    def connect_over_cdp(self, endpoint):
+        # Every connection reaches the one browser that was launched; a fresh
+        # fake (one per sync_playwright() call) stands in for it.
+        self.connections.append(endpoint)
+        return self.browsers[-1] if self.browsers else FakeBrowser(self._page_factory)
 
 
 class FakePlaywright:
-    def __init__(self, page: FakePage):
-        self.chromium = FakeChromium(page)
+    def __init__(self, page_factory):
+        self.chromium = FakeChromium(page_factory)
+
+
+class FakePlaywrightManager:
+    def __init__(self, page_factory):
+        self.playwright = FakePlaywright(page_factory)
+        self.stopped = False
+
+    def start(self):
+        return self.playwright
+
+    def stop(self) -> None:
+        self.stopped = True
+
+
+def test_browser_pool_launches_once_and_recycles_pages(monkeypatch):
+    manager = FakePlaywrightManager(FakePage)
+    monkeypatch.setattr(browser_pool, "sync_playwright", lambda: manager)
+    pool = browser_pool.BrowserPool()
+
+    with pool.page("coingecko") as first:
+        pass
+    with pool.page("coingecko") as second:
+        pass
+    with pool.page("kraken", init_script="script") as _:
+        pass
+
+    browsers = manager.playwright.chromium.browsers
+    assert len(browsers) == 1
+    assert first is second
+    gecko_context, kraken_context = browsers[0].contexts
+    assert gecko_context.pages_created == 1
+    assert kraken_context.init_scripts == ["script"]
+
+    pool.close()
+
+    assert browsers[0].closed
+    assert gecko_context.closed and kraken_context.closed
+    assert manager.stopped
+
+
+def test_browser_pool_threads_share_one_launched_browser(monkeypatch):
+    manager = FakePlaywrightManager(FakePage)
+    monkeypatch.setattr(browser_pool, "sync_playwright", lambda: manager)
+    pool = browser_pool.BrowserPool()
+
+    def scrape(source):
+        try:
+            with pool.page(source):
+                pass
+        finally:
+            pool.release()
+
+    threads = [threading.Thread(target=scrape, args=(source,)) for source in ("yahoo", "kraken")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pool.close()
+
+    chromium = manager.playwright.chromium
+    assert len(chromium.browsers) == 1
+    assert chromium.connections == ["http://127.0.0.1:9222"] * 2
+    assert len(chromium.browsers[0].contexts) == 2
+    assert chromium.browsers[0].closed
+
+
+def test_devtools_port_waits_for_chromium_to_report_it(tmp_path):
+    with pytest.raises(RuntimeError, match="DevTools port"):
+        browser_pool.devtools_port(tmp_path, timeout=0)
+
+    (tmp_path / "DevToolsActivePort").write_text("41231\n/devtools/browser/abc\n")
+    assert browser_pool.devtools_port(tmp_path) == 41231
+
+
+class FakeRoute:
+    def __init__(self, resource_type: str, url: str):
+        self.request = type("Request", (), {"resource_type": resource_type, "url": url})()
+        self.outcome = None
+
+    def abort(self) -> None:
+        self.outcome = "abort"
+
+    def fallback(self) -> None:
+        self.outcome = "continue"
+
+
+def test_resource_policy_blocks_assets_and_trackers():
+    policy = browser_pool.ResourcePolicy()
+
+    assert policy.blocks("image", "https://www.coingecko.com/logo.png")
+    assert policy.blocks("script", "https://www.googletagmanager.com/gtm.js")
+    assert not policy.blocks("script", "https://www.coingecko.com/app.js")
+    assert not policy.blocks("xhr", "https://api.coingecko.com/prices")
+
+
+def test_resource_policy_allowlist_blocks_other_hosts():
+    policy = browser_pool.ResourcePolicy(allowed_hosts=("kraken.com",))
+
+    assert not policy.blocks("document", "https://www.kraken.com/prices")
+    assert policy.blocks("script", "https://cdn.example.com/widget.js")
+
+
+def test_browser_pool_installs_resource_policy_per_source(monkeypatch):
+    manager = FakePlaywrightManager(FakePage)
+    monkeypatch.setattr(browser_pool, "sync_playwright", lambda: manager)
+    pool = browser_pool.BrowserPool(resource_policies={"kraken": None})
+
+    with pool.page("coingecko"):
+        pass
+    with pool.page("kraken"):
+        pass
+
+    gecko_context, kraken_context = manager.playwright.chromium.browsers[0].contexts
+    assert kraken_context.routes == []
+    [(pattern, handler)] = gecko_context.routes
+    assert pattern == "**/*"
+    font = FakeRoute("font", "https://x.test/f.woff2")
+    document = FakeRoute("document", "https://www.coingecko.com/")
+    handler(font)
+    handler(document)
+    assert (font.outcome, document.outcome) == ("abort", "continue")
+
+
+def test_browser_pool_can_disable_resource_blocking(monkeypatch):
+    manager = FakePlaywrightManager(FakePage)
+    monkeypatch.setattr(browser_pool, "sync_playwright", lambda: manager)
+    pool = browser_pool.BrowserPool(block_resources=False)
+
+    with pool.page("coingecko"):
+        pass
+
+    assert manager.playwright.chromium.browsers[0].contexts[0].routes == []
+
+
+def test_browser_pool_records_and_replays_a_har_per_source(monkeypatch, tmp_path):
+    manager = FakePlaywrightManager(FakePage)
+    monkeypatch.setattr(browser_pool, "sync_playwright", lambda: manager)
+
+    with browser_pool.BrowserPool(recording=Recording(tmp_path / "run")) as pool:
+        with pool.page("kraken"):
+            pass
+    [recorded] = manager.playwright.chromium.browsers[0].contexts
+    assert recorded.options["record_har_path"] == str(tmp_path / "run" / "kraken.har")
+    assert recorded.har_routes == []
+
+    (tmp_path / "run" / "kraken.har").write_text("{}")
+    with browser_pool.BrowserPool(recording=Recording(tmp_path / "run", replay=True)) as pool:
+        with pool.page("kraken"):
+            pass
+        with pytest.raises(RuntimeError, match="No recording of yahoo"):
+            with pool.page("yahoo"):
+                pass
+    replayed, missing = manager.playwright.chromium.browsers[1].contexts
+    assert "record_har_path" not in replayed.options
+    assert replayed.har_routes == [(tmp_path / "run" / "kraken.har", "abort")]
+    assert missing.closed
+
+
+def test_browser_pool_restores_saved_state_until_it_fails_or_expires(monkeypatch, tmp_path):
+    manager = FakePlaywrightManager(FakePage)
+    monkeypatch.setattr(browser_pool, "sync_playwright", lambda: manager)
+    states = StorageStates(tmp_path / "state")
+
+    with browser_pool.BrowserPool(states=states) as pool:
+        with pool.page("yahoo"):
+            pass
+    saved = states.load("yahoo", browser_pool.USER_AGENT)
+    assert saved == {"cookies": [{"name": "consent", "value": "yes"}], "origins": []}
+    assert states.load("yahoo", "another agent") is None
+    assert not states.path("yahoo").exists()
+
+    states.save("yahoo", browser_pool.USER_AGENT, saved)
+    assert states.path("yahoo").stat().st_mode & 0o777 == 0o600
+    with browser_pool.BrowserPool(states=states) as pool:
+        with pytest.raises(RuntimeError):
+            with pool.page("yahoo"):
+                raise RuntimeError("blocked")
+    [fresh] = manager.playwright.chromium.browsers[0].contexts
+    [restored] = manager.playwright.chromium.browsers[1].contexts
+    assert "storage_state" not in fresh.options
+    assert restored.options["storage_state"] == saved
+    assert not states.path("yahoo").exists()
 
+    states.save("yahoo", browser_pool.USER_AGENT, saved)
+    assert StorageStates(tmp_path / "state", max_age=-1).load("yahoo", browser_pool.USER_AGENT) is None
 
-class FakePlaywrightContext:
-    def __init__(self, page: FakePage):
-        self._playwright = FakePlaywright(page)
 
-    def __enter__(self):
-        return self._playwright
+def test_binance_replays_recorded_documents(monkeypatch, tmp_path):
+    documents = {
+        binance_scraper.STATIC_URL: {"data": [{"s": "BTCUSDT", "b": "BTC", "q": "USDT"}]},
+        binance_scraper.DYNAMIC_URL: {"data": [{"s": "BTCUSDT", "c": "42000.5"}]},
+    }
+    monkeypatch.setattr(binance_scraper, "download_documents", lambda client: documents)
 
-    def __exit__(self, exc_type, exc, tb):
-        return False
+    recorded = binance_scraper.fetch_prices(COINS[:1], recording=Recording(tmp_path))
+
+    def offline(client):
+        raise AssertionError("replay must not download")
+
+    monkeypatch.setattr(binance_scraper, "download_documents", offline)
+    replayed = binance_scraper.fetch_prices(COINS[:1], recording=Recording(tmp_path, replay=True))
+
+    assert [result.price for result in recorded] == [42000.5]
+    assert replayed == recorded
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections: set = set()
+    requests: list = []
+
+    def do_GET(self):
+        type(self).connections.add(self.client_address)
+        type(self).requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/missing":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = gzip.compress(json.dumps({"path": self.path}).encode())
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        if self.path == "/static":
+            self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def api_server():
+    ApiHandler.connections = set()
+    ApiHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ApiHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_client_reuses_connections_and_revalidates(api_server):
+    urls = [f"{api_server}/static", f"{api_server}/dynamic"]
+    with HttpClient() as client:
+        first = client.get_many(urls, max_age={urls[0]: 0})
+        again = client.get_many(urls, max_age={urls[0]: 0})
+
+    assert [json.loads(body) for body in first] == [{"path": "/static"}, {"path": "/dynamic"}]
+    assert again == first
+    assert sorted(ApiHandler.requests[2:]) == [("/dynamic", None), ("/static", '"v1"')]
+    assert len(ApiHandler.connections) == 2
+
+
+def test_http_client_never_keeps_responses_it_was_not_asked_to_cache(api_server, tmp_path):
+    cache = ResponseCache(tmp_path)
+    with HttpClient(cache=cache) as client:
+        client.get(f"{api_server}/static")
+        client.get(f"{api_server}/static")
+
+    # The ETag is ignored, so live endpoints always get a full response.
+    assert ApiHandler.requests == [("/static", None), ("/static", None)]
+    assert cache.get(f"{api_server}/static") is None
+
+
+def test_http_client_raises_on_error_status(api_server):
+    with HttpClient() as client, pytest.raises(RuntimeError, match="HTTP 404"):
+        client.get(f"{api_server}/missing")
+
+
+def test_http_client_keeps_responses_on_disk_between_clients(api_server, tmp_path):
+    with HttpClient(cache=ResponseCache(tmp_path)) as client:
+        dynamic = client.get(f"{api_server}/dynamic", max_age=60)
+        static = client.get(f"{api_server}/static", max_age=0)
+
+    with HttpClient(cache=ResponseCache(tmp_path)) as client:
+        assert client.get(f"{api_server}/dynamic", max_age=60) == dynamic
+        assert client.get(f"{api_server}/static", max_age=0) == static
+
+    assert ApiHandler.requests == [
+        ("/dynamic", None),
+        ("/static", None),
+        ("/static", '"v1"'),
+    ]
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(tmp_path, max_bytes=2500)
+    for key in ("a", "b"):
+        cache.put(key, Validated(b"x" * 1000))
+        time.sleep(0.05)
+    assert cache.get("a") is not None
+    time.sleep(0.05)
+    cache.put("c", Validated(b"x" * 1000))
+
+    assert cache.get("b") is None
+    assert cache.get("a").body == b"x" * 1000
+    assert cache.get("c") is not None
+
+
+def test_binance_pair_map_is_reused_across_runs(monkeypatch, tmp_path):
+    body = json.dumps(
+        {"data": [{"s": "BTCUSDT", "b": "BTC", "q": "USDT"}, {"s": "ETHBTC", "b": "ETH", "q": "BTC"}]}
+    ).encode()
+    cache = ResponseCache(tmp_path)
+    pairs = binance_scraper.cached_pair_map(body, cache)
+    assert pairs == {("BTC", "USDT"): "BTCUSDT", ("ETH", "BTC"): "ETHBTC"}
+
+    def rebuild(static_data):
+        raise AssertionError("an unchanged product list must not be parsed again")
+
+    monkeypatch.setattr(binance_scraper, "pair_map", rebuild)
+    assert binance_scraper.cached_pair_map(body, cache) is pairs
+    monkeypatch.setattr(binance_scraper, "_pair_maps", {})
+    assert binance_scraper.cached_pair_map(body, cache) == pairs
 
 
 def test_yahoo_accept_consent_reloads_requested_url():
@@ -181,13 +907,26 @@ def test_yahoo_accept_consent_reloads_requested_url():
     assert page.url == target_url
 
 
+def test_yahoo_accept_consent_follows_redirect_without_reload():
+    page = FakePage()
+    target_url = yahoo_scraper.yahoo_url(start=0)
+
+    def accept():
+        page.url = target_url
+
+    page.buttons["Accept all"] = FakeButton(on_click=accept)
+
+    yahoo_scraper.accept_consent_if_needed(page, target_url)
+
+    assert page.goto_calls == []
+    assert page.url == target_url
+
+
 def test_yahoo_matches_arbitrum_symbol_variant():
     coin = CoinConfig(slug="arbitrum", name="Arbitrum", symbol="ARB")
-    rows = FakeListLocator(
-        [FakeRow(["A\nARB11841-USD", "Arbitrum USD", "", "0.11"])]
-    )
+    rows = [["A\nARB11841-USD", "Arbitrum USD", "", "0.11"]]
 
-    result = yahoo_scraper.fetch_coin_price_from_rows(rows, coin, "test-url")
+    result = yahoo_scraper.fetch_page_prices(rows, CoinIndex([coin]), "test-url").get("arbitrum")
 
     assert result is not None
     assert result.slug == "arbitrum"
@@ -199,19 +938,414 @@ def test_yahoo_fetch_prices_scans_later_pages(monkeypatch):
     coin = CoinConfig(slug="arbitrum", name="Arbitrum", symbol="ARB")
     first_url = yahoo_scraper.yahoo_url(start=0)
     second_url = yahoo_scraper.yahoo_url(start=yahoo_scraper.PAGE_SIZE)
-    first_page_rows = [FakeRow(["X", "Not Arbitrum USD", "", "1.00"]) for _ in range(yahoo_scraper.PAGE_SIZE)]
-    second_page_rows = [FakeRow(["A\nARB11841-USD", "Arbitrum USD", "", "0.11"])]
-    page = FakePage(rows_by_url={first_url: first_page_rows, second_url: second_page_rows}, url="about:blank")
+    first_page_rows = [["X", "Not Arbitrum USD", "", "1.00"] for _ in range(yahoo_scraper.PAGE_SIZE)]
+    second_page_rows = [["A\nARB11841-USD", "Arbitrum USD", "", "0.11"]]
+    rows_by_url = {first_url: first_page_rows, second_url: second_page_rows}
+    pages: list = []
+
+    def new_page():
+        pages.append(FakePage(rows_by_url=rows_by_url, url="about:blank"))
+        return pages[-1]
 
     monkeypatch.setattr(
-        yahoo_scraper,
+        browser_pool,
         "sync_playwright",
-        lambda: FakePlaywrightContext(page),
+        lambda: FakePlaywrightManager(new_page),
     )
 
-    results = yahoo_scraper.fetch_prices([coin])
+    offsets = yahoo_scraper.PageOffsets()
+    results = yahoo_scraper.fetch_prices([coin], offsets=offsets)
 
     assert [(entry.slug, entry.price, entry.url) for entry in results] == [
         ("arbitrum", 0.11, second_url)
     ]
-    assert page.goto_calls == [first_url, second_url]
+    # The first page loads alone, then the rest of the sweep in parallel tabs.
+    assert [url for page in pages for url in page.goto_calls] == [
+        first_url,
+        second_url,
+        *(yahoo_scraper.yahoo_url(start=start) for start in yahoo_scraper.SWEEP_STARTS[2:]),
+    ]
+    assert offsets.get("arbitrum") == yahoo_scraper.PAGE_SIZE
+
+
+def test_yahoo_fetch_prices_sweeps_when_a_remembered_page_fails(monkeypatch):
+    coin = CoinConfig(slug="arbitrum", name="Arbitrum", symbol="ARB")
+    first_url = yahoo_scraper.yahoo_url(start=0)
+    rows_by_url = {first_url: [["A\nARB11841-USD", "Arbitrum USD", "", "0.11"]]}
+    monkeypatch.setattr(
+        browser_pool,
+        "sync_playwright",
+        lambda: FakePlaywrightManager(lambda: FakePage(rows_by_url=rows_by_url, url="about:blank")),
+    )
+
+    def wait_for_selector(page, selector, timeout):
+        if not page._rows:
+            raise PlaywrightTimeoutError("no table")
+
+    monkeypatch.setattr(FakePage, "wait_for_selector", wait_for_selector)
+    offsets = yahoo_scraper.PageOffsets()
+    offsets.record("arbitrum", 750)
+
+    results = yahoo_scraper.fetch_prices([coin], offsets=offsets)
+
+    assert [(entry.price, entry.url) for entry in results] == [(0.11, first_url)]
+    assert offsets.get("arbitrum") == 0
+
+
+def test_yahoo_fetch_prices_goes_to_remembered_page_first(monkeypatch, tmp_path):
+    coin = CoinConfig(slug="arbitrum", name="Arbitrum", symbol="ARB")
+    second_url = yahoo_scraper.yahoo_url(start=yahoo_scraper.PAGE_SIZE)
+    page = FakePage(
+        rows_by_url={second_url: [["A\nARB11841-USD", "Arbitrum USD", "", "0.11"]]},
+        url="about:blank",
+    )
+    monkeypatch.setattr(
+        browser_pool, "sync_playwright", lambda: FakePlaywrightManager(lambda: page)
+    )
+    path = tmp_path / "offsets.json"
+    stored = yahoo_scraper.PageOffsets(path)
+    stored.record("arbitrum", yahoo_scraper.PAGE_SIZE)
+    stored.save()
+
+    results = yahoo_scraper.fetch_prices([coin], offsets=yahoo_scraper.PageOffsets(path))
+
+    assert [entry.price for entry in results] == [0.11]
+    assert page.goto_calls == [second_url]
+
+
+def test_coingecko_matches_coins_from_table_snapshot():
+    page = FakePage(
+        rows_by_url={
+            "home": [
+                ["", "1", "Bitcoin Cash\nBCH", "Buy", "$300.10"],
+                ["", "2", "Bitcoin\nBTC", "Buy", "$42,123.45"],
+                ["", "3", "Ethereum ETH", "Buy", "$2,500.00"],
+            ]
+        },
+        url="about:blank",
+    )
+    page.goto("home")
+    rows = table.snapshot_table(page)
+    index = CoinIndex(
+        [
+            CoinConfig(slug="bitcoin", name="Bitcoin", symbol="BTC"),
+            CoinConfig(slug="ethereum", name="Ethereum", symbol="ETH"),
+        ]
+    )
+
+    results = coingecko_scraper.fetch_prices_from_home(rows, index)
+
+    assert {slug: price.price for slug, price in results.items()} == {
+        "bitcoin": 42123.45,
+        "ethereum": 2500.0,
+    }
+
+
+def test_coindesk_reports_coins_missing_from_every_page(monkeypatch):
+    coins = [coin for coin in COINS if coin.symbol in ("BTC", "ETH")]
+    page = FakePage(
+        url="about:blank",
+        rows_by_url={coindesk_scraper.HOME_URL: [["1", "Bitcoin\nBTC", "", "$42,000.00"]]},
+    )
+    monkeypatch.setattr(
+        browser_pool,
+        "sync_playwright",
+        lambda: FakePlaywrightManager(lambda: page),
+    )
+
+    with pytest.raises(MissingPrices) as caught:
+        coindesk_scraper.fetch_prices(coins, capture_api=False)
+
+    assert caught.value.misses == ["ethereum"]
+    assert [price.price for price in caught.value.results] == [42000.0]
+    assert len(page.goto_calls) == coindesk_scraper.MAX_PAGES
+
+
+def test_coin_index_matches_names_and_symbols():
+    index = CoinIndex(COINS)
+
+    assert index.by_name("  bitcoin ").slug == "bitcoin"
+    assert index.by_symbol("xmr").slug == "monero"
+    assert index.match_cell("\nSolana\nSOL").slug == "solana"
+    assert index.match_cell("Cardano ADA").slug == "cardano"
+    assert index.match_cell("Bitcoin Cash\nBCH") is None
+
+
+def test_require_all_reports_missing_coin():
+    index = CoinIndex(COINS[:2])
+    found = {
+        "bitcoin": PriceResult("bitcoin", "BTC", "Bitcoin", "", "$1", 1.0, "USD", "a")
+    }
+
+    with pytest.raises(RuntimeError, match="ethereum"):
+        table.require_all(index, found)
+
+
+def test_require_all_keeps_found_prices_on_missing_prices():
+    index = CoinIndex(COINS[:3])
+    bitcoin = PriceResult("bitcoin", "BTC", "Bitcoin", "", "$1", 1.0, "USD", "a")
+
+    with pytest.raises(table.MissingPrices) as caught:
+        table.require_all(index, {"bitcoin": bitcoin})
+
+    assert caught.value.results == [bitcoin]
+    assert caught.value.misses == [coin.slug for coin in COINS[1:3]]
+
+
+def test_fetch_with_retries_refetches_only_missing_coins():
+    coins = COINS[:3]
+    calls = []
+    sleeps = []
+
+    def price(coin):
+        return PriceResult(coin.slug, coin.symbol, coin.name, "", "$1", 1.0, "USD", "u")
+
+    def fetch(pending):
+        calls.append([coin.slug for coin in pending])
+        if len(calls) == 1:
+            raise table.MissingPrices([price(pending[0])], [coin.slug for coin in pending[1:]])
+        return [price(coin) for coin in pending]
+
+    results = retry.fetch_with_retries(
+        fetch, coins, retry.RetryPolicy(attempts=3, jitter=0.0), sleep=sleeps.append
+    )
+
+    assert calls == [[coin.slug for coin in coins], [coin.slug for coin in coins[1:]]]
+    assert [entry.slug for entry in results] == [coin.slug for coin in coins]
+    assert sleeps == [1.0]
+
+
+def test_fetch_with_retries_gives_up_after_attempts():
+    sleeps = []
+    bitcoin = PriceResult("bitcoin", "BTC", "Bitcoin", "", "$1", 1.0, "USD", "a")
+    policy = retry.RetryPolicy(attempts=3, base_delay=1.0, max_delay=1.5, jitter=0.0)
+
+    def flaky(pending):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        retry.fetch_with_retries(flaky, COINS[:1], policy, sleep=sleeps.append)
+    assert sleeps == [1.0, 1.5]
+
+    def partial(pending):
+        raise table.MissingPrices([bitcoin], ["ethereum"])
+
+    with pytest.raises(table.MissingPrices) as caught:
+        retry.fetch_with_retries(partial, COINS[:2], policy, sleep=lambda delay: None)
+    assert caught.value.results == [bitcoin]
+    assert caught.value.misses == ["ethereum"]
+
+
+def test_fetch_with_retries_tracks_missing_currencies_across_attempts():
+    def price(slug, currency):
+        return PriceResult(slug, "", "", "", "1", 1.0, currency, "k")
+
+    attempts = iter(
+        [
+            MissingPrices(
+                [price("bitcoin", "USD"), price("bitcoin", "EUR"), price("ethereum", "USD")],
+                ["ethereum"],
+                {"ethereum": ["EUR"]},
+            ),
+            MissingPrices([price("ethereum", "EUR")], ["ethereum"], {"ethereum": ["USD"]}),
+        ]
+    )
+
+    def fetch(pending):
+        raise next(attempts)
+
+    policy = retry.RetryPolicy(attempts=2, jitter=0.0)
+    results = retry.fetch_with_retries(fetch, COINS[:2], policy, sleep=lambda delay: None)
+
+    assert len(results) == 4
+
+
+def test_latency_history_adapts_timeouts_and_persists(tmp_path):
+    path = tmp_path / ".cache" / "latency.json"
+    latency = retry.LatencyHistory(path, min_samples=3, min_timeout_ms=500)
+
+    assert latency.timeout("kraken.table", 20000) == 20000
+    for elapsed in (900.0, 1000.0, 1100.0):
+        latency.record("kraken.table", elapsed)
+    assert latency.timeout("kraken.table", 20000) == 2200
+    assert latency.timeout("kraken.table", 1500) == 1500
+
+    with pytest.raises(PlaywrightTimeoutError):
+        with latency.measure("kraken.table", 20000) as timeout:
+            assert timeout == 2200
+            raise PlaywrightTimeoutError("slow")
+    assert latency.samples("kraken.table")[-1] == 2200
+
+    latency.save()
+    reloaded = retry.LatencyHistory(path, min_samples=3, min_timeout_ms=500)
+    assert reloaded.samples("kraken.table") == [900.0, 1000.0, 1100.0, 2200.0]
+    assert reloaded.timeout("kraken.table", 20000) == 4400
+
+
+class FakeResponse:
+    def __init__(self, url: str, payload, content_type: str = "application/json"):
+        self.url = url
+        self.headers = {"content-type": content_type}
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+def test_extract_json_prices_handles_common_payload_shapes():
+    index = CoinIndex(COINS)
+    payload = {
+        "data": {
+            "listing": [
+                {
+                    "name": "Bitcoin",
+                    "symbol": "BTC",
+                    "quotes": [{"name": "USD", "price": 42000.5}],
+                },
+                {"name": "Bitcoin Cash", "symbol": "BCH", "price": 300},
+            ],
+            "quotes": [
+                {
+                    "symbol": "ARB11841-USD",
+                    "shortName": "Arbitrum USD",
+                    "regularMarketPrice": {"raw": 0.11, "fmt": "0.1100"},
+                },
+                {"symbol": "ETH", "current_price": "2500.25"},
+                {"name": "Solana", "symbol": "SOL", "price": 99.0, "currency": "EUR"},
+            ],
+        }
+    }
+
+    found = extract_json_prices(payload, index, url="u")
+
+    assert {slug: price.price for slug, price in found.items()} == {
+        "bitcoin": 42000.5,
+        "arbitrum": 0.11,
+        "ethereum": 2500.25,
+    }
+    assert found["ethereum"].raw == "2500.25"
+    assert found["bitcoin"].currency == "USD"
+
+
+def test_yahoo_fetch_prices_uses_captured_json_before_table(monkeypatch):
+    coin = CoinConfig(slug="bitcoin", name="Bitcoin", symbol="BTC")
+    url = yahoo_scraper.yahoo_url(start=0)
+    page = FakePage(
+        url="about:blank",
+        responses_by_url={
+            url: [
+                FakeResponse("https://www.yahoo.com/consent.json", {"symbol": "BTC", "price": 1}),
+                FakeResponse(
+                    "https://query1.finance.yahoo.com/v7/finance/quote",
+                    {
+                        "quoteResponse": {
+                            "result": [
+                                {
+                                    "symbol": "BTC-USD",
+                                    "shortName": "Bitcoin USD",
+                                    "regularMarketPrice": 42000.0,
+                                }
+                            ]
+                        }
+                    },
+                ),
+            ]
+        },
+    )
+    monkeypatch.setattr(
+        browser_pool,
+        "sync_playwright",
+        lambda: FakePlaywrightManager(lambda: page),
+    )
+
+    results = yahoo_scraper.fetch_prices([coin])
+
+    assert [(entry.slug, entry.price, entry.url) for entry in results] == [
+        ("bitcoin", 42000.0, url)
+    ]
+    assert page.selector_waits == 0
+    assert page._listeners == []
+
+
+def test_yahoo_fetch_prices_without_api_capture_reads_table(monkeypatch):
+    coin = CoinConfig(slug="bitcoin", name="Bitcoin", symbol="BTC")
+    url = yahoo_scraper.yahoo_url(start=0)
+    page = FakePage(
+        url="about:blank",
+        rows_by_url={url: [["BTC-USD", "Bitcoin USD", "", "41,000.00"]]},
+        responses_by_url={
+            url: [
+                FakeResponse(
+                    "https://query1.finance.yahoo.com/v7/finance/quote",
+                    {
+                        "symbol": "BTC-USD",
+                        "shortName": "Bitcoin USD",
+                        "regularMarketPrice": 42000.0,
+                    },
+                )
+            ]
+        },
+    )
+    monkeypatch.setattr(
+        browser_pool,
+        "sync_playwright",
+        lambda: FakePlaywrightManager(lambda: page),
+    )
+
+    results = yahoo_scraper.fetch_prices([coin], capture_api=False)
+
+    assert [entry.price for entry in results] == [41000.0]
+
+
+def test_tracer_attributes_nested_spans_to_their_source():
+    tracer = timing.Tracer()
+    previous = timing.set_tracer(tracer)
+    try:
+        with timing.span("fetch", source="kraken"):
+            with timing.span("goto"):
+                pass
+            with timing.span("goto"):
+                pass
+        with timing.span("serialize"):
+            pass
+    finally:
+        timing.set_tracer(previous)
+
+    summary = {(row["source"], row["name"]): row["count"] for row in tracer.summary()}
+    assert summary == {
+        ("kraken", "goto"): 2,
+        ("kraken", "fetch"): 1,
+        (None, "serialize"): 1,
+    }
+    events = tracer.chrome_trace()["traceEvents"]
+    assert [event["name"] for event in events] == ["fetch", "goto", "goto", "serialize"]
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+
+
+def test_yahoo_fetch_is_timed_when_a_tracer_is_active(monkeypatch):
+    coin = CoinConfig(slug="bitcoin", name="Bitcoin", symbol="BTC")
+    url = yahoo_scraper.yahoo_url(start=0)
+    page = FakePage(
+        url="about:blank",
+        rows_by_url={url: [["BTC-USD", "Bitcoin USD", "", "41,000.00"]]},
+    )
+    monkeypatch.setattr(
+        browser_pool, "sync_playwright", lambda: FakePlaywrightManager(lambda: page)
+    )
+    tracer = timing.Tracer()
+    monkeypatch.setattr(timing, "_tracer", tracer)
+
+    results, errors = fetch_source(yahoo_scraper.YahooScraper([coin], capture_api=False))
+
+    assert [entry.price for entry in results] == [41000.0]
+    assert not errors
+    names = {row["name"] for row in tracer.summary() if row["source"] == "yahoo"}
+    assert {
+        "fetch",
+        "browser.launch",
+        "goto",
+        "consent",
+        "wait.table",
+        "table.snapshot",
+        "table.match",
+    } <= names
@@ -0,0 +1,269 @@
+from dataclasses import asdict
+from datetime import date, datetime, timezone
+from pathlib import Path
+import json
+import sys
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import history
+from history import HistoryStore, import_snapshots, record_snapshot, to_micros
+from scrapers import PriceBatch, PriceResult
+
+
+def quote(slug: str, source: str, price: float, currency: str = "USD") -> PriceResult:
+    return PriceResult(slug, slug.upper(), slug.title(), source, str(price), price, currency, "u")
+
+
+def write_snapshot(directory: Path, fetched_at: datetime, quotes) -> Path:
+    path = directory / f"{fetched_at.date().isoformat()}.json"
+    payload = {
+        "date": fetched_at.date().isoformat(),
+        "fetched_at": fetched_at.isoformat(),
+        "sources": sorted({entry.source for entry in quotes}),
+        "errors": [],
+        "quotes": [asdict(entry) for entry in quotes],
+    }
+    path.write_text(json.dumps(payload))
+    return path
+
+
+def test_append_and_load_round_trip(tmp_path):
+    store = HistoryStore(tmp_path / "history")
+    first = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    second = datetime(2024, 1, 2, 12, 30, tzinfo=timezone.utc)
+
+    store.append(
+        first, [quote("bitcoin", "kraken", 1.5, "EUR"), quote("bitcoin", "yahoo", 2.5)]
+    )
+    HistoryStore(tmp_path / "history").append(second, [quote("ethereum", "kraken", 3.5)])
+
+    columns = HistoryStore(tmp_path / "history").load()
+
+    assert len(columns) == 3
+    assert list(columns.price) == [1.5, 2.5, 3.5]
+    assert list(columns.timestamp) == [to_micros(first)] * 2 + [to_micros(second)]
+    assert [columns.slugs[code] for code in columns.slug] == ["bitcoin", "bitcoin", "ethereum"]
+    assert [columns.sources[code] for code in columns.source] == ["kraken", "yahoo", "kraken"]
+    assert [columns.currencies[code] for code in columns.currency] == ["EUR", "USD", "USD"]
+
+
+def test_append_discards_uncommitted_bytes(tmp_path):
+    store = HistoryStore(tmp_path)
+    store.append(datetime(2024, 1, 1, tzinfo=timezone.utc), [quote("bitcoin", "kraken", 1.0)])
+    with open(store.column_path("price"), "ab") as handle:
+        handle.write(b"\x00" * 5)
+
+    store.append(datetime(2024, 1, 2, tzinfo=timezone.utc), [quote("bitcoin", "kraken", 2.0)])
+
+    assert list(HistoryStore(tmp_path).load().price) == [1.0, 2.0]
+    assert store.column_path("price").stat().st_size == 16
+
+
+def test_append_reads_price_batch_columns(tmp_path):
+    fetched_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    quotes = [quote("bitcoin", "yahoo", 1.0), quote("ethereum", "kraken", 2.0, "EUR")]
+    from_batch = HistoryStore(tmp_path / "batch")
+    from_list = HistoryStore(tmp_path / "list")
+
+    from_batch.append(fetched_at, PriceBatch.from_results(quotes))
+    from_list.append(fetched_at, quotes)
+
+    assert from_batch.meta() == from_list.meta()
+    assert list(from_batch.load().price) == list(from_list.load().price)
+
+
+def test_load_without_numpy_returns_arrays(tmp_path, monkeypatch):
+    monkeypatch.setattr(history, "numpy", None)
+    store = HistoryStore(tmp_path)
+    store.append(datetime(2024, 1, 1, tzinfo=timezone.utc), [quote("bitcoin", "kraken", 1.0)])
+
+    columns = store.load()
+
+    assert columns.price.typecode == "d"
+    assert columns.timestamp.typecode == "q"
+
+
+def test_import_snapshots_reads_daily_files(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_snapshot(
+        data_dir,
+        datetime(2024, 1, 2, tzinfo=timezone.utc),
+        [quote("ethereum", "yahoo", 2.0)],
+    )
+    write_snapshot(
+        data_dir,
+        datetime(2024, 1, 1, tzinfo=timezone.utc),
+        [quote("bitcoin", "yahoo", 1.0)],
+    )
+    (data_dir / "latest.json").write_text("{}")
+
+    store = HistoryStore(data_dir / "history")
+    added = import_snapshots(store, history.daily_snapshot_paths(data_dir))
+
+    assert added == 2
+    assert list(store.load().price) == [1.0, 2.0]
+
+
+def write_three_days(data_dir: Path) -> None:
+    for day, price in ((1, 1.0), (2, 2.0), (3, 3.0)):
+        write_snapshot(
+            data_dir,
+            datetime(2024, 1, day, tzinfo=timezone.utc),
+            [quote("bitcoin", "yahoo", price), quote("ethereum", "kraken", price * 10)],
+        )
+    (data_dir / "latest.json").write_text("{}")
+    (data_dir / "notes.json").write_text("{}")
+
+
+def test_iter_snapshot_quotes_yields_price_results_lazily(tmp_path):
+    write_three_days(tmp_path)
+
+    quotes = history.iter_snapshot_quotes(tmp_path)
+
+    assert not isinstance(quotes, list)
+    first = next(quotes)
+    assert first == quote("bitcoin", "yahoo", 1.0)
+    assert [entry.price for entry in quotes] == [10.0, 2.0, 20.0, 3.0, 30.0]
+
+
+def test_iter_snapshot_quotes_skips_files_outside_range_unopened(tmp_path, monkeypatch):
+    write_three_days(tmp_path)
+    (tmp_path / "2024-01-01.json").write_text("not json")
+    opened = []
+    real_open = open
+
+    def tracking_open(path, *args, **kwargs):
+        opened.append(Path(path).name)
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", tracking_open)
+    quotes = list(
+        history.iter_snapshot_quotes(tmp_path, start=date(2024, 1, 2), end=date(2024, 1, 2))
+    )
+
+    assert opened == ["2024-01-02.json"]
+    assert [entry.price for entry in quotes] == [2.0, 20.0]
+
+
+def test_iter_snapshot_quotes_projects_fields(tmp_path):
+    write_three_days(tmp_path)
+
+    rows = list(
+        history.iter_snapshot_quotes(
+            tmp_path, start=date(2024, 1, 3), fields=["date", "slug", "price"]
+        )
+    )
+
+    assert rows == [("2024-01-03", "bitcoin", 3.0), ("2024-01-03", "ethereum", 30.0)]
+    with pytest.raises(ValueError):
+        next(history.iter_snapshot_quotes(tmp_path, fields=["volume"]))
+
+
+def test_record_snapshot_seeds_empty_store_then_appends(tmp_path):
+    data_dir = tmp_path
+    day_one = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    day_two = datetime(2024, 1, 2, tzinfo=timezone.utc)
+    write_snapshot(data_dir, day_one, [quote("bitcoin", "yahoo", 1.0)])
+    store = HistoryStore(data_dir / "history")
+
+    record_snapshot(store, data_dir, day_one, [quote("bitcoin", "yahoo", 1.0)])
+    record_snapshot(store, data_dir, day_two, [quote("bitcoin", "yahoo", 2.0)])
+
+    assert list(store.load().price) == [1.0, 2.0]
+
+
+def build_store(tmp_path) -> HistoryStore:
+    store = HistoryStore(tmp_path / "history")
+    for day in range(1, 4):
+        fetched_at = datetime(2024, 1, day, tzinfo=timezone.utc)
+        store.append(
+            fetched_at,
+            [
+                quote("bitcoin", "kraken", 100.0 + day, "EUR"),
+                quote("bitcoin", "kraken", 110.0 + day, "USD"),
+                quote("bitcoin", "yahoo", 120.0 + day),
+                quote("ethereum", "kraken", 10.0 + day, "EUR"),
+            ],
+        )
+    return store
+
+
+def test_query_filters_by_slug_source_currency_and_dates(tmp_path):
+    store = build_store(tmp_path)
+
+    quotes = history.query(
+        HistoryStore(store.directory),
+        slug="bitcoin",
+        source="kraken",
+        currency="EUR",
+        start=date(2024, 1, 2),
+        end=date(2024, 1, 3),
+    )
+
+    assert [(entry.fetched_at.day, entry.price) for entry in quotes] == [(2, 102.0), (3, 103.0)]
+    assert {(entry.slug, entry.source, entry.currency) for entry in quotes} == {
+        ("bitcoin", "kraken", "EUR")
+    }
+
+
+def test_query_without_filters_and_unknown_values(tmp_path):
+    store = build_store(tmp_path)
+
+    assert len(history.query(store)) == 12
+    assert len(history.query(store, start=date(2024, 1, 3))) == 4
+    assert history.query(store, slug="dogecoin") == []
+    assert history.query(store, start=date(2025, 1, 1)) == []
+
+
+def test_query_reads_only_matching_rows(tmp_path, monkeypatch):
+    store = build_store(tmp_path)
+    requested = []
+    original = HistoryStore.read_rows
+
+    def tracking_read_rows(self, column, row_ids):
+        requested.append(list(row_ids))
+        return original(self, column, row_ids)
+
+    monkeypatch.setattr(HistoryStore, "read_rows", tracking_read_rows)
+
+    history.query(store, slug="ethereum", start=date(2024, 1, 2), end=date(2024, 1, 2))
+
+    assert requested and all(row_ids == [7] for row_ids in requested)
+
+
+def test_index_is_rebuilt_for_stores_without_one(tmp_path):
+    store = build_store(tmp_path)
+    meta = json.loads(store.meta_path.read_text())
+    del meta["days"]
+    del meta["postings"]
+    store.meta_path.write_text(json.dumps(meta))
+    for path in (store.directory / "postings").iterdir():
+        path.unlink()
+
+    quotes = history.query(HistoryStore(store.directory), source="yahoo")
+
+    assert [entry.price for entry in quotes] == [121.0, 122.0, 123.0]
+
+
+def test_query_cli_prints_csv(tmp_path, capsys):
+    store = build_store(tmp_path)
+
+    history.main(
+        [
+            "--history-dir",
+            str(store.directory),
+            "query",
+            "--slug",
+            "ethereum",
+            "--end",
+            "2024-01-01",
+        ]
+    )
+
+    lines = capsys.readouterr().out.strip().splitlines()
+    assert lines[0] == "fetched_at,slug,source,currency,price"
+    assert lines[1:] == ["2024-01-01T00:00:00+00:00,ethereum,kraken,EUR,11.0"]
@@ -0,0 +1,132 @@
+from dataclasses import asdict
+from pathlib import Path
+import json
+import sys
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import history
+import snapshots
+from scrapers import PriceResult
+
+
+def payload(quotes):
+    return {
+        "date": "2024-01-02",
+        "fetched_at": "2024-01-02T00:00:00+00:00",
+        "sources": ["kraken", "yahoo"],
+        "errors": [{"source": "yahoo", "error": "Timeout 30000ms exceeded"}],
+        "quotes": quotes,
+    }
+
+
+QUOTES = [
+    asdict(PriceResult("bitcoin", "BTC", "Bitcoin", "kraken", "€39,100.00", 39100.0, "EUR", "k")),
+    asdict(PriceResult("monero", "XMR", "Monero", "yahoo", "1e-05", 1e-05, "USD", "y\n\"")),
+    {"slug": "odd", "price": float("nan"), "rank": 3, "listed": True, "note": None},
+]
+
+
+@pytest.mark.parametrize("quotes", [QUOTES, [], [{}], [{"slug": "x", "extra": [1, 2]}]])
+def test_encode_snapshot_matches_json_dumps(quotes):
+    expected = json.dumps(payload(quotes), indent=2, sort_keys=True) + "\n"
+
+    assert snapshots.encode_snapshot(payload(quotes)) == expected.encode()
+
+
+def test_compact_snapshot_round_trips():
+    content = snapshots.encode_snapshot(payload(QUOTES[:2]), compact=True)
+
+    assert b"\n" not in content.rstrip(b"\n")
+    assert json.loads(content) == payload(QUOTES[:2])
+
+
+def test_write_snapshot_files_links_every_destination(tmp_path):
+    dated = tmp_path / "2024-01-02.json"
+    latest = tmp_path / "latest.json"
+    latest.write_text("stale")
+
+    snapshots.write_snapshot_files(b"{}\n", [dated, latest])
+
+    assert dated.read_bytes() == latest.read_bytes() == b"{}\n"
+    assert dated.stat().st_ino == latest.stat().st_ino
+    assert sorted(path.name for path in tmp_path.iterdir()) == [dated.name, latest.name]
+
+
+def test_gzip_snapshots_are_found_and_read(tmp_path):
+    suffix = snapshots.snapshot_suffix("gzip")
+    content = snapshots.compress(snapshots.encode_snapshot(payload(QUOTES[:2])), "gzip")
+    snapshots.write_snapshot_files(
+        content, [tmp_path / f"2024-01-02{suffix}", tmp_path / f"latest{suffix}"]
+    )
+
+    paths = history.daily_snapshot_paths(tmp_path)
+
+    assert [path.name for path in paths] == ["2024-01-02.json.gz"]
+    assert snapshots.read_snapshot(paths[0]) == payload(QUOTES[:2])
+    assert [quote.slug for quote in history.iter_snapshot_quotes(tmp_path)] == [
+        "bitcoin",
+        "monero",
+    ]
+
+
+def test_zstd_is_only_offered_when_installed(monkeypatch):
+    monkeypatch.setattr(snapshots, "zstandard", None)
+
+    assert snapshots.available_compressions() == ["gzip"]
+    with pytest.raises(RuntimeError):
+        snapshots.compress(b"{}", "zstd")
+
+
+def run_payload(fetched_at: str, price: float):
+    quote = PriceResult("bitcoin", "BTC", "Bitcoin", "kraken", str(price), price, "USD", "k")
+    return {
+        "date": fetched_at[:10],
+        "fetched_at": fetched_at,
+        "sources": ["kraken"],
+        "errors": [],
+        "quotes": [asdict(quote)],
+    }
+
+
+def test_intraday_log_appends_runs_and_drops_torn_line(tmp_path):
+    log_path = tmp_path / "intraday" / "2024-01-02.jsonl"
+    snapshots.append_intraday(log_path, run_payload("2024-01-02T00:00:00+00:00", 1.0))
+    with open(log_path, "ab") as handle:
+        handle.write(b'{"date": "2024-01-02", "quo')
+
+    assert [run["quotes"][0]["price"] for run in snapshots.read_intraday(log_path)] == [1.0]
+
+    snapshots.append_intraday(log_path, run_payload("2024-01-02T00:05:00+00:00", 2.0))
+
+    assert [run["fetched_at"] for run in snapshots.read_intraday(log_path)] == [
+        "2024-01-02T00:00:00+00:00",
+        "2024-01-02T00:05:00+00:00",
+    ]
+
+
+def test_compact_intraday_keeps_every_run(tmp_path):
+    snapshot_path = tmp_path / "2024-01-02.json"
+    snapshot_path.write_bytes(
+        snapshots.encode_snapshot(run_payload("2024-01-02T00:00:00+00:00", 1.0))
+    )
+    log_path = tmp_path / "intraday" / "2024-01-02.jsonl"
+    for minute, price in ((5, 2.0), (10, 3.0)):
+        snapshots.append_intraday(
+            log_path, run_payload(f"2024-01-02T00:{minute:02d}:00+00:00", price)
+        )
+
+    snapshots.compact_intraday(log_path, snapshot_path)
+
+    assert not log_path.exists()
+    compacted = snapshots.read_snapshot(snapshot_path)
+    assert compacted["fetched_at"] == "2024-01-02T00:10:00+00:00"
+    assert compacted["quotes"][0]["price"] == 3.0
+    assert [run["quotes"][0]["price"] for run in compacted["batches"]] == [1.0, 2.0, 3.0]
+    assert [quote.price for quote in history.iter_snapshot_quotes(tmp_path)] == [1.0, 2.0, 3.0]
+
+    store = history.HistoryStore(tmp_path / "history")
+    assert history.import_snapshots(store, [snapshot_path]) == 3
+    assert len({int(value) for value in store.load().timestamp}) == 3